@@ -0,0 +1,36 @@
+"""Cold import time of the package entry points, each measured in a fresh interpreter.
+
+    python -m benchmarks.bench_import
+"""
+import subprocess
+import sys
+
+MODULES = ("fhir_tx_client", "fhir_tx_client.cli", "fhir_tx_client.client", "fhir_tx_client.ValueSet.model")
+# Imported only when a model is used, never by the modules above except the model itself
+HEAVY_MODULES = ("fhir.resources", "pydantic")
+
+_PROBE = """
+import sys, time
+started_at = time.perf_counter()
+import {module}
+print(time.perf_counter() - started_at)
+print(" ".join(sorted(sys.modules)))
+"""
+
+
+def probe(module: str) -> tuple[float, set[str]]:
+    """Import time in seconds of `module` in a fresh interpreter, and the modules it loaded"""
+    output = subprocess.run(
+        [sys.executable, "-c", _PROBE.format(module=module)], capture_output=True, text=True, check=True
+    ).stdout.splitlines()
+    return float(output[0]), set(output[1].split())
+
+
+def run(repeat=5) -> dict:
+    """Return the best import time, in milliseconds, of every module"""
+    return {module: min(probe(module)[0] for _ in range(repeat)) * 1e3 for module in MODULES}
+
+
+if __name__ == "__main__":
+    for module, milliseconds in run().items():
+        print(f"{module:<32} {milliseconds:8.1f} ms")
@@ -0,0 +1,58 @@
+"""Microbenchmark of the Parameters codec against the pydantic based conversion.
+
+    python -m benchmarks.bench_params
+"""
+import timeit
+from fhir_tx_client.Parameters import Parameters
+from fhir_tx_client.data_types import Coding
+from fhir_tx_client.util import (
+    dict_to_params,
+    params_to_dict,
+    dict_to_params_json,
+    params_json_to_dict,
+)
+
+REQUEST = {
+    "coding": Coding(system="http://snomed.info/sct", code="102263004", display="Eggs (edible)"),
+    "displayLanguage": "en",
+    "abstract": False,
+}
+RESPONSE = {
+    "resourceType": "Parameters",
+    "parameter": [
+        {"name": "result", "valueBoolean": True},
+        {"name": "display", "valueString": "Eggs (edible)"},
+        {"name": "code", "valueCode": "102263004"},
+        {"name": "system", "valueUri": "http://snomed.info/sct"},
+    ],
+}
+
+CASES = {
+    "encode": {
+        "dict_to_params": lambda: dict_to_params(REQUEST).dict(),
+        "dict_to_params_json": lambda: dict_to_params_json(REQUEST),
+    },
+    "decode": {
+        "params_to_dict": lambda: params_to_dict(Parameters.parse_obj(RESPONSE)),
+        "params_json_to_dict": lambda: params_json_to_dict(RESPONSE),
+    },
+}
+
+
+def run(number=2000, repeat=5) -> dict:
+    """Return the best time per call, in microseconds, of every case"""
+    return {
+        name: min(timeit.repeat(fn, number=number, repeat=repeat)) / number * 1e6
+        for cases in CASES.values()
+        for name, fn in cases.items()
+    }
+
+
+if __name__ == "__main__":
+    results = run()
+    for group, cases in CASES.items():
+        baseline, fast = (results[name] for name in cases)
+        print(f"{group}:")
+        for name in cases:
+            print(f"  {name:<22} {results[name]:8.2f} us/call")
+        print(f"  speedup {baseline / fast:.1f}x")
@@ -0,0 +1,144 @@
+import hashlib
+import json
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+
+def _parameter_values(body: dict) -> dict:
+    values = {}
+    for parameter in body.get("parameter", []):
+        values[parameter["name"]] = next((v for k, v in parameter.items() if k.startswith("value")), None)
+    return values
+
+
+def _walk(contains):
+    stack = [iter(contains)]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        yield entry
+        if entry.get("contains"):
+            stack.append(iter(entry["contains"]))
+
+
+class StubTerminologyServer:
+    """In-process FHIR terminology server answering from expanded ValueSets held in memory.
+
+    Supports reading a ValueSet, $expand (with `offset`/`count`), $validate-code and
+    batch Bundles of these operations.
+    Responses carry a strong `ETag`; requests with a matching `If-None-Match` get a
+    `304 Not Modified`. `latency` (seconds) is added to every response."""
+
+    def __init__(self, valuesets: dict[str, dict] | None = None, latency: float = 0.0):
+        self.valuesets = valuesets or {}
+        self.latency = latency
+        self.requests: list[tuple[str, str, dict]] = []
+        self.bytes_sent = 0
+        self._server = ThreadingHTTPServer(("127.0.0.1", 0), self._handler_class())
+        self._thread = threading.Thread(target=self._server.serve_forever, args=(0.05,), daemon=True)
+
+    @property
+    def url(self) -> str:
+        host, port = self._server.server_address
+        return "http://{0}:{1}/r4".format(host, port)
+
+    def start(self) -> "StubTerminologyServer":
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc_info):
+        self.stop()
+
+    def count(self, method: str, path: str) -> int:
+        return sum(1 for m, p, _ in self.requests if (m, p) == (method, path))
+
+    def respond(self, method: str, path: str, body: dict | None) -> tuple[int, dict | None]:
+        """Return the status and response body of a request"""
+        parts = path.strip("/").split("/")[1:]  # drop the "r4" base path
+        if not parts and method == "POST" and (body or {}).get("resourceType") == "Bundle":
+            return 200, self._batch(body)
+        values = _parameter_values(body or {})
+        if len(parts) == 2 and parts[0] == "ValueSet" and parts[1].startswith("$"):
+            # type-level operation on the ValueSet with the canonical `url`
+            ids = [id for id, valueset in self.valuesets.items() if valueset.get("url") == values.get("url")]
+            parts = ["ValueSet", ids[0] if ids else "", parts[1]]
+        if len(parts) < 2 or parts[0] != "ValueSet" or parts[1] not in self.valuesets:
+            return 404, {"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "not-found"}]}
+        valueset = self.valuesets[parts[1]]
+        if len(parts) == 2 and method == "GET":
+            return 200, {key: value for key, value in valueset.items() if key != "expansion"}
+        operation = parts[2] if len(parts) == 3 else None
+        if method == "POST" and operation == "$expand":
+            contains = valueset["expansion"]["contains"]
+            expansion = {key: value for key, value in valueset["expansion"].items() if key != "contains"}
+            if "offset" in values or "count" in values:
+                offset = values.get("offset", 0)
+                count = values.get("count", len(contains))
+                contains = contains[offset : offset + count]
+                expansion["offset"] = offset
+            return 200, {**valueset, "expansion": {**expansion, "contains": contains}}
+        if method == "POST" and operation == "$validate-code":
+            coding = values.get("coding") or {"system": values.get("system"), "code": values.get("code")}
+            result = any(
+                entry.get("code") == coding.get("code") and entry.get("system") == coding.get("system")
+                for entry in _walk(valueset["expansion"]["contains"])
+            )
+            return 200, {"resourceType": "Parameters", "parameter": [{"name": "result", "valueBoolean": result}]}
+        return 400, {"resourceType": "OperationOutcome", "issue": [{"severity": "error", "code": "not-supported"}]}
+
+    def _batch(self, bundle: dict) -> dict:
+        entries = []
+        for entry in bundle.get("entry", []):
+            request = entry["request"]
+            status, resource = self.respond(request["method"], "/r4/" + request["url"], entry.get("resource"))
+            entries.append({"response": {"status": str(status)}, "resource": resource})
+        return {"resourceType": "Bundle", "type": "batch-response", "entry": entries}
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            def _handle(self, method):
+                length = int(self.headers.get("Content-Length") or 0)
+                body = json.loads(self.rfile.read(length)) if length else None
+                path = self.path.split("?")[0]
+                stub.requests.append((method, path, dict(self.headers)))
+                if stub.latency:
+                    time.sleep(stub.latency)
+                status, response = stub.respond(method, path, body)
+                payload = json.dumps(response).encode()
+                etag = '"{0}"'.format(hashlib.sha1(payload).hexdigest())
+                if status == 200 and self.headers.get("If-None-Match") == etag:
+                    self.send_response(304)
+                    self.send_header("ETag", etag)
+                    self.end_headers()
+                    return
+                self.send_response(status)
+                self.send_header("Content-Type", "application/fhir+json")
+                self.send_header("Content-Length", str(len(payload)))
+                if status == 200:
+                    self.send_header("ETag", etag)
+                self.end_headers()
+                self.wfile.write(payload)
+                stub.bytes_sent += len(payload)
+
+            def do_GET(self):
+                self._handle("GET")
+
+            def do_POST(self):
+                self._handle("POST")
+
+            def log_message(self, format, *args):
+                pass
+
+        return Handler
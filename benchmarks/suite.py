@@ -0,0 +1,187 @@
+"""Offline benchmark suite against an in-process stub terminology server.
+
+    python -m benchmarks.suite --output results.json
+    python -m benchmarks.suite --sizes 10,1000,100000,1000000 --depths 1,20 --latency 0.02
+    python -m benchmarks.suite --output new.json --compare results.json
+
+Peak memory includes the stub server, which runs in the same process.
+Every result is keyed by case and value set shape, e.g. `expand_raw[size=1000,depth=1]`,
+and holds plain numbers so that runs of different releases can be compared.
+"""
+import argparse
+import json
+import platform
+import subprocess
+import sys
+import time
+import tracemalloc
+from datetime import datetime, timezone
+from importlib import metadata
+from typing import Callable
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.data_types import Coding
+from benchmarks import bench_import, bench_params
+from benchmarks.synthetic import SYSTEM, synthetic_valueset
+from benchmarks.stub_server import StubTerminologyServer
+
+DEFAULT_SIZES = (10, 1_000, 100_000)
+DEFAULT_DEPTHS = (1, 20)
+# Parsing into pydantic models, and tracing its allocations, takes minutes beyond this size
+DEFAULT_MAX_PARSE = 20_000
+CONTAINS_LOOKUPS = 100_000
+CONTAINS_REMOTE_LOOKUPS = 50
+VALIDATE_CODE_CALLS = 50
+
+
+def best_of(fn: Callable, repeat: int) -> float:
+    """Best wall time of `repeat` calls of `fn`, in seconds"""
+    best = float("inf")
+    for _ in range(repeat):
+        started_at = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - started_at)
+    return best
+
+
+def peak_memory(fn: Callable) -> int:
+    """Peak of the memory allocated while calling `fn`, in bytes"""
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+
+def bench_valueset(client, valueset: dict, max_parse: int, repeat: int) -> dict:
+    size = valueset["expansion"]["total"]
+    vs = client.ValueSet(id=valueset["id"])
+    results = {}
+
+    seconds = best_of(lambda: vs.expand(raw=True), repeat)
+    results["expand_raw"] = {
+        "seconds": seconds,
+        "concepts_per_second": size / seconds,
+        "peak_bytes": peak_memory(lambda: vs.expand(raw=True)),
+    }
+    seconds = best_of(lambda: sum(1 for _ in vs.expand_stream()), repeat)
+    results["expand_stream"] = {
+        "seconds": seconds,
+        "concepts_per_second": size / seconds,
+        "peak_bytes": peak_memory(lambda: sum(1 for _ in vs.expand_stream())),
+    }
+    if size <= max_parse:
+        seconds = best_of(vs.expand, repeat)
+        results["expand_parse"] = {
+            "seconds": seconds,
+            "concepts_per_second": size / seconds,
+            "peak_bytes": peak_memory(vs.expand),
+        }
+
+    # `for coding in vs`: $expand page by page
+    seconds = best_of(lambda: sum(1 for _ in vs), repeat)
+    results["iterate"] = {"seconds": seconds, "concepts_per_second": size / seconds}
+
+    # `coding in vs`: a $validate-code round trip each, then answered by the materialized index
+    codings = [Coding(system=SYSTEM, code=str(code % (size * 2))) for code in range(min(CONTAINS_LOOKUPS, size * 2))]
+    remote = codings[:CONTAINS_REMOTE_LOOKUPS]
+    lookups = best_of(lambda: sum(1 for coding in remote if coding in vs), 1)
+    results["contains_remote"] = {"lookups_per_second": len(remote) / lookups}
+    seconds = best_of(vs.materialize, 1)
+    lookups = best_of(lambda: sum(1 for coding in codings if coding in vs), repeat)
+    results["contains"] = {
+        "materialize_seconds": seconds,
+        "lookups_per_second": len(codings) / lookups,
+        "index_peak_bytes": peak_memory(vs.materialize),
+    }
+    return results
+
+
+def bench_validate_code(client, valueset: dict) -> dict:
+    """Round trips of uncached $validate-code calls, including the stub's latency"""
+    vs = client.ValueSet(id=valueset["id"])
+    codings = [Coding(system=SYSTEM, code=str(code)) for code in range(VALIDATE_CODE_CALLS)]
+    seconds = best_of(lambda: [vs.validate_code(coding=coding) for coding in codings], 1)
+    return {"seconds": seconds, "calls_per_second": len(codings) / seconds}
+
+
+def environment() -> dict:
+    try:
+        commit = subprocess.run(
+            ["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True, check=True
+        ).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        commit = None
+    try:
+        version = metadata.version("fhir-tx-client")
+    except metadata.PackageNotFoundError:
+        version = None
+    return {
+        "version": version,
+        "commit": commit,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "date": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+    }
+
+
+def run(sizes=DEFAULT_SIZES, depths=DEFAULT_DEPTHS, latency=0.0, max_parse=DEFAULT_MAX_PARSE, repeat=3) -> dict:
+    shapes = [(size, depth, synthetic_valueset(size, depth)) for size in sizes for depth in depths if depth <= size]
+    results = {}
+    with StubTerminologyServer({vs["id"]: vs for _, _, vs in shapes}, latency=latency) as stub:
+        client = SyncFHIRTerminologyClient(stub.url)
+        for size, depth, valueset in shapes:
+            for case, measures in bench_valueset(client, valueset, max_parse, repeat).items():
+                results["{0}[size={1},depth={2}]".format(case, size, depth)] = measures
+        results["validate_code[latency={0}]".format(latency)] = bench_validate_code(client, shapes[0][2])
+    for name, microseconds in bench_params.run(repeat=repeat).items():
+        results["codec[{0}]".format(name)] = {"microseconds_per_call": microseconds}
+    for module, milliseconds in bench_import.run(repeat=repeat).items():
+        results["import[{0}]".format(module)] = {"milliseconds": milliseconds}
+    return {"environment": environment(), "results": results}
+
+
+def compare(baseline: dict, current: dict) -> list[str]:
+    """Lines comparing the measures shared by two runs, as current / baseline ratios"""
+    lines = []
+    for name, measures in current["results"].items():
+        previous = baseline["results"].get(name)
+        if previous is None:
+            continue
+        for measure, value in measures.items():
+            if previous.get(measure):
+                lines.append("{0:<45} {1:<24} {2:>8.2f}x".format(name, measure, value / previous[measure]))
+    return lines
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sizes", default=",".join(map(str, DEFAULT_SIZES)), help="Comma separated concept counts")
+    parser.add_argument("--depths", default=",".join(map(str, DEFAULT_DEPTHS)), help="Comma separated nesting depths")
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every stub response")
+    parser.add_argument("--max-parse", type=int, default=DEFAULT_MAX_PARSE, help="Largest size parsed into pydantic models")
+    parser.add_argument("--repeat", type=int, default=3)
+    parser.add_argument("--output", help="Write the results as JSON to this file")
+    parser.add_argument("--compare", help="JSON results of an earlier run to compare with")
+    args = parser.parse_args(argv)
+
+    report = run(
+        sizes=[int(size) for size in args.sizes.split(",")],
+        depths=[int(depth) for depth in args.depths.split(",")],
+        latency=args.latency,
+        max_parse=args.max_parse,
+        repeat=args.repeat,
+    )
+    if args.output:
+        with open(args.output, "w") as file:
+            json.dump(report, file, indent=2)
+    else:
+        json.dump(report, sys.stdout, indent=2)
+        print()
+    if args.compare:
+        with open(args.compare) as file:
+            print("\n".join(compare(json.load(file), report)), file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,32 @@
+"""Synthetic expanded ValueSets for benchmarks"""
+
+SYSTEM = "http://example.org/fhir/CodeSystem/synthetic"
+
+
+def synthetic_valueset(size: int, depth: int = 1, id: str | None = None) -> dict:
+    """Build an expanded ValueSet with `size` concepts. With `depth` > 1 the concepts are
+    nested in chains of `depth` levels through `contains`, e.g. depth 3: A > A.1 > A.1.1"""
+    if size < 1 or depth < 1:
+        raise ValueError("size and depth must be at least 1")
+    id = id or "synthetic-{0}-{1}".format(size, depth)
+    contains = []
+    for start in range(0, size, depth):
+        siblings = contains
+        for code in range(start, min(start + depth, size)):
+            entry = {"system": SYSTEM, "code": str(code), "display": "Concept {0}".format(code)}
+            siblings.append(entry)
+            siblings = entry["contains"] = []
+        # the innermost entry has no children
+        del entry["contains"]
+    return {
+        "resourceType": "ValueSet",
+        "id": id,
+        "url": "http://example.org/fhir/ValueSet/" + id,
+        "status": "active",
+        "expansion": {
+            "identifier": "urn:uuid:" + id,
+            "timestamp": "2023-01-01T00:00:00Z",
+            "total": size,
+            "contains": contains,
+        },
+    }
@@ -0,0 +1,8 @@
+from typing import TYPE_CHECKING
+from fhir_tx_client._lazy import lazy_getattr
+
+if TYPE_CHECKING:
+    from .client import SyncCodeSystem, AsyncCodeSystem
+
+__all__ = ["SyncCodeSystem", "AsyncCodeSystem"]
+__getattr__ = lazy_getattr(__name__, dict.fromkeys(__all__, ".client"))
@@ -0,0 +1,178 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable
+from fhirpy.lib import SyncFHIRResource, AsyncFHIRResource
+from fhirpy.base.utils import AttrDict
+from fhir_tx_client.batch import BatchPlan
+from fhir_tx_client.cache import MISSING
+from fhir_tx_client.singleflight import coalesce, coalesce_async
+from fhir_tx_client.instrumentation import measure
+from fhir_tx_client.scheduler import BULK, priority
+from fhir_tx_client.util import dict_to_params_json, params_json_to_dict, resource_identity, normalize_params
+
+if TYPE_CHECKING:
+    from fhir_tx_client.data_types import Coding
+    from fhir_tx_client.ValueSet.store import ExpansionStore
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def _lookup_kwargs(item: Coding | dict) -> dict:
+    from fhir_tx_client.data_types import Coding
+
+    if isinstance(item, Coding):
+        return {"coding": item}
+    if isinstance(item, dict):
+        return item
+    raise TypeError("Expected a Coding or a dictionary of $lookup parameters, got %s" % type(item))
+
+
+def _subsumes_locally(hierarchy: ExpansionStore | None, code_a: str, code_b: str, system: str | None) -> str | None:
+    """Outcome of $subsumes decided from hierarchy data, or None when it cannot be decided locally.
+    A missing link in an expansion does not prove `not-subsumed`, so that is left to the server,
+    like codes missing from the hierarchy: the server decides whether an unknown code exists."""
+    if hierarchy is None:
+        return None
+    if code_a == code_b:
+        return "equivalent" if hierarchy.is_a(code_a, code_a, system) else None
+    try:
+        if hierarchy.is_a(code_b, code_a, system):
+            return "subsumes"
+        if hierarchy.is_a(code_a, code_b, system):
+            return "subsumed-by"
+    except KeyError:
+        pass
+    return None
+
+
+class SyncCodeSystem(SyncFHIRResource):
+    """CodeSystem with the terminology operations $lookup, $subsumes and $validate-code.
+
+    $lookup and $subsumes results are memoized in the client's `lookup_cache`.
+    Assign an `ExpansionStore` to `hierarchy` to decide $subsumes locally when it can."""
+
+    batch_size = DEFAULT_BATCH_SIZE
+    hierarchy: ExpansionStore | None = None
+
+    def _execute_cached(self, operation: str, params: dict, cache, negative=False) -> AttrDict:
+        instrumentation = self.client.instrumentation
+        with measure(instrumentation, operation, operation=operation, codesystem=self.get("url") or self.get("id")):
+            key = ((resource_identity(self), operation), normalize_params(params))
+            if cache is not None:
+                cached = cache.get(key)
+                if instrumentation is not None:
+                    instrumentation.cache_lookup("validate_code" if negative else "lookup", cached is not MISSING)
+                if cached is not MISSING:
+                    return AttrDict(cached)
+
+            def request():
+                result = self.execute(operation, method="POST", data=params)
+                with measure(instrumentation, "parse"):
+                    result = params_json_to_dict(result)
+                if cache is not None:
+                    cache.put(key, result, negative=negative and not result.get("result"))
+                return result
+
+            return AttrDict(coalesce(self.client.single_flight, key, request))
+
+    def lookup(self, **kwargs) -> AttrDict:
+        """Look up the details of a code.
+        https://www.hl7.org/fhir/codesystem-operation-lookup.html"""
+        return self._execute_cached("$lookup", dict_to_params_json(kwargs), self.client.lookup_cache)
+
+    def lookup_many(self, items: Iterable[Coding | dict], batch_size: int | None = None, **kwargs) -> list:
+        """Look up many codes with one batch Bundle of $lookup requests per `batch_size` items.
+        Items are a Coding or a dictionary of $lookup parameters; `kwargs` are added to each.
+        Returns a result per item, in input order, or the `OperationOutcome` of a failed lookup."""
+        plan = BatchPlan(
+            "{0}/$lookup".format(self._get_path()),
+            (dict_to_params_json({**_lookup_kwargs(item), **kwargs}) for item in items),
+            (resource_identity(self), "$lookup"),
+            self.client.lookup_cache,
+        )
+        with priority(BULK):
+            for keys, bundle in plan.bundles(batch_size or self.batch_size):
+                plan.record(keys, self.client.execute("", method="POST", data=bundle))
+        return plan.results()
+
+    def subsumes(self, codeA: str, codeB: str, system: str | None = None, **kwargs) -> str:
+        """Test the subsumption relationship between two codes and return the outcome:
+        equivalent, subsumes, subsumed-by or not-subsumed.
+        https://www.hl7.org/fhir/codesystem-operation-subsumes.html"""
+        system = system or self.get("url")
+        outcome = _subsumes_locally(self.hierarchy, codeA, codeB, system)
+        if outcome is not None:
+            return outcome
+        if system is not None:
+            kwargs["system"] = system
+        params = dict_to_params_json({"codeA": codeA, "codeB": codeB, **kwargs})
+        return self._execute_cached("$subsumes", params, self.client.lookup_cache)["outcome"]
+
+    def validate_code(self, **kwargs) -> AttrDict:
+        """Validate a code against the CodeSystem.
+        https://www.hl7.org/fhir/codesystem-operation-validate-code.html"""
+        return self._execute_cached(
+            "$validate-code", dict_to_params_json(kwargs), self.client.validate_code_cache, negative=True
+        )
+
+
+class AsyncCodeSystem(AsyncFHIRResource):
+    """Asyncio counterpart of `SyncCodeSystem`."""
+
+    batch_size = DEFAULT_BATCH_SIZE
+    hierarchy: ExpansionStore | None = None
+
+    async def _execute_cached(self, operation: str, params: dict, cache, negative=False) -> AttrDict:
+        key = ((resource_identity(self), operation), normalize_params(params))
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not MISSING:
+                return AttrDict(cached)
+
+        async def request():
+            result = params_json_to_dict(await self.execute(operation, method="POST", data=params))
+            if cache is not None:
+                cache.put(key, result, negative=negative and not result.get("result"))
+            return result
+
+        return AttrDict(await coalesce_async(self.client.single_flight, key, request))
+
+    async def lookup(self, **kwargs) -> AttrDict:
+        """Look up the details of a code.
+        https://www.hl7.org/fhir/codesystem-operation-lookup.html"""
+        return await self._execute_cached("$lookup", dict_to_params_json(kwargs), self.client.lookup_cache)
+
+    async def lookup_many(self, items: Iterable[Coding | dict], batch_size: int | None = None, **kwargs) -> list:
+        """Look up many codes in batch Bundles, see `SyncCodeSystem.lookup_many`.
+        The Bundles are sent concurrently, bounded by the client's `max_concurrency`."""
+        plan = BatchPlan(
+            "{0}/$lookup".format(self._get_path()),
+            (dict_to_params_json({**_lookup_kwargs(item), **kwargs}) for item in items),
+            (resource_identity(self), "$lookup"),
+            self.client.lookup_cache,
+        )
+        chunks = list(plan.bundles(batch_size or self.batch_size))
+        responses = await self.client.gather(
+            *(self.client.execute("", method="POST", data=bundle) for _, bundle in chunks)
+        )
+        for (keys, _), response in zip(chunks, responses):
+            plan.record(keys, response)
+        return plan.results()
+
+    async def subsumes(self, codeA: str, codeB: str, system: str | None = None, **kwargs) -> str:
+        """Test the subsumption relationship between two codes, see `SyncCodeSystem.subsumes`.
+        https://www.hl7.org/fhir/codesystem-operation-subsumes.html"""
+        system = system or self.get("url")
+        outcome = _subsumes_locally(self.hierarchy, codeA, codeB, system)
+        if outcome is not None:
+            return outcome
+        if system is not None:
+            kwargs["system"] = system
+        params = dict_to_params_json({"codeA": codeA, "codeB": codeB, **kwargs})
+        return (await self._execute_cached("$subsumes", params, self.client.lookup_cache))["outcome"]
+
+    async def validate_code(self, **kwargs) -> AttrDict:
+        """Validate a code against the CodeSystem.
+        https://www.hl7.org/fhir/codesystem-operation-validate-code.html"""
+        return await self._execute_cached(
+            "$validate-code", dict_to_params_json(kwargs), self.client.validate_code_cache, negative=True
+        )
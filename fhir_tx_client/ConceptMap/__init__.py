@@ -0,0 +1,11 @@
+from typing import TYPE_CHECKING
+from fhir_tx_client._lazy import lazy_getattr
+
+if TYPE_CHECKING:
+    from .client import SyncConceptMap
+    from .translation import Translation, TranslationTarget
+
+__all__ = ["SyncConceptMap", "Translation", "TranslationTarget"]
+__getattr__ = lazy_getattr(
+    __name__, {"SyncConceptMap": ".client", "Translation": ".translation", "TranslationTarget": ".translation"}
+)
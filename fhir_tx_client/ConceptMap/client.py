@@ -0,0 +1,109 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable
+from fhirpy.lib import SyncFHIRResource
+from fhirpy.base.exceptions import OperationOutcome, ResourceNotFound
+from fhir_tx_client.batch import BatchPlan
+from fhir_tx_client.scheduler import BULK, priority
+from fhir_tx_client.util import dict_to_params_json, params_json_to_dict, resource_identity
+from .translation import Translation, TranslationTarget
+
+if TYPE_CHECKING:
+    from fhir_tx_client.data_types import Coding
+
+DEFAULT_BATCH_SIZE = 100
+
+
+def _source(item: Coding | dict) -> tuple[str | None, str | None]:
+    from fhir_tx_client.data_types import Coding
+
+    if isinstance(item, Coding):
+        return item.system, item.code
+    if isinstance(item, dict):
+        coding = item.get("coding") or item
+        if isinstance(coding, Coding):
+            return coding.system, coding.code
+        return coding.get("system"), coding.get("code")
+    raise TypeError("Expected a Coding or a dictionary of $translate parameters, got %s" % type(item))
+
+
+def _translate_kwargs(item: Coding | dict) -> dict:
+    from fhir_tx_client.data_types import Coding
+
+    return {"coding": item} if isinstance(item, Coding) else item
+
+
+class SyncConceptMap(SyncFHIRResource):
+    """ConceptMap with the $translate operation.
+
+    After `materialize()` translations are answered from an in-memory table built from
+    the map's `group.element.target` content instead of the server."""
+
+    batch_size = DEFAULT_BATCH_SIZE
+    translation_table: dict[tuple[str | None, str], tuple[TranslationTarget, ...]] | None = None
+
+    def translate(self, **kwargs) -> Translation:
+        """Translate a code from one ValueSet to another.
+        https://www.hl7.org/fhir/conceptmap-operation-translate.html"""
+        system, code = _source(kwargs)
+        if self.translation_table is not None:
+            return self._translate_locally(system, code, kwargs.get("targetsystem"))
+        result = self.execute("$translate", method="POST", data=dict_to_params_json(kwargs))
+        return Translation.from_response(system, code, params_json_to_dict(result))
+
+    def translate_many(self, items: Iterable[Coding | dict], batch_size: int | None = None, **kwargs) -> list:
+        """Translate many codes. Duplicates are translated once, the others are sent in batch
+        Bundles of `batch_size` $translate requests, or answered locally when the map is
+        materialized. Returns a `Translation` per item in input order, or the
+        `OperationOutcome` of a failed translation."""
+        items = list(items)
+        if self.translation_table is not None:
+            return [self._translate_locally(*_source(item), kwargs.get("targetsystem")) for item in items]
+        plan = BatchPlan(
+            "{0}/$translate".format(self._get_path()),
+            (dict_to_params_json({**_translate_kwargs(item), **kwargs}) for item in items),
+            (resource_identity(self), "$translate"),
+        )
+        with priority(BULK):
+            for keys, bundle in plan.bundles(batch_size or self.batch_size):
+                plan.record(keys, self.client.execute("", method="POST", data=bundle))
+        return [
+            result if isinstance(result, OperationOutcome) else Translation.from_response(*_source(item), result)
+            for item, result in zip(items, plan.results())
+        ]
+
+    def materialize(self) -> int:
+        """Load the ConceptMap and build its source-to-targets table. Returns the number of
+        mapped source codes."""
+        if not self.get("group"):
+            if self.get("id"):
+                self.refresh()
+            elif self.get("url"):
+                resource = self.client.resources("ConceptMap").search(url=self["url"]).first()
+                if resource is None:
+                    raise ResourceNotFound("ConceptMap %s not found" % self["url"])
+                for key, value in resource.items():
+                    self[key] = value
+            else:
+                raise TypeError("Materializing a ConceptMap requires its `id` or `url`")
+        table = {}
+        for group in self.get("group") or []:
+            for element in group.get("element") or []:
+                targets = tuple(
+                    TranslationTarget(
+                        group.get("target"),
+                        target.get("code"),
+                        target.get("display"),
+                        target.get("equivalence") or target.get("relationship"),
+                    )
+                    for target in element.get("target") or []
+                )
+                key = (group.get("source"), element.get("code"))
+                table[key] = table.get(key, ()) + targets
+        self.translation_table = table
+        return len(table)
+
+    def _translate_locally(self, system, code, target_system=None) -> Translation:
+        targets = self.translation_table.get((system, code), ())
+        if target_system is not None:
+            targets = tuple(target for target in targets if target.system == target_system)
+        return Translation(system, code, targets)
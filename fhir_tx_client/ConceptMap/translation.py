@@ -0,0 +1,72 @@
+from fhirpy.base.utils import AttrDict
+
+# Equivalences that state there is no usable mapping to the target
+NO_MATCH_EQUIVALENCES = {"unmatched", "disjoint", "not-related-to"}
+
+
+class TranslationTarget:
+    __slots__ = ("system", "code", "display", "equivalence")
+
+    def __init__(self, system=None, code=None, display=None, equivalence=None):
+        self.system = system
+        self.code = code
+        self.display = display
+        self.equivalence = equivalence
+
+    def __eq__(self, other):
+        return isinstance(other, TranslationTarget) and (self.system, self.code, self.equivalence) == (
+            other.system,
+            other.code,
+            other.equivalence,
+        )
+
+    def __hash__(self):
+        return hash((self.system, self.code, self.equivalence))
+
+    def __repr__(self):
+        return "<TranslationTarget {0}|{1} ({2})>".format(self.system, self.code, self.equivalence)
+
+
+class Translation:
+    """Compact result of translating one source code.
+
+    `result` follows $translate: true when at least one target is a usable match.
+    Codes without any target are reported as `unmapped`."""
+
+    __slots__ = ("system", "code", "targets", "message")
+
+    def __init__(self, system, code, targets: tuple[TranslationTarget, ...] = (), message=None):
+        self.system = system
+        self.code = code
+        self.targets = targets
+        self.message = message
+
+    @property
+    def result(self) -> bool:
+        return any(target.equivalence not in NO_MATCH_EQUIVALENCES for target in self.targets)
+
+    @property
+    def unmapped(self) -> bool:
+        return not self.targets
+
+    @classmethod
+    def from_response(cls, system, code, response: AttrDict) -> "Translation":
+        """Read a $translate result as decoded by `params_json_to_dict`"""
+        matches = response.get("match") or []
+        if isinstance(matches, dict):
+            matches = [matches]
+        targets = []
+        for match in matches:
+            concept = match.get("concept") or {}
+            targets.append(
+                TranslationTarget(
+                    concept.get("system"),
+                    concept.get("code"),
+                    concept.get("display"),
+                    match.get("equivalence") or match.get("relationship"),
+                )
+            )
+        return cls(system, code, tuple(targets), response.get("message"))
+
+    def __repr__(self):
+        return "<Translation {0}|{1} -> {2}>".format(self.system, self.code, list(self.targets))
@@ -1,2 +1,13 @@
-from .client import SyncValueSet
-from .model import ValueSet
\ No newline at end of file
+from typing import TYPE_CHECKING
+from fhir_tx_client._lazy import lazy_getattr
+
+if TYPE_CHECKING:
+    from .client import SyncValueSet, AsyncValueSet
+    from .model import ValueSet
+    from .registry import ValueSetRegistry
+
+__all__ = ["SyncValueSet", "AsyncValueSet", "ValueSet", "ValueSetRegistry"]
+__getattr__ = lazy_getattr(
+    __name__,
+    {"SyncValueSet": ".client", "AsyncValueSet": ".client", "ValueSet": ".model", "ValueSetRegistry": ".registry"},
+)
@@ -1,62 +1,562 @@
+from __future__ import annotations
+import asyncio
+import contextvars
+from concurrent.futures import ThreadPoolExecutor, as_completed
 from typing_extensions import Unpack
-from typing import Iterator, TypedDict
-from fhirpy.lib import SyncFHIRResource
-from fhir_tx_client.util import dict_to_params, params_to_dict
-from fhir_tx_client.Parameters import Parameters
-from fhir_tx_client.data_types import Coding, CodeableConcept
-from .model import ValueSet, ValueSetExpansionContains
+from typing import TYPE_CHECKING, AsyncIterator, Callable, Iterable, Iterator, TypedDict
+from fhirpy.lib import SyncFHIRResource, AsyncFHIRResource
+from fhirpy.base.exceptions import OperationOutcome, ResourceNotFound
+from fhirpy.base.utils import AttrDict
+from fhir_tx_client.cache import MISSING
+from fhir_tx_client.snapshot import snapshot_key
+from fhir_tx_client.singleflight import coalesce, coalesce_async
+from fhir_tx_client.instrumentation import measure
+from fhir_tx_client.scheduler import BULK, INTERACTIVE, default_priority, priority
+from fhir_tx_client.util import (
+    dict_to_params_json,
+    params_json_to_dict,
+    resource_identity,
+    normalize_params,
+)
+from fhir_tx_client.batch import BatchPlan
+from .lightweight import Concept, LightweightExpansion
+from .streaming import StreamingExpansion
+from .compose import ComposeEvaluator, canonical_of
+
+# The pydantic models, and the modules built on them, are imported on first use
+if TYPE_CHECKING:
+    from fhir_tx_client.data_types import Coding, CodeableConcept
+    from .model import ValueSet
+    from .index import MembershipIndex
+    from .search import SearchIndex
+    from .diff import ExpansionDelta
+    from .store import ExpansionStore
+
+DEFAULT_PAGE_SIZE = 1000
+DEFAULT_BATCH_SIZE = 100
+DEFAULT_MAX_CONCURRENCY = 8
 
 class ValidateCodeKwargs(TypedDict):
     coding: Coding
     codeableConcept: CodeableConcept
 
+
+def _next_page_offset(expansion: LightweightExpansion, offset: int, count: int) -> int | None:
+    """Return the offset of the page following `expansion`, or None when it was the last one"""
+    received = expansion.top_level_count
+    if received == 0 or received > count:
+        # An empty page, or a server that ignored `count` and returned everything
+        return None
+    if expansion.offset is not None and expansion.offset != offset:
+        return None
+    if expansion.total is not None:
+        return offset + received if offset + received < expansion.total else None
+    return offset + received if received == count else None
+
+
+def _membership_kwargs(__o: object) -> dict:
+    """Map the operand of a membership check to $validate-code parameters"""
+    from fhir_tx_client.data_types import Coding, CodeableConcept
+
+    if isinstance(__o, Coding):
+        return {"coding": __o}
+    if isinstance(__o, CodeableConcept):
+        return {"codeableConcept": __o}
+    raise NotImplementedError("Can only check for Coding objects.")
+
+
+def _codings(__o: object) -> list[Coding]:
+    from fhir_tx_client.data_types import Coding, CodeableConcept
+
+    if isinstance(__o, Coding):
+        return [__o]
+    if isinstance(__o, CodeableConcept):
+        return list(__o.coding or ())
+    raise NotImplementedError("Can only check for Coding objects.")
+
+
+def _parse_valueset(resource: dict) -> ValueSet:
+    from .model import ValueSet
+
+    return ValueSet.parse_obj(resource)
+
+
+def _is_paged(params: dict) -> bool:
+    """Whether $expand Parameters ask for one page of the expansion only"""
+    return any(parameter["name"] == "count" for parameter in params["parameter"])
+
+
+def _is_invalid(result: dict) -> bool:
+    return not result.get("result")
+
+
+def _is_complete(expansion: LightweightExpansion) -> bool:
+    """Whether an expansion enumerates all codes of the ValueSet"""
+    return expansion.total is None or len(expansion) >= expansion.total
+
+
 class SyncValueSet(SyncFHIRResource):
+    page_size = DEFAULT_PAGE_SIZE
+    batch_size = DEFAULT_BATCH_SIZE
+    max_concurrency = DEFAULT_MAX_CONCURRENCY
+    membership_index: MembershipIndex | None = None
+    search_index: SearchIndex | None = None
+    on_change: Callable[[ExpansionDelta], None] | None = None
+    _materialize_kwargs: dict = {}
 
-    def expand(self,**kwargs):
+    def expand(self, raw=False, **kwargs):
         """Expand a ValueSet resource and return a ValueSet resource with the expanded ValueSet.
+        With `raw`, return a `LightweightExpansion` read straight from the response instead.
         https://www.hl7.org/fhir/valueset-operation-expand.html"""
-        params = dict_to_params(kwargs)
-        result = self.execute(
-            "$expand",
-            method="POST",
-            data=params.dict()
-        )
-        result_valueset = ValueSet.parse_obj(result)
-        return result_valueset
+        return self._expand(kwargs, raw)
+
+    def _expand(self, kwargs: dict, raw=False, use_snapshot=True):
+        instrumentation = self.client.instrumentation
+        with measure(instrumentation, "$expand", operation="$expand", valueset=self.get("url") or self.get("id")):
+            with measure(instrumentation, "encode"):
+                params = dict_to_params_json(kwargs)
+
+            def request():
+                result = self._expand_json(params, use_snapshot)
+                with measure(instrumentation, "parse"):
+                    if raw:
+                        return LightweightExpansion(result)
+                    return _parse_valueset(result)
+
+            key = ("$expand", resource_identity(self), normalize_params(params), raw, use_snapshot)
+            return coalesce(self.client.single_flight, key, request)
+
+    def expand_stream(self, **kwargs) -> StreamingExpansion:
+        """Expand the ValueSet and decode `expansion.contains` while the response downloads.
+        Memory stays bounded by the largest top-level entry instead of the whole response.
+        Streamed expansions bypass the snapshot store, conditional requests and coalescing.
+        Close the result, or use it in a `with` block, when it may not be read to the end."""
+        path = "{0}/$expand".format(self._get_path())
+        params = dict_to_params_json(kwargs)
+        with default_priority(INTERACTIVE if _is_paged(params) else BULK):
+            return StreamingExpansion(self.client._stream_request("POST", path, data=params))
+
+    def _expand_json(self, params: dict, use_snapshot=True) -> dict:
+        """Run $expand, or read a fresh snapshot of it from the client's snapshot store.
+        Without `use_snapshot` the server is always asked, and its response replaces the snapshot."""
+        store = self.client.snapshot_store
+        if store is not None:
+            canonical, key = snapshot_key(self, params)
+        if store is not None and use_snapshot:
+            snapshot = store.get(key)
+            if self.client.instrumentation is not None:
+                self.client.instrumentation.cache_lookup("snapshot", snapshot is not None)
+            if snapshot is not None:
+                return snapshot
+        # whole expansions are bulk traffic, pages may be shown to a user
+        with default_priority(INTERACTIVE if _is_paged(params) else BULK):
+            result = self.execute(
+                "$expand",
+                method="POST",
+                data=params
+            )
+        if store is not None:
+            store.put(key, canonical, result, self.client.url)
+        return result
+
+    def expand_locally(self, raw=False, evaluator: ComposeEvaluator | None = None):
+        """Expand an extensional ValueSet from its `compose` in-process, like `expand`.
+        Referenced ValueSets are read from the server and expanded locally as well; only
+        ValueSets including a `filter` or an entire code system are expanded by the server.
+        Pass the same `evaluator` to several calls to share its memoized expansions."""
+        if not self.get("compose"):
+            self._load_definition()
+        if evaluator is None:
+            evaluator = ComposeEvaluator(self._resolve_valueset, self._expand_remotely)
+        result = evaluator.expand(self)
+        if raw:
+            return LightweightExpansion(result)
+        return _parse_valueset(result)
+
+    def _load_definition(self):
+        if self.get("id"):
+            self.refresh()
+        elif self.get("url"):
+            resource = self._resolve_valueset(canonical_of(self))
+            if resource is None:
+                raise ResourceNotFound("ValueSet %s not found" % canonical_of(self))
+            for key, value in resource.items():
+                self[key] = value
+        else:
+            raise TypeError("Expanding a ValueSet locally requires its `id`, `url` or `compose`")
+
+    def _resolve_valueset(self, canonical: str) -> dict | None:
+        url, _, version = canonical.partition("|")
+        search = self.client.resources("ValueSet").search(url=url)
+        if version:
+            search = search.search(version=version)
+        return search.first()
+
+    def _expand_remotely(self, valueset: dict) -> dict:
+        if valueset.get("id"):
+            return self.client.ValueSet(id=valueset["id"])._expand_json(dict_to_params_json({}))
+        params = {"url": valueset["url"], "valueSetVersion": valueset.get("version")}
+        return self.client.ValueSet(url=valueset["url"])._expand_json(dict_to_params_json(params))
 
 
     def validate_code(self, **kwargs:Unpack[ValidateCodeKwargs]):
         """Validate a code against a ValueSet resource.
         https://www.hl7.org/fhir/valueset-operation-validate-code.html"""
-        params = dict_to_params(kwargs)
-        result = self.execute(
-            "$validate-code",
-            method="POST",
-            data=params.dict()
+        return self._validate_code(kwargs)
+
+    def _validate_code(self, kwargs: dict, lookup=True):
+        """Run $validate-code, without `lookup` when the cache was checked by the caller already"""
+        instrumentation = self.client.instrumentation
+        with measure(
+            instrumentation, "$validate-code", operation="$validate-code", valueset=self.get("url") or self.get("id")
+        ):
+            with measure(instrumentation, "encode"):
+                params = dict_to_params_json(kwargs)
+            cache = self.client.validate_code_cache
+            key = (resource_identity(self), normalize_params(params))
+            if cache is not None and lookup:
+                cached = cache.get(key)
+                if instrumentation is not None:
+                    instrumentation.cache_lookup("validate_code", cached is not MISSING)
+                if cached is not MISSING:
+                    return AttrDict(cached)
+
+            def request():
+                result = self.execute(
+                    "$validate-code",
+                    method="POST",
+                    data=params
+                )
+                with measure(instrumentation, "parse"):
+                    response = params_json_to_dict(result)
+                if cache is not None:
+                    cache.put(key, response, negative=_is_invalid(response))
+                return response
+
+            # hand out copies so that callers cannot alter a cached or shared result
+            return AttrDict(coalesce(self.client.single_flight, ("$validate-code", key), request))
+
+    def _canonical_params(self) -> dict:
+        """Parameters naming a ValueSet known by its canonical url only in type-level operations"""
+        if self.get("id") or not self.get("url"):
+            return {}
+        return {"url": self["url"], "valueSetVersion": self.get("version")}
+
+    def validate_many(self, items: Iterable[Coding | CodeableConcept | dict], batch_size: int | None = None) -> list:
+        """Validate many codes with one batch Bundle of $validate-code requests per `batch_size` items.
+        Items are a Coding, a CodeableConcept or a dictionary of $validate-code parameters.
+        A ValueSet without an id is named by its `url` and `version`. Duplicates are sent
+        once. Returns a result per item, in input order; an item whose validation failed
+        gets the `OperationOutcome` exception instead of failing the batch."""
+        canonical = self._canonical_params()
+        plan = BatchPlan(
+            "{0}/$validate-code".format(self._get_path()),
+            (
+                dict_to_params_json({**canonical, **(item if isinstance(item, dict) else _membership_kwargs(item))})
+                for item in items
+            ),
+            resource_identity(self),
+            self.client.validate_code_cache,
+            is_negative=_is_invalid,
         )
-        result_params = Parameters.parse_obj(result)
-        return params_to_dict(result_params)
+        with priority(BULK):
+            for keys, bundle in plan.bundles(batch_size or self.batch_size):
+                plan.record(keys, self.client.execute("", method="POST", data=bundle))
+        return plan.results()
 
-    def __iterate_codings(self, contains:ValueSetExpansionContains):
-        for coding in contains:
-            yield Coding(code=coding.code, system=coding.system, display=coding.display)
-            if coding.contains:
-                yield from self.__iterate_codings(coding.contains)
+    def contains_many(self, items: Iterable[Coding | CodeableConcept], batch_size: int | None = None) -> list[bool | None]:
+        """Check the membership of many codings at once, see `validate_many`.
+        Items whose validation failed are reported as None."""
+        items = list(items)
+        if self.membership_index is not None:
+            if not self.membership_index.is_stale() or self.refresh_materialized():
+                return [item in self.membership_index for item in items]
+        return [
+            None if isinstance(result, OperationOutcome) else result["result"]
+            for result in self.validate_many(items, batch_size=batch_size)
+        ]
+
+    def validate_codings(self, concept: CodeableConcept) -> list:
+        """Validate each coding of a CodeableConcept on its own. Codings are answered by the
+        membership index of a materialized ValueSet or the client's `validate_code_cache` when
+        possible; only the others are sent, concurrently, at most `max_concurrency` at a time.
+        Returns a $validate-code result per coding, in order; a coding whose validation failed
+        gets the `OperationOutcome` exception instead."""
+        return self._validate_codings(_codings(concept), first_match=False)
+
+    def contains_any(self, concept: CodeableConcept) -> bool:
+        """Whether any coding of a CodeableConcept is in the ValueSet, see `validate_codings`.
+        Returns at the first coding found, locally or from the server, without waiting for the
+        other requests. The error of a failed coding is raised only when no other matched."""
+        results = self._validate_codings(_codings(concept), first_match=True)
+        if any(isinstance(result, dict) and result.get("result") for result in results):
+            return True
+        for result in results:
+            if isinstance(result, OperationOutcome):
+                raise result
+        return False
+
+    def _local_result(self, coding: Coding) -> dict | None:
+        """$validate-code result of `coding` known without a request, if any"""
+        if self.membership_index is not None:
+            if not self.membership_index.is_stale() or self.refresh_materialized():
+                return {"result": coding in self.membership_index}
+        cache = self.client.validate_code_cache
+        if cache is not None:
+            cached = cache.get((resource_identity(self), normalize_params(dict_to_params_json({"coding": coding}))))
+            if self.client.instrumentation is not None:
+                self.client.instrumentation.cache_lookup("validate_code", cached is not MISSING)
+            if cached is not MISSING:
+                return cached
+        return None
+
+    def _validate_codings(self, codings: list[Coding], first_match: bool) -> list:
+        results = [None] * len(codings)
+        unknown = []
+        for position, coding in enumerate(codings):
+            result = self._local_result(coding)
+            if result is None:
+                unknown.append(position)
+                continue
+            results[position] = AttrDict(result)
+            if first_match and result.get("result"):
+                return results
+        if not unknown:
+            return results
+        if len(unknown) == 1:
+            try:
+                results[unknown[0]] = self._validate_code({"coding": codings[unknown[0]]}, lookup=False)
+            except OperationOutcome as exc:
+                results[unknown[0]] = exc
+            return results
+        executor = ThreadPoolExecutor(max_workers=min(len(unknown), self.max_concurrency))
+        try:
+            # the requests keep the priority of the caller
+            futures = {
+                executor.submit(
+                    contextvars.copy_context().run, self._validate_code, {"coding": codings[position]}, False
+                ): position
+                for position in unknown
+            }
+            for future in as_completed(futures):
+                try:
+                    result = future.result()
+                except OperationOutcome as exc:
+                    result = exc
+                results[futures[future]] = result
+                if first_match and isinstance(result, dict) and result.get("result"):
+                    break
+        finally:
+            # after a match, running requests finish in the background and queued ones are dropped
+            executor.shutdown(wait=False, cancel_futures=True)
+        return results
+
+    def iter_pages(self, page_size: int | None = None, prefetch=False, **kwargs) -> Iterator[list[Coding]]:
+        """Expand the ValueSet page by page using the `offset` and `count` parameters of $expand.
+        Only one page is held in memory at a time; with `prefetch` the next page is requested
+        in a background thread while the current one is being consumed."""
+        page_size = page_size or self.page_size
+
+        def fetch(offset):
+            with priority(BULK):
+                return self.expand(raw=True, offset=offset, count=page_size, **kwargs)
+
+        with ThreadPoolExecutor(max_workers=1) as executor:
+            offset = 0
+            pending = executor.submit(fetch, offset) if prefetch else None
+            while offset is not None:
+                expansion = pending.result() if prefetch else fetch(offset)
+                offset = _next_page_offset(expansion, offset, page_size)
+                if prefetch and offset is not None:
+                    pending = executor.submit(fetch, offset)
+                yield list(expansion.codings())
 
     def __iter__(self) -> Iterator[Coding]:
-        vs:ValueSet = self.expand()
-        contains:ValueSetExpansionContains = vs.expansion.contains
-        yield from self.__iterate_codings(contains)
-        
-    
+        for page in self.iter_pages():
+            yield from page
+
+
+    def expansion_store(self, **kwargs) -> ExpansionStore:
+        """Expand the ValueSet into an `ExpansionStore` to answer hierarchy questions
+        (ancestors, descendants, is-a, depth) locally."""
+        from .store import ExpansionStore
+
+        return ExpansionStore.from_resource(self._expand_json(dict_to_params_json(kwargs)))
+
+    def materialize(
+        self,
+        max_age: float | None = None,
+        stream=False,
+        search=False,
+        on_change: Callable[[ExpansionDelta], None] | None = None,
+        **kwargs,
+    ) -> bool:
+        """Expand the ValueSet once and answer `coding in valueset` from an in-process index.
+        After `max_age` seconds the index is refreshed on the next membership check.
+        With `stream`, the index is built while the expansion downloads, see `expand_stream`.
+        With `search`, a `SearchIndex` answers `search` in-process as well.
+        `on_change` is called with the `ExpansionDelta` of each refresh that changed concepts.
+        Returns False, and keeps using $validate-code, when the ValueSet cannot be enumerated."""
+        from .index import MembershipIndex
+        from .search import SearchIndex
+
+        if stream and search:
+            raise ValueError("A streamed expansion cannot be indexed for search")
+        self._materialize_kwargs = kwargs
+        self.on_change = on_change
+        self.membership_index = self.search_index = None
+        try:
+            if stream:
+                with self.expand_stream(**kwargs) as expansion:
+                    index = MembershipIndex(expansion, max_age=max_age)
+            else:
+                expansion = self.expand(raw=True, **kwargs)
+                index = MembershipIndex(expansion, max_age=max_age)
+        except OperationOutcome:
+            return False
+        if not _is_complete(expansion):
+            return False
+        self.membership_index = index
+        if search:
+            self.search_index = SearchIndex(expansion, max_age=max_age)
+        return True
+
+    def refresh_materialized(self) -> bool:
+        """Re-expand a materialized ValueSet and patch its indexes if the expansion changed,
+        see `update_materialized`. Returns False when it can no longer be enumerated."""
+        return self.update_materialized() is not None
+
+    def update_materialized(self) -> ExpansionDelta | None:
+        """Re-expand a materialized ValueSet with the server, never from a snapshot, and, if the
+        expansion changed, i.e. has another `expansion.identifier` or `expansion.timestamp`,
+        apply only the added, removed and changed concepts to its indexes. Returns that delta,
+        empty when nothing changed, or None when the ValueSet can no longer be enumerated and
+        is not materialized anymore."""
+        if self.membership_index is None:
+            raise ValueError("ValueSet is not materialized, call materialize() first")
+        from .diff import ExpansionDelta
+
+        try:
+            # a snapshot would hand back the expansion the indexes were built from
+            expansion = self._expand(self._materialize_kwargs, raw=True, use_snapshot=False)
+        except OperationOutcome:
+            self.membership_index = self.search_index = None
+            return None
+        if self.membership_index.is_same_expansion(expansion):
+            self.membership_index.touch()
+            if self.search_index is not None:
+                self.search_index.touch()
+            return ExpansionDelta(identifier=expansion.identifier, timestamp=expansion.timestamp)
+        if not _is_complete(expansion):
+            self.membership_index = self.search_index = None
+            return None
+        delta = self.membership_index.diff(expansion)
+        self.membership_index.apply(delta)
+        if self.search_index is not None:
+            self.search_index.update(expansion)
+        if delta and self.on_change is not None:
+            self.on_change(delta)
+        return delta
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> list[Concept]:
+        """Typeahead search for the selectable concepts whose display or designations have
+        words starting with those of `text`, best matches first.
+        Answered by the `SearchIndex` of a ValueSet materialized with `search=True`,
+        otherwise by $expand with `filter`, ranked by the server. There `limit` and `offset`
+        count the entries of the server's page, abstract concepts included, so a page may
+        hold fewer than `limit` concepts before the last one."""
+        if self.search_index is not None:
+            if not self.search_index.is_stale() or self.refresh_materialized():
+                return self.search_index.search(text, limit, offset)
+        kwargs = {**self._materialize_kwargs, "filter": text, "count": limit, "offset": offset}
+        expansion = self.expand(raw=True, **kwargs)
+        return [concept for concept in expansion if concept.code is not None and not concept.abstract]
+
     def __contains__(self, __o: object) -> bool:
-        
-        if isinstance(__o, Coding):
-            response = self.validate_code(coding=__o)
-            return response['result']
+        if self.membership_index is not None:
+            if not self.membership_index.is_stale() or self.refresh_materialized():
+                return __o in self.membership_index
+        response = self.validate_code(**_membership_kwargs(__o))
+        return response['result']
+
+
+class AsyncValueSet(AsyncFHIRResource):
+    """Asyncio counterpart of `SyncValueSet`.
+
+    `in` cannot be awaited, so membership is checked with `await vs.contains(coding)`."""
+
+    page_size = DEFAULT_PAGE_SIZE
+
+    async def expand(self, raw=False, **kwargs):
+        """Expand a ValueSet resource and return a ValueSet resource with the expanded ValueSet.
+        With `raw`, return a `LightweightExpansion` read straight from the response instead.
+        https://www.hl7.org/fhir/valueset-operation-expand.html"""
+        params = dict_to_params_json(kwargs)
+
+        async def request():
+            result = await self.execute(
+                "$expand",
+                method="POST",
+                data=params
+            )
+            if raw:
+                return LightweightExpansion(result)
+            return _parse_valueset(result)
+
+        key = ("$expand", resource_identity(self), normalize_params(params), raw)
+        return await coalesce_async(self.client.single_flight, key, request)
+
+    async def validate_code(self, **kwargs: Unpack[ValidateCodeKwargs]):
+        """Validate a code against a ValueSet resource.
+        https://www.hl7.org/fhir/valueset-operation-validate-code.html"""
+        params = dict_to_params_json(kwargs)
+        cache = self.client.validate_code_cache
+        key = (resource_identity(self), normalize_params(params))
+        if cache is not None:
+            cached = cache.get(key)
+            if cached is not MISSING:
+                return AttrDict(cached)
+
+        async def request():
+            result = await self.execute(
+                "$validate-code",
+                method="POST",
+                data=params
+            )
+            response = params_json_to_dict(result)
+            if cache is not None:
+                cache.put(key, response, negative=_is_invalid(response))
+            return response
+
+        # hand out copies so that callers cannot alter a cached or shared result
+        return AttrDict(await coalesce_async(self.client.single_flight, ("$validate-code", key), request))
+
+    async def iter_pages(self, page_size: int | None = None, prefetch=False, **kwargs) -> AsyncIterator[list[Coding]]:
+        """Expand the ValueSet page by page, see `SyncValueSet.iter_pages`.
+        With `prefetch` the next page is requested in a task while the current one is consumed."""
+        page_size = page_size or self.page_size
+
+        async def fetch(offset):
+            return await self.expand(raw=True, offset=offset, count=page_size, **kwargs)
+
+        offset = 0
+        pending = asyncio.ensure_future(fetch(offset)) if prefetch else None
+        try:
+            while offset is not None:
+                expansion = await (pending if prefetch else fetch(offset))
+                offset = _next_page_offset(expansion, offset, page_size)
+                if prefetch and offset is not None:
+                    pending = asyncio.ensure_future(fetch(offset))
+                yield list(expansion.codings())
+        finally:
+            if pending is not None and not pending.done():
+                pending.cancel()
 
-        if isinstance(__o, CodeableConcept):
-            response = self.validate_code(codeableConcept=__o)
-            return response['result']
+    async def __aiter__(self) -> AsyncIterator[Coding]:
+        async for page in self.iter_pages():
+            for coding in page:
+                yield coding
 
-        raise NotImplementedError("Can only check for Coding objects.")
\ No newline at end of file
+    async def contains(self, __o: object) -> bool:
+        response = await self.validate_code(**_membership_kwargs(__o))
+        return response['result']
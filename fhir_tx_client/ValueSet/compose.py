@@ -0,0 +1,137 @@
+import uuid
+from datetime import datetime, timezone
+from typing import Callable
+from fhirpy.base.exceptions import ResourceNotFound
+from .lightweight import flatten_contains
+
+Key = tuple[str | None, str | None, str]
+
+
+class NotExpandableLocally(NotImplementedError):
+    """A compose that needs the server: an include with a `filter`, or of an entire code system"""
+
+
+def canonical_of(valueset: dict) -> str | None:
+    url = valueset.get("url")
+    if not url:
+        return None
+    version = valueset.get("version")
+    return "{0}|{1}".format(url, version) if version else url
+
+
+def _is_local(include: dict) -> bool:
+    if include.get("filter"):
+        return False
+    # A system without concepts includes the entire code system
+    return not include.get("system") or bool(include.get("concept"))
+
+
+def _codes(entries: dict[Key, dict]) -> set[tuple[str | None, str]]:
+    """(system, code) pairs of `entries`, to match them regardless of the code system version"""
+    return {(system, code) for system, _, code in entries}
+
+
+class ComposeEvaluator:
+    """Expands extensional ValueSets from their `compose` in-process.
+
+    Includes list `concept`s and/or reference other ValueSets through `valueSet`, whose
+    canonicals are looked up with `resolve` (returning the ValueSet resource or None) and
+    expanded recursively. Expansions are memoized by canonical for the lifetime of the
+    evaluator; a ValueSet that references itself, directly or not, raises a ValueError.
+    A ValueSet whose compose needs the server (see `NotExpandableLocally`) or that cannot be
+    resolved is handed to `fallback`, which returns its server-side expansion."""
+
+    def __init__(
+        self,
+        resolve: Callable[[str], dict | None],
+        fallback: Callable[[dict], dict] | None = None,
+    ):
+        self.resolve = resolve
+        self.fallback = fallback
+        self._entries: dict[str, dict[Key, dict]] = {}
+
+    def expand(self, valueset: dict) -> dict:
+        """Return `valueset` with an `expansion` holding the codes selected by its compose"""
+        contains = [dict(entry) for entry in self._expand(valueset, ()).values()]
+        return {
+            **{key: value for key, value in valueset.items() if key != "expansion"},
+            "expansion": {
+                "identifier": "urn:uuid:{0}".format(uuid.uuid4()),
+                "timestamp": datetime.now(timezone.utc).isoformat(timespec="seconds"),
+                "total": len(contains),
+                "contains": contains,
+            },
+        }
+
+    def _expand(self, valueset: dict, path: tuple[str, ...]) -> dict[Key, dict]:
+        canonical = canonical_of(valueset)
+        if canonical is not None and canonical in self._entries:
+            return self._entries[canonical]
+        compose = valueset.get("compose") or {}
+        includes, excludes = compose.get("include") or [], compose.get("exclude") or []
+        if not includes or not all(_is_local(include) for include in includes + excludes):
+            if self.fallback is None:
+                raise NotExpandableLocally("ValueSet {0} needs a server-side $expand".format(canonical or valueset.get("id")))
+            entries = self._from_expansion(self.fallback(valueset))
+        else:
+            path = path + (valueset.get("url") or valueset.get("id") or "?",)
+            entries = {}
+            for include in includes:
+                entries.update(self._select(include, path))
+            for exclude in excludes:
+                excluded = _codes(self._select(exclude, path))
+                entries = {key: entry for key, entry in entries.items() if (key[0], key[2]) not in excluded}
+        if canonical is not None:
+            self._entries[canonical] = entries
+        return entries
+
+    def _select(self, include: dict, path: tuple[str, ...]) -> dict[Key, dict]:
+        """Codes of one include (or exclude): its concepts intersected with its ValueSets"""
+        selected = None
+        if include.get("system"):
+            system, version = include["system"], include.get("version")
+            selected = {}
+            for concept in include["concept"]:
+                entry = {"system": system, "code": concept["code"]}
+                if version:
+                    entry["version"] = version
+                if concept.get("display"):
+                    entry["display"] = concept["display"]
+                selected[(system, version, concept["code"])] = entry
+        for reference in include.get("valueSet") or []:
+            entries = self._reference(reference, path)
+            if selected is None:
+                selected = dict(entries)
+            else:
+                codes = _codes(entries)
+                selected = {key: entry for key, entry in selected.items() if (key[0], key[2]) in codes}
+        return selected or {}
+
+    def _reference(self, canonical: str, path: tuple[str, ...]) -> dict[Key, dict]:
+        if canonical.partition("|")[0] in path:
+            raise ValueError("Cyclic ValueSet reference: {0}".format(" -> ".join(path + (canonical,))))
+        if canonical in self._entries:
+            return self._entries[canonical]
+        valueset = self.resolve(canonical)
+        if valueset is None:
+            if self.fallback is None:
+                raise ResourceNotFound("ValueSet {0} not found".format(canonical))
+            url, _, version = canonical.partition("|")
+            valueset = {"resourceType": "ValueSet", "url": url, **({"version": version} if version else {})}
+            entries = self._from_expansion(self.fallback(valueset))
+            self._entries[canonical] = entries
+            return entries
+        entries = self._expand(valueset, path)
+        # also remember the ValueSet under the canonical it was referenced with, e.g. without version
+        self._entries[canonical] = entries
+        return entries
+
+    @staticmethod
+    def _from_expansion(resource: dict) -> dict[Key, dict]:
+        entries = {}
+        for entry, _ in flatten_contains((resource.get("expansion") or {}).get("contains") or []):
+            if entry.get("abstract") or not entry.get("code"):
+                continue
+            member = {key: value for key, value in entry.items() if key != "contains"}
+            entries[(entry.get("system"), entry.get("version"), entry["code"])] = member
+        return entries
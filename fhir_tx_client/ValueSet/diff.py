@@ -0,0 +1,92 @@
+from typing import Iterable, Iterator, Mapping
+from .lightweight import Concept
+
+Key = tuple[str | None, str | None, str]
+
+
+def concept_key(concept: Concept) -> Key:
+    return concept.system, concept.version, concept.code
+
+
+def _same(old: Concept, new: Concept) -> bool:
+    return (old.display, bool(old.abstract), bool(old.inactive)) == (new.display, bool(new.abstract), bool(new.inactive))
+
+
+class ExpansionDelta:
+    """Concepts added, removed and changed between two expansions of a ValueSet.
+
+    Concepts are keyed on (system, version, code); one changed when its display, `abstract`
+    or `inactive` did. `changed` holds (old, new) pairs. `identifier` and `timestamp` are
+    those of the newer expansion."""
+
+    __slots__ = ("added", "removed", "changed", "identifier", "timestamp")
+
+    def __init__(
+        self,
+        added: list[Concept] | None = None,
+        removed: list[Concept] | None = None,
+        changed: list[tuple[Concept, Concept]] | None = None,
+        identifier: str | None = None,
+        timestamp: str | None = None,
+    ):
+        self.added = added or []
+        self.removed = removed or []
+        self.changed = changed or []
+        self.identifier = identifier
+        self.timestamp = timestamp
+
+    def events(self) -> Iterator[dict]:
+        """One JSON-serializable change event per concept"""
+        for kind, concepts in (("added", self.added), ("removed", self.removed)):
+            for concept in concepts:
+                yield {"type": kind, "system": concept.system, "version": concept.version, "code": concept.code}
+        for old, new in self.changed:
+            yield {
+                "type": "changed",
+                "system": new.system,
+                "version": new.version,
+                "code": new.code,
+                "before": {"display": old.display, "abstract": bool(old.abstract), "inactive": bool(old.inactive)},
+                "after": {"display": new.display, "abstract": bool(new.abstract), "inactive": bool(new.inactive)},
+            }
+
+    def __bool__(self) -> bool:
+        return bool(self.added or self.removed or self.changed)
+
+    def __len__(self) -> int:
+        return len(self.added) + len(self.removed) + len(self.changed)
+
+    def __repr__(self):
+        return "<ExpansionDelta +{0} -{1} ~{2}>".format(len(self.added), len(self.removed), len(self.changed))
+
+
+def diff_concepts(old: Mapping[Key, Concept], new: Iterable[Concept]) -> ExpansionDelta:
+    """Compare the concepts of an expansion with `old`, the concepts of a previous one by key.
+    Concepts without a code are ignored."""
+    delta = ExpansionDelta()
+    seen = set()
+    for concept in new:
+        if concept.code is None:
+            continue
+        key = concept_key(concept)
+        if key in seen:
+            # listed under several parents
+            continue
+        seen.add(key)
+        previous = old.get(key)
+        if previous is None:
+            delta.added.append(concept)
+        elif not _same(previous, concept):
+            delta.changed.append((previous, concept))
+    delta.removed = [concept for key, concept in old.items() if key not in seen]
+    return delta
+
+
+def diff_expansions(old: Iterable[Concept], new) -> ExpansionDelta:
+    """Delta between two expansions, e.g. `LightweightExpansion`s of two versions of a ValueSet"""
+    previous = {concept_key(concept): concept for concept in old if concept.code is not None}
+    delta = diff_concepts(previous, new)
+    # read after the concepts, a streamed expansion may hold them after `contains`
+    delta.identifier = new.identifier
+    delta.timestamp = new.timestamp
+    return delta
@@ -0,0 +1,121 @@
+import time
+from typing import Iterable, Iterator
+from fhir_tx_client.data_types import Coding, CodeableConcept
+from .model import ValueSetExpansion, ValueSetExpansionContains
+from .lightweight import Concept, LightweightExpansion
+from .streaming import StreamingExpansion
+from .diff import ExpansionDelta, concept_key, diff_concepts
+
+
+def walk_contains(contains: Iterable[ValueSetExpansionContains]) -> Iterator[ValueSetExpansionContains]:
+    """Yield every entry of a (nested) `expansion.contains` in document order, without recursion"""
+    stack = [iter(contains)]
+    while stack:
+        entry = next(stack[-1], None)
+        if entry is None:
+            stack.pop()
+            continue
+        yield entry
+        if entry.contains:
+            stack.append(iter(entry.contains))
+
+
+def _concepts(expansion: ValueSetExpansion | LightweightExpansion | StreamingExpansion) -> Iterator[Concept]:
+    if isinstance(expansion, (LightweightExpansion, StreamingExpansion)):
+        return iter(expansion)
+    return (
+        Concept(entry.system, entry.version, entry.code, entry.display, bool(entry.abstract), bool(entry.inactive))
+        for entry in walk_contains(expansion.contains or [])
+    )
+
+
+class MembershipIndex:
+    """In-process hash index over the selectable codes of a ValueSet expansion.
+
+    Codes are keyed on (system, version, code). A Coding without a version matches
+    the code in any version of its system; an entry without a version matches a Coding
+    in any version.
+    `max_age` (seconds) marks the index stale so that its owner re-expands the ValueSet.
+    A `StreamingExpansion` is indexed while it downloads. A newer expansion is applied by
+    patching only the concepts that changed, see `diff` and `apply`."""
+
+    def __init__(
+        self, expansion: ValueSetExpansion | LightweightExpansion | StreamingExpansion, max_age: float | None = None
+    ):
+        self.max_age = max_age
+        self._concepts: dict[tuple, Concept] = {}  # every coded concept, abstract ones too
+        self._versions: dict[tuple, int] = {}  # number of selectable versions of (system, code)
+        for concept in _concepts(expansion):
+            if concept.code is not None:
+                self._add(concept)
+        # read after the concepts, a streamed expansion may hold them after `contains`
+        self.identifier = expansion.identifier
+        self.timestamp = expansion.timestamp
+        self.built_at = time.monotonic()
+
+    def is_stale(self) -> bool:
+        return self.max_age is not None and time.monotonic() - self.built_at > self.max_age
+
+    def is_same_expansion(self, expansion: ValueSetExpansion | LightweightExpansion) -> bool:
+        """Whether `expansion` is the expansion this index was built from"""
+        if self.identifier is None and self.timestamp is None:
+            return False
+        return (self.identifier, self.timestamp) == (expansion.identifier, expansion.timestamp)
+
+    def touch(self):
+        """Mark the index as fresh again after the server confirmed it is unchanged"""
+        self.built_at = time.monotonic()
+
+    def _add(self, concept: Concept):
+        key = concept_key(concept)
+        if key in self._concepts:
+            # listed under several parents
+            return
+        self._concepts[key] = concept
+        if not concept.abstract:
+            key = (concept.system, concept.code)
+            self._versions[key] = self._versions.get(key, 0) + 1
+
+    def _remove(self, concept: Concept):
+        del self._concepts[concept_key(concept)]
+        if not concept.abstract:
+            key = (concept.system, concept.code)
+            self._versions[key] -= 1
+            if not self._versions[key]:
+                del self._versions[key]
+
+    def diff(self, expansion: ValueSetExpansion | LightweightExpansion | StreamingExpansion) -> ExpansionDelta:
+        """Concepts added, removed and changed in `expansion` relative to the indexed one"""
+        delta = diff_concepts(self._concepts, _concepts(expansion))
+        delta.identifier = expansion.identifier
+        delta.timestamp = expansion.timestamp
+        return delta
+
+    def apply(self, delta: ExpansionDelta):
+        """Patch the index with the changes of a newer expansion"""
+        for concept in delta.removed:
+            self._remove(concept)
+        for old, new in delta.changed:
+            self._remove(old)
+            self._add(new)
+        for concept in delta.added:
+            self._add(concept)
+        self.identifier = delta.identifier
+        self.timestamp = delta.timestamp
+        self.touch()
+
+    def __contains__(self, __o: object) -> bool:
+        if isinstance(__o, Coding):
+            if __o.version is None:
+                return (__o.system, __o.code) in self._versions
+            concept = self._concepts.get((__o.system, __o.version, __o.code))
+            if concept is None:
+                # an entry without a version holds the code in any version
+                concept = self._concepts.get((__o.system, None, __o.code))
+            return concept is not None and not concept.abstract
+        if isinstance(__o, CodeableConcept):
+            return any(coding in self for coding in __o.coding)
+        raise NotImplementedError("Can only check for Coding objects.")
+
+    def __len__(self) -> int:
+        return len(self._versions)
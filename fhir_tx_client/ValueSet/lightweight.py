@@ -0,0 +1,101 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterator
+
+if TYPE_CHECKING:
+    from fhir_tx_client.data_types import Coding
+    from .model import ValueSet
+
+
+def flatten_contains(contains: list[dict]) -> Iterator[tuple[dict, int]]:
+    """Yield each entry of a (nested) `expansion.contains` JSON array in document order,
+    with the position of its parent entry (-1 for top-level entries), without recursion"""
+    stack = [(iter(contains), -1)]
+    position = 0
+    while stack:
+        entries, parent = stack[-1]
+        entry = next(entries, None)
+        if entry is None:
+            stack.pop()
+            continue
+        yield entry, parent
+        if entry.get("contains"):
+            stack.append((iter(entry["contains"]), position))
+        position += 1
+
+
+class Concept:
+    """Compact record of one entry of `expansion.contains`.
+
+    `parent` is the index of the enclosing entry in `LightweightExpansion.concepts`,
+    or -1 for top-level entries."""
+
+    __slots__ = ("system", "version", "code", "display", "abstract", "inactive", "parent")
+
+    def __init__(self, system=None, version=None, code=None, display=None, abstract=False, inactive=False, parent=-1):
+        self.system = system
+        self.version = version
+        self.code = code
+        self.display = display
+        self.abstract = abstract
+        self.inactive = inactive
+        self.parent = parent
+
+    def to_coding(self) -> Coding:
+        from fhir_tx_client.data_types import Coding
+
+        return Coding(system=self.system, version=self.version, code=self.code, display=self.display)
+
+    def __repr__(self):
+        return "<Concept {0}|{1}>".format(self.system, self.code)
+
+
+class LightweightExpansion:
+    """$expand result read straight from the JSON response, without building the pydantic ValueSet.
+
+    Concepts are flattened in document order. The typed ValueSet is only parsed when
+    `valueset` is accessed."""
+
+    __slots__ = ("identifier", "timestamp", "total", "offset", "top_level_count", "concepts", "_resource", "_valueset")
+
+    def __init__(self, resource: dict):
+        expansion = resource.get("expansion") or {}
+        self.identifier = expansion.get("identifier")
+        self.timestamp = expansion.get("timestamp")
+        self.total = expansion.get("total")
+        self.offset = expansion.get("offset")
+        contains = expansion.get("contains") or []
+        self.top_level_count = len(contains)
+        self.concepts: list[Concept] = []
+        self._resource = resource
+        self._valueset = None
+
+        for entry, parent in flatten_contains(contains):
+            self.concepts.append(
+                Concept(
+                    entry.get("system"),
+                    entry.get("version"),
+                    entry.get("code"),
+                    entry.get("display"),
+                    entry.get("abstract", False),
+                    entry.get("inactive", False),
+                    parent,
+                )
+            )
+
+    @property
+    def valueset(self) -> ValueSet:
+        if self._valueset is None:
+            from .model import ValueSet
+
+            self._valueset = ValueSet.parse_obj(self._resource)
+        return self._valueset
+
+    def codings(self) -> Iterator[Coding]:
+        for concept in self.concepts:
+            yield concept.to_coding()
+
+    def __iter__(self) -> Iterator[Concept]:
+        return iter(self.concepts)
+
+    def __len__(self) -> int:
+        return len(self.concepts)
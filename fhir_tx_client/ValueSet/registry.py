@@ -0,0 +1,129 @@
+from __future__ import annotations
+from typing import TYPE_CHECKING, Iterable, Iterator
+from fhirpy.base.exceptions import OperationOutcome
+from fhir_tx_client.util import resource_identity
+from .client import SyncValueSet, _is_complete
+
+if TYPE_CHECKING:
+    from fhir_tx_client.data_types import Coding, CodeableConcept
+
+
+class ValueSetRegistry:
+    """Inverted index answering "which of these ValueSets contain this coding" in one lookup.
+
+    Each registered ValueSet gets a bit position; the selectable codes of its expansion map
+    (system, code) to an int bitset of the ValueSets containing them. Code versions are not
+    distinguished. ValueSets are added, refreshed and removed one at a time, touching only
+    their own codes; a refresh only the codes that changed. A ValueSet that cannot be
+    enumerated is still registered; codings not in its (truncated) expansion are checked
+    with `coding in valueset`."""
+
+    def __init__(self, valuesets: Iterable[SyncValueSet] = ()):
+        self._valuesets: list[SyncValueSet | None] = []  # by bit position
+        self._positions: dict[tuple, int] = {}
+        self._keys: list[frozenset | None] = []  # codes indexed for each position
+        self._members: dict[tuple[str | None, str], int] = {}
+        self._free: list[int] = []
+        self._remote = 0  # bitset of the ValueSets checked with the server
+        for valueset in valuesets:
+            self.add(valueset)
+
+    def add(self, valueset: SyncValueSet, **kwargs) -> bool:
+        """Expand `valueset` with the $expand parameters `kwargs` and index its codes. A ValueSet
+        registered already is refreshed: only the codes added or removed since are patched.
+        Returns False when it cannot be enumerated and is checked with the server instead."""
+        identity = resource_identity(valueset)
+        position = self._positions.get(identity)
+        try:
+            # a refresh asks the server, not the snapshot store
+            expansion = valueset._expand(kwargs, raw=True, use_snapshot=position is None)
+        except OperationOutcome:
+            expansion = None
+        if position is None:
+            position = self._free.pop() if self._free else len(self._valuesets)
+            if position == len(self._valuesets):
+                self._valuesets.append(None)
+                self._keys.append(None)
+            self._positions[identity] = position
+        self._valuesets[position] = valueset
+        bit = 1 << position
+        # the codes of a truncated expansion are members too, only the others need the server
+        keys = frozenset(
+            (concept.system, concept.code)
+            for concept in expansion or ()
+            if concept.code is not None and not concept.abstract
+        )
+        previous = self._keys[position] or frozenset()
+        self._keys[position] = keys
+        self._clear(previous - keys, bit)
+        members = self._members
+        for key in keys - previous:
+            members[key] = members.get(key, 0) | bit
+        if expansion is None or not _is_complete(expansion):
+            self._remote |= bit
+            return False
+        self._remote &= ~bit
+        return True
+
+    def _clear(self, keys: Iterable[tuple], bit: int):
+        mask = ~bit
+        members = self._members
+        for key in keys:
+            bits = members[key] & mask
+            if bits:
+                members[key] = bits
+            else:
+                del members[key]
+
+    def remove(self, valueset: SyncValueSet) -> bool:
+        """Unregister `valueset`; False if it was not registered"""
+        position = self._positions.pop(resource_identity(valueset), None)
+        if position is None:
+            return False
+        self._clear(self._keys[position], 1 << position)
+        self._remote &= ~(1 << position)
+        self._valuesets[position] = self._keys[position] = None
+        self._free.append(position)
+        return True
+
+    def refresh(self, valueset: SyncValueSet, **kwargs) -> bool:
+        """Re-expand a registered ValueSet and patch the codes that changed, see `add`"""
+        return self.add(valueset, **kwargs)
+
+    def memberships(self, __o: Coding | CodeableConcept) -> list[SyncValueSet]:
+        """The registered ValueSets containing a Coding, or any coding of a CodeableConcept"""
+        from fhir_tx_client.data_types import Coding, CodeableConcept
+
+        if isinstance(__o, Coding):
+            codings = (__o,)
+        elif isinstance(__o, CodeableConcept):
+            codings = __o.coding or ()
+        else:
+            raise NotImplementedError("Can only check for Coding objects.")
+        bits = 0
+        for coding in codings:
+            bits |= self._members.get((coding.system, coding.code), 0)
+        remote = self._remote & ~bits
+        while remote:
+            low = remote & -remote
+            if __o in self._valuesets[low.bit_length() - 1]:
+                bits |= low
+            remote ^= low
+        return self._decode(bits)
+
+    def _decode(self, bits: int) -> list[SyncValueSet]:
+        valuesets = []
+        while bits:
+            low = bits & -bits
+            valuesets.append(self._valuesets[low.bit_length() - 1])
+            bits ^= low
+        return valuesets
+
+    def __contains__(self, valueset: SyncValueSet) -> bool:
+        return resource_identity(valueset) in self._positions
+
+    def __iter__(self) -> Iterator[SyncValueSet]:
+        return (valueset for valueset in self._valuesets if valueset is not None)
+
+    def __len__(self) -> int:
+        return len(self._positions)
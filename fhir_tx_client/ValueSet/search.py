@@ -0,0 +1,179 @@
+import bisect
+import heapq
+import re
+import time
+import unicodedata
+from typing import Iterator
+from .lightweight import Concept, LightweightExpansion, flatten_contains
+
+_WORD = re.compile(r"\w+")
+
+Key = tuple[str | None, str | None, str]
+
+
+def normalize(text: str) -> str:
+    """Case- and accent-insensitive form of `text`"""
+    text = text.casefold()
+    if text.isascii():
+        return text
+    return "".join(c for c in unicodedata.normalize("NFKD", text) if not unicodedata.combining(c))
+
+
+def tokenize(text: str) -> list[str]:
+    return _WORD.findall(normalize(text))
+
+
+def _searchable(contains: list[dict]) -> Iterator[tuple[Key, dict]]:
+    for entry, _ in flatten_contains(contains):
+        if entry.get("code") is None or entry.get("abstract"):
+            continue
+        yield (entry.get("system"), entry.get("version"), entry["code"]), entry
+
+
+def _texts(entry: dict) -> tuple[str, ...]:
+    """Display and designation values of an expansion entry"""
+    texts = [entry.get("display") or ""]
+    texts.extend(designation["value"] for designation in entry.get("designation") or () if designation.get("value"))
+    return tuple(texts)
+
+
+class SearchIndex:
+    """In-process typeahead index over the selectable concepts of an expansion.
+
+    Every word of a concept's display and designations is indexed. A query matches the
+    concepts having, for each of its words, a word starting with it; or whose code equals
+    the query. Results rank an exact display first, then displays starting with the query,
+    then concepts matched on their display words, then on designations only, shorter
+    displays first. `update` applies a changed expansion by touching only what changed.
+    `max_age` (seconds) marks the index stale, like `MembershipIndex`."""
+
+    def __init__(self, expansion: LightweightExpansion | dict | None = None, max_age: float | None = None):
+        self.max_age = max_age
+        self.identifier = None
+        self.timestamp = None
+        self.built_at = time.monotonic()
+        self._concepts: list[Concept | None] = []
+        self._texts: list[tuple[str, ...] | None] = []
+        self._displays: list[str | None] = []  # normalized
+        self._display_words: list[tuple[str, ...] | None] = []
+        self._order: list[tuple | None] = []  # ties: shorter display first
+        self._ids: dict[Key, int] = {}
+        self._codes: dict[str, set[int]] = {}
+        self._postings: dict[str, set[int]] = {}
+        self._words: list[str] = []  # sorted keys of _postings
+        self._free: list[int] = []
+        if expansion is not None:
+            self.update(expansion)
+
+    def update(self, expansion: LightweightExpansion | dict) -> tuple[int, int, int]:
+        """Bring the index in line with `expansion`, an expanded ValueSet resource or its
+        `LightweightExpansion`. Returns the number of added, removed and changed concepts."""
+        if isinstance(expansion, LightweightExpansion):
+            expansion = expansion._resource
+        expansion = expansion.get("expansion") or {}
+        entries = dict(_searchable(expansion.get("contains") or []))
+        removed = [key for key in self._ids if key not in entries]
+        for key in removed:
+            self._remove(self._ids.pop(key))
+        added = changed = 0
+        for key, entry in entries.items():
+            texts = _texts(entry)
+            concept_id = self._ids.get(key)
+            if concept_id is not None:
+                if self._texts[concept_id] == texts:
+                    continue
+                self._remove(concept_id)
+                changed += 1
+            else:
+                added += 1
+            self._ids[key] = self._add(key, entry, texts)
+        self.identifier = expansion.get("identifier")
+        self.timestamp = expansion.get("timestamp")
+        self.built_at = time.monotonic()
+        return added, len(removed), changed
+
+    def is_stale(self) -> bool:
+        return self.max_age is not None and time.monotonic() - self.built_at > self.max_age
+
+    def touch(self):
+        self.built_at = time.monotonic()
+
+    def _add(self, key: Key, entry: dict, texts: tuple[str, ...]) -> int:
+        system, version, code = key
+        concept = Concept(system, version, code, entry.get("display"), False, entry.get("inactive", False))
+        display = normalize(texts[0])
+        fields = (concept, texts, display, tuple(_WORD.findall(display)), (len(texts[0]), texts[0], code))
+        if self._free:
+            concept_id = self._free.pop()
+        else:
+            concept_id = len(self._concepts)
+            for column in self._columns():
+                column.append(None)
+        for column, value in zip(self._columns(), fields):
+            column[concept_id] = value
+        self._codes.setdefault(code, set()).add(concept_id)
+        for word in {word for text in texts for word in tokenize(text)}:
+            postings = self._postings.get(word)
+            if postings is None:
+                postings = self._postings[word] = set()
+                bisect.insort(self._words, word)
+            postings.add(concept_id)
+        return concept_id
+
+    def _remove(self, concept_id: int):
+        concept = self._concepts[concept_id]
+        codes = self._codes[concept.code]
+        codes.discard(concept_id)
+        if not codes:
+            del self._codes[concept.code]
+        for word in {word for text in self._texts[concept_id] for word in tokenize(text)}:
+            postings = self._postings[word]
+            postings.discard(concept_id)
+            if not postings:
+                del self._postings[word]
+                del self._words[bisect.bisect_left(self._words, word)]
+        for column in self._columns():
+            column[concept_id] = None
+        self._free.append(concept_id)
+
+    def _columns(self) -> tuple[list, ...]:
+        return self._concepts, self._texts, self._displays, self._display_words, self._order
+
+    def _prefixed(self, prefix: str) -> set[int]:
+        """Concepts having a word that starts with `prefix`"""
+        start = bisect.bisect_left(self._words, prefix)
+        end = bisect.bisect_left(self._words, prefix + "\U0010ffff", start)
+        if end - start == 1:
+            return self._postings[self._words[start]]
+        return set().union(*(self._postings[word] for word in self._words[start:end]))
+
+    def _rank(self, concept_id: int, query: str, words: list[str], exact_codes: set[int]) -> tuple:
+        if concept_id in exact_codes:
+            rank = 0
+        else:
+            display = self._displays[concept_id]
+            if display == query:
+                rank = 1
+            elif display.startswith(query):
+                rank = 2
+            elif all(any(word.startswith(prefix) for word in self._display_words[concept_id]) for prefix in words):
+                rank = 3
+            else:
+                rank = 4
+        return rank, self._order[concept_id]
+
+    def search(self, text: str, limit: int = 20, offset: int = 0) -> list[Concept]:
+        """Concepts matching `text`, best first, from the `offset`-th on"""
+        words = tokenize(text)
+        exact_codes = self._codes.get(text.strip(), set())
+        matches = sorted((self._prefixed(prefix) for prefix in words), key=len)
+        candidates = matches[0].intersection(*matches[1:]) if matches else set()
+        candidates |= exact_codes
+        query = normalize(text.strip())
+        best = heapq.nsmallest(
+            offset + limit, candidates, key=lambda concept_id: self._rank(concept_id, query, words, exact_codes)
+        )
+        return [self._concepts[concept_id] for concept_id in best[offset:]]
+
+    def __len__(self) -> int:
+        return len(self._ids)
@@ -0,0 +1,144 @@
+import sys
+from array import array
+from typing import Iterator
+from .lightweight import LightweightExpansion, flatten_contains
+
+
+class ExpansionStore:
+    """Array-backed copy of a hierarchical ValueSet expansion.
+
+    Each entry of `expansion.contains` is a row; its columns are an interned system id,
+    an interned code, its parent row and its depth. Children are stored as offsets
+    into one flat array. A code that appears under several parents (polyhierarchy)
+    has one row per occurrence, chained through `_next_occurrence`.
+
+    Codes are looked up by `code`, optionally restricted to a `system`."""
+
+    def __init__(self, identifier: str | None = None, timestamp: str | None = None):
+        self.identifier = identifier
+        self.timestamp = timestamp
+        self._systems: list[str | None] = []
+        self._system_ids: dict[str | None, int] = {}
+        self._codes: list[str] = []
+        self._displays: list[str | None] = []
+        self._system_column = array("i")
+        self._parents = array("i")
+        self._depths = array("i")
+        self._next_occurrence = array("i")
+        self._first_occurrence: dict[tuple[int, str], int] = {}
+        self._last_occurrence: dict[tuple[int, str], int] = {}
+        self._child_offsets = array("i", [0])
+        self._children = array("i")
+
+    @classmethod
+    def from_resource(cls, resource: dict) -> "ExpansionStore":
+        """Build the store straight from the JSON of an expanded ValueSet"""
+        expansion = resource.get("expansion") or {}
+        store = cls(expansion.get("identifier"), expansion.get("timestamp"))
+        for entry, parent in flatten_contains(expansion.get("contains") or []):
+            store._append(entry.get("system"), entry.get("code"), entry.get("display"), parent)
+        store._build_children()
+        return store
+
+    @classmethod
+    def from_expansion(cls, expansion: LightweightExpansion) -> "ExpansionStore":
+        store = cls(expansion.identifier, expansion.timestamp)
+        for concept in expansion.concepts:
+            store._append(concept.system, concept.code, concept.display, concept.parent)
+        store._build_children()
+        return store
+
+    def _append(self, system, code, display, parent):
+        system_id = self._system_ids.get(system)
+        if system_id is None:
+            system_id = self._system_ids[system] = len(self._systems)
+            self._systems.append(system)
+        row = len(self._codes)
+        code = sys.intern(code) if code is not None else None
+        self._codes.append(code)
+        self._displays.append(display)
+        self._system_column.append(system_id)
+        self._parents.append(parent)
+        self._depths.append(self._depths[parent] + 1 if parent >= 0 else 0)
+        self._next_occurrence.append(-1)
+        key = (system_id, code)
+        if key in self._last_occurrence:
+            self._next_occurrence[self._last_occurrence[key]] = row
+        else:
+            self._first_occurrence[key] = row
+        self._last_occurrence[key] = row
+
+    def _build_children(self):
+        """Lay out the children of every row contiguously, indexed by `_child_offsets`"""
+        counts = array("i", bytes(4 * (len(self._codes) + 1)))
+        for parent in self._parents:
+            if parent >= 0:
+                counts[parent + 1] += 1
+        for row in range(len(self._codes)):
+            counts[row + 1] += counts[row]
+        self._child_offsets = counts
+        self._children = array("i", bytes(4 * counts[-1]))
+        fill = array("i", counts[:-1])
+        for row, parent in enumerate(self._parents):
+            if parent >= 0:
+                self._children[fill[parent]] = row
+                fill[parent] += 1
+        self._last_occurrence = {}
+
+    def _rows(self, code: str, system: str | None = None) -> Iterator[int]:
+        if system is not None:
+            system_ids = [self._system_ids[system]] if system in self._system_ids else []
+        else:
+            system_ids = range(len(self._systems))
+        for system_id in system_ids:
+            row = self._first_occurrence.get((system_id, code), -1)
+            while row >= 0:
+                yield row
+                row = self._next_occurrence[row]
+
+    def _rows_or_raise(self, code, system) -> list[int]:
+        rows = list(self._rows(code, system))
+        if not rows:
+            raise KeyError("Code %s is not in the expansion" % code)
+        return rows
+
+    def ancestors(self, code: str, system: str | None = None) -> set[str]:
+        """Codes of all entries that contain `code`, over every place it occurs in the hierarchy"""
+        result = set()
+        for row in self._rows_or_raise(code, system):
+            parent = self._parents[row]
+            while parent >= 0:
+                result.add(self._codes[parent])
+                parent = self._parents[parent]
+        return result
+
+    def descendants(self, code: str, system: str | None = None) -> set[str]:
+        """Codes of all entries nested below `code`"""
+        result = set()
+        stack = self._rows_or_raise(code, system)
+        while stack:
+            row = stack.pop()
+            children = self._children[self._child_offsets[row] : self._child_offsets[row + 1]]
+            for child in children:
+                result.add(self._codes[child])
+            stack.extend(children)
+        return result
+
+    def is_a(self, a: str, b: str, system: str | None = None) -> bool:
+        """Whether `a` is `b` or is nested below `b` in the expansion"""
+        if a == b:
+            return next(self._rows(a, system), None) is not None
+        return b in self.ancestors(a, system)
+
+    def depth(self, code: str, system: str | None = None) -> int:
+        """Shallowest level at which `code` occurs, 0 for top-level entries"""
+        return min(self._depths[row] for row in self._rows_or_raise(code, system))
+
+    def display(self, code: str, system: str | None = None) -> str | None:
+        return self._displays[self._rows_or_raise(code, system)[0]]
+
+    def __contains__(self, code: str) -> bool:
+        return next(self._rows(code), None) is not None
+
+    def __len__(self) -> int:
+        return len(self._codes)
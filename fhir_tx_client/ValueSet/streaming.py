@@ -0,0 +1,177 @@
+import codecs
+import json
+import re
+from typing import Iterable, Iterator
+from .lightweight import Concept, flatten_contains
+
+_WHITESPACE = re.compile(r"[ \t\n\r]*")
+_DECODER = json.JSONDecoder()
+
+
+class _Reader:
+    """Text of a UTF-8 byte stream, decoded incrementally into a buffer that only holds
+    what has not been consumed yet"""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self._chunks = iter(chunks)
+        self._decoder = codecs.getincrementaldecoder("utf-8")()
+        self.buffer = ""
+        self.pos = 0
+        self.eof = False
+
+    def fill(self) -> bool:
+        """Append the next chunk to the buffer; False at the end of the stream"""
+        if self.eof:
+            return False
+        chunk = next(self._chunks, None)
+        self.buffer = self.buffer[self.pos :] + (
+            self._decoder.decode(b"", final=True) if chunk is None else self._decoder.decode(chunk)
+        )
+        self.pos = 0
+        self.eof = chunk is None
+        return True
+
+    def peek(self) -> str:
+        """Skip whitespace and return the next character without consuming it"""
+        while True:
+            self.pos = _WHITESPACE.match(self.buffer, self.pos).end()
+            if self.pos < len(self.buffer):
+                return self.buffer[self.pos]
+            if not self.fill():
+                raise ValueError("Unexpected end of the JSON stream")
+
+    def expect(self, characters: str) -> str:
+        character = self.peek()
+        if character not in characters:
+            raise ValueError("Expected one of {0!r} at {1!r}".format(characters, self.buffer[self.pos : self.pos + 20]))
+        self.pos += 1
+        return character
+
+    def value(self):
+        """Decode the next complete JSON value"""
+        self.peek()
+        while True:
+            try:
+                value, end = _DECODER.raw_decode(self.buffer, self.pos)
+            except json.JSONDecodeError:
+                # Incomplete value: at least double the buffer before decoding it again
+                size = len(self.buffer) - self.pos
+                while len(self.buffer) - self.pos < 2 * size and self.fill():
+                    pass
+                if len(self.buffer) - self.pos == size:
+                    raise
+                continue
+            if end == len(self.buffer) and self.fill():
+                # a number may go on in the next chunk
+                continue
+            self.pos = end
+            return value
+
+
+def _members(reader: _Reader) -> Iterator[str]:
+    """Yield the keys of the JSON object at the reader; the caller consumes each value"""
+    reader.expect("{")
+    if reader.peek() == "}":
+        reader.pos += 1
+        return
+    while True:
+        key = reader.value()
+        reader.expect(":")
+        yield key
+        if reader.expect(",}") == "}":
+            return
+
+
+def iter_contains(chunks: Iterable[bytes], resource: dict) -> Iterator[dict]:
+    """Yield the top-level entries of `expansion.contains` of an expanded ValueSet read
+    from a stream of JSON bytes, one at a time. All other members are stored in `resource`
+    as they are read."""
+    reader = _Reader(chunks)
+    for key in _members(reader):
+        if key != "expansion":
+            resource[key] = reader.value()
+            continue
+        expansion = resource["expansion"] = {}
+        for expansion_key in _members(reader):
+            if expansion_key != "contains":
+                expansion[expansion_key] = reader.value()
+                continue
+            reader.expect("[")
+            if reader.peek() == "]":
+                reader.pos += 1
+                continue
+            while True:
+                yield reader.value()
+                if reader.expect(",]") == "]":
+                    break
+
+
+class StreamingExpansion:
+    """$expand result decoded while the response downloads, see `LightweightExpansion`.
+
+    Iterating yields the `Concept` records of `expansion.contains` in document order, as soon
+    as their top-level entry has arrived; only one top-level entry is held in memory.
+    It can be iterated once. The fields of the expansion are known once read, at the latest
+    after the iteration. Close it, or use it as a context manager, to release the connection
+    of a response that is not read to the end."""
+
+    def __init__(self, chunks: Iterable[bytes]):
+        self.resource: dict = {}
+        self._chunks = chunks
+        self._entries = iter_contains(chunks, self.resource)
+        self._count = 0
+
+    def close(self):
+        """Stop reading, and close the stream of chunks if it can be closed"""
+        self._entries.close()
+        close = getattr(self._chunks, "close", None)
+        if close is not None:
+            close()
+
+    def __enter__(self) -> "StreamingExpansion":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.close()
+
+    def _expansion_field(self, name: str):
+        return (self.resource.get("expansion") or {}).get(name)
+
+    @property
+    def identifier(self) -> str | None:
+        return self._expansion_field("identifier")
+
+    @property
+    def timestamp(self) -> str | None:
+        return self._expansion_field("timestamp")
+
+    @property
+    def total(self) -> int | None:
+        return self._expansion_field("total")
+
+    @property
+    def offset(self) -> int | None:
+        return self._expansion_field("offset")
+
+    def __iter__(self) -> Iterator[Concept]:
+        for entry in self._entries:
+            base = self._count
+            for child, parent in flatten_contains((entry,)):
+                self._count += 1
+                yield Concept(
+                    child.get("system"),
+                    child.get("version"),
+                    child.get("code"),
+                    child.get("display"),
+                    child.get("abstract", False),
+                    child.get("inactive", False),
+                    base + parent if parent >= 0 else -1,
+                )
+
+    def codings(self):
+        for concept in self:
+            yield concept.to_coding()
+
+    def __len__(self) -> int:
+        """Number of concepts read so far"""
+        return self._count
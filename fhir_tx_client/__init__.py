@@ -1 +1,8 @@
-from .client import SyncFHIRTerminologyClient
\ No newline at end of file
+from typing import TYPE_CHECKING
+from ._lazy import lazy_getattr
+
+if TYPE_CHECKING:
+    from .client import SyncFHIRTerminologyClient, AsyncFHIRTerminologyClient
+
+__all__ = ["SyncFHIRTerminologyClient", "AsyncFHIRTerminologyClient"]
+__getattr__ = lazy_getattr(__name__, dict.fromkeys(__all__, ".client"))
@@ -0,0 +1,3 @@
+from fhir_tx_client.cli import main
+
+main()
@@ -0,0 +1,17 @@
+import importlib
+from typing import Callable
+
+
+def lazy_getattr(package: str, attributes: dict[str, str]) -> Callable[[str], object]:
+    """Module `__getattr__` importing `attributes` (name -> relative module) on first access,
+    so that importing a package does not import its pydantic models and HTTP stack."""
+    namespace = importlib.import_module(package).__dict__
+
+    def __getattr__(name: str):
+        if name not in attributes:
+            raise AttributeError("module {0!r} has no attribute {1!r}".format(package, name))
+        value = getattr(importlib.import_module(attributes[name], package), name)
+        namespace[name] = value
+        return value
+
+    return __getattr__
@@ -0,0 +1,90 @@
+from typing import Callable, Hashable, Iterable, Iterator
+from fhirpy.base.exceptions import OperationOutcome
+from fhirpy.base.utils import AttrDict
+from fhir_tx_client.cache import MISSING
+from fhir_tx_client.util import params_json_to_dict, normalize_params
+
+def batch_bundle(path: str, params_list: list[dict]) -> dict:
+    """Build a FHIR batch Bundle that POSTs each Parameters resource to the operation at `path`"""
+    return {
+        "resourceType": "Bundle",
+        "type": "batch",
+        "entry": [
+            {"request": {"method": "POST", "url": path}, "resource": params}
+            for params in params_list
+        ],
+    }
+
+def batch_results(bundle: dict) -> list:
+    """Unpack a batch-response Bundle into the result Parameters of each entry, as a dictionary,
+    or an `OperationOutcome` exception for entries that failed. Entries keep the request order."""
+    results = []
+    for entry in bundle.get("entry", []):
+        response = entry.get("response", {})
+        resource = entry.get("resource") or response.get("outcome")
+        if response.get("status", "200").startswith("2") and resource is not None and resource.get("resourceType") == "Parameters":
+            results.append(params_json_to_dict(resource))
+        elif resource is not None and resource.get("resourceType") == "OperationOutcome":
+            results.append(OperationOutcome(resource=resource))
+        else:
+            results.append(OperationOutcome(reason="Batch entry failed with status %s" % response.get("status")))
+    return results
+
+
+class BatchPlan:
+    """Plan of a bulk operation: deduplicates the Parameters of its requests, answers what it
+    can from `cache` and packs the remaining requests in batch Bundles.
+
+    Send every bundle from `bundles()` and hand the response to `record()`, then `results()`
+    returns one result per request in input order. Results for which `is_negative` is true
+    are stored in the cache as negative entries."""
+
+    def __init__(
+        self,
+        path: str,
+        params_list: Iterable[dict],
+        identity: Hashable,
+        cache=None,
+        is_negative: Callable[[dict], bool] = lambda result: False,
+    ):
+        self.path = path
+        self.cache = cache
+        self.is_negative = is_negative
+        self._keys = []
+        self._results = {}
+        self._pending = {}
+        for params in params_list:
+            key = (identity, normalize_params(params))
+            self._keys.append(key)
+            if key in self._results or key in self._pending:
+                continue
+            cached = cache.get(key) if cache is not None else MISSING
+            if cached is not MISSING:
+                self._results[key] = AttrDict(cached)
+            else:
+                self._pending[key] = params
+
+    def bundles(self, batch_size: int) -> Iterator[tuple[list, dict]]:
+        """Yield the keys of a chunk of pending requests and the Bundle to send for them"""
+        pending_keys = list(self._pending)
+        for start in range(0, len(pending_keys), batch_size):
+            chunk = pending_keys[start : start + batch_size]
+            yield chunk, batch_bundle(self.path, [self._pending[key] for key in chunk])
+
+    def record(self, keys: list, bundle: dict):
+        """Store the results of the batch-response `bundle` sent for `keys`. Requests without
+        a response entry, e.g. when the server answered with an OperationOutcome, fail."""
+        results = batch_results(bundle) if (bundle or {}).get("resourceType") == "Bundle" else []
+        for position, key in enumerate(keys):
+            if position < len(results):
+                result = results[position]
+            else:
+                result = OperationOutcome(reason="No entry for this request in the batch response")
+            if self.cache is not None and not isinstance(result, OperationOutcome):
+                self.cache.put(key, result, negative=self.is_negative(result))
+                result = AttrDict(result)
+            self._results[key] = result
+            del self._pending[key]
+
+    def results(self) -> list:
+        return [self._results[key] for key in self._keys]
@@ -0,0 +1,84 @@
+import threading
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Any, Hashable
+
+MISSING = object()
+
+
+@dataclass
+class CacheStats:
+    """Counters of a cache, read them to tune its size and time-to-live"""
+
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    expirations: int = 0
+
+    @property
+    def hit_rate(self) -> float:
+        lookups = self.hits + self.misses
+        return self.hits / lookups if lookups else 0.0
+
+
+class LRUCache:
+    """Thread-safe, size-bounded LRU cache with a per-entry time-to-live.
+
+    Negative results (e.g. `result: false` of $validate-code) are only stored when
+    `cache_negative` is set; `negative_ttl` overrides `ttl` for them.
+    Any object with the same `get`/`put`/`clear` methods can be plugged into a client instead."""
+
+    def __init__(
+        self,
+        maxsize: int = 10_000,
+        ttl: float | None = None,
+        cache_negative=False,
+        negative_ttl: float | None = None,
+    ):
+        if maxsize < 1:
+            raise ValueError("maxsize must be at least 1")
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.cache_negative = cache_negative
+        self.negative_ttl = negative_ttl if negative_ttl is not None else ttl
+        self.stats = CacheStats()
+        self._entries: OrderedDict[Hashable, tuple[Any, float | None]] = OrderedDict()
+        self._lock = threading.Lock()
+
+    def get(self, key: Hashable) -> Any:
+        """Return the cached value for `key`, or `MISSING`"""
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                self.stats.misses += 1
+                return MISSING
+            value, expires_at = entry
+            if expires_at is not None and expires_at <= time.monotonic():
+                del self._entries[key]
+                self.stats.expirations += 1
+                self.stats.misses += 1
+                return MISSING
+            self._entries.move_to_end(key)
+            self.stats.hits += 1
+            return value
+
+    def put(self, key: Hashable, value: Any, negative=False):
+        if negative and not self.cache_negative:
+            return
+        ttl = self.negative_ttl if negative else self.ttl
+        expires_at = time.monotonic() + ttl if ttl is not None else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.maxsize:
+                self._entries.popitem(last=False)
+                self.stats.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self) -> int:
+        with self._lock:
+            return len(self._entries)
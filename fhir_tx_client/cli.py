@@ -0,0 +1,73 @@
+"""Command line interface.
+
+    fhir-tx validate --server https://tx.fhir.org/r4 --valueset modified-foodtype codes.txt
+"""
+import argparse
+import json
+import sys
+from fhir_tx_client.pipeline import (
+    SNOMED_CT,
+    DEFAULT_CHUNK_SIZE,
+    DEFAULT_WORKERS,
+    PipelineStats,
+    read_codes,
+    validate_stream,
+)
+
+
+def _report(stats: PipelineStats):
+    print(
+        "\r{0} codes, {1} validated, {2:.0f} codes/s".format(stats.processed, stats.validated, stats.rate),
+        end="",
+        file=sys.stderr,
+    )
+
+
+def validate(args):
+    from fhir_tx_client import SyncFHIRTerminologyClient
+
+    client = SyncFHIRTerminologyClient(args.server)
+    if args.valueset:
+        valueset = client.ValueSet(id=args.valueset)
+    else:
+        valueset = client.ValueSet(url=args.url)
+    stream = sys.stdin if args.input == "-" else open(args.input, newline="")
+    with stream:
+        results = validate_stream(
+            valueset,
+            read_codes(stream, args.format, args.column),
+            system=args.system,
+            chunk_size=args.chunk_size,
+            workers=args.workers,
+            progress=None if args.quiet else _report,
+        )
+        for coding, result in results:
+            print(json.dumps({"system": coding.system, "code": coding.code, "result": result}))
+    if not args.quiet:
+        print(file=sys.stderr)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(prog="fhir-tx", description="FHIR terminology client")
+    commands = parser.add_subparsers(dest="command", required=True)
+
+    parser_validate = commands.add_parser("validate", help="Validate a stream of codes against a ValueSet")
+    parser_validate.add_argument("input", help="File with codes, - for stdin")
+    parser_validate.add_argument("--server", required=True, help="Base URL of the terminology server")
+    target = parser_validate.add_mutually_exclusive_group(required=True)
+    target.add_argument("--valueset", help="ValueSet id")
+    target.add_argument("--url", help="ValueSet canonical url")
+    parser_validate.add_argument("--format", choices=["lines", "csv", "ndjson"], default="lines")
+    parser_validate.add_argument("--column", default="code", help="CSV column or NDJSON key with the code")
+    parser_validate.add_argument("--system", default=SNOMED_CT, help="Code system of plain codes")
+    parser_validate.add_argument("--chunk-size", type=int, default=DEFAULT_CHUNK_SIZE)
+    parser_validate.add_argument("--workers", type=int, default=DEFAULT_WORKERS)
+    parser_validate.add_argument("--quiet", action="store_true", help="Do not report progress")
+    parser_validate.set_defaults(func=validate)
+
+    args = parser.parse_args(argv)
+    args.func(args)
+
+
+if __name__ == "__main__":
+    main()
@@ -1,12 +1,187 @@
-from fhirpy.base import SyncClient
-from fhirpy.lib import SyncFHIRSearchSet, SyncFHIRResource, SyncFHIRReference
-from fhir_tx_client.ValueSet import SyncValueSet 
+import asyncio
+import json
+from contextlib import nullcontext
+from json import JSONDecodeError
+from typing import Awaitable, Iterable, Iterator
+import requests
+from fhirpy.base.exceptions import ResourceNotFound, OperationOutcome
+from fhirpy.base.utils import AttrDict
+from fhirpy.base import SyncClient, AsyncClient
+from fhirpy.lib import (
+    SyncFHIRSearchSet,
+    SyncFHIRResource,
+    SyncFHIRReference,
+    AsyncFHIRSearchSet,
+    AsyncFHIRResource,
+    AsyncFHIRReference,
+)
+from fhir_tx_client.ValueSet import SyncValueSet, AsyncValueSet
+from fhir_tx_client.ValueSet.registry import ValueSetRegistry
+from fhir_tx_client.CodeSystem import SyncCodeSystem, AsyncCodeSystem
+from fhir_tx_client.ConceptMap import SyncConceptMap
+from fhir_tx_client.cache import LRUCache, MISSING
+from fhir_tx_client.snapshot import SnapshotStore
+from fhir_tx_client.singleflight import SingleFlight, AsyncSingleFlight
+from fhir_tx_client.instrumentation import Instrumentation, measure
+from fhir_tx_client.routing import ReplicaRouter, is_idempotent
+from fhir_tx_client.scheduler import RequestScheduler, endpoint_of
+
+STREAM_CHUNK_SIZE = 64 * 1024
+
+
+class StreamedBody:
+    """Body of a streamed response, iterated as byte chunks read from the connection.
+    Reading it to the end, or closing it, returns the connection to the pool."""
+
+    def __init__(self, response: requests.Response):
+        self.response = response
+
+    def __iter__(self) -> Iterator[bytes]:
+        with self.response:
+            yield from self.response.iter_content(STREAM_CHUNK_SIZE)
+
+    def close(self):
+        self.response.close()
+
 
 class SyncFHIRTerminologyClient(SyncClient):
+    """FHIR client restricted to terminology resources.
+
+    Pass an `LRUCache` (or an object with the same interface) as `validate_code_cache`
+    to memoize $validate-code results across all resources of this client, and as
+    `lookup_cache` to memoize CodeSystem $lookup and $subsumes results.
+    With a `snapshot_store`, $expand results are shared with other processes through disk.
+    With a `validator_cache`, responses carrying an `ETag` or `Last-Modified` header are
+    remembered and requested again conditionally; a `304 Not Modified` returns the
+    remembered response, decoded afresh, without transferring the body again.
+    Concurrent identical $expand, $validate-code and $lookup calls from several threads
+    share one request, unless `coalesce` is disabled.
+    An `instrumentation` (see `fhir_tx_client.instrumentation`) receives timed spans of
+    each operation and its phases, payload sizes and cache lookups.
+    With a `router`, requests are spread over the replicas of the service behind `url`,
+    see `ReplicaRouter`.
+    With a `scheduler`, requests wait for their turn by priority, within rate limits and
+    an in-flight cap, so that bulk calls yield to interactive ones, see `RequestScheduler`.
+    Each request sent to a replica, retries and hedges included, counts against those."""
+
     ALLOWED_TYPES = {"ValueSet", "CodeSystem", "ConceptMap"}
     searchset_class = SyncFHIRSearchSet
     resource_class = SyncFHIRResource
 
+    def __init__(
+        self,
+        url,
+        authorization=None,
+        extra_headers=None,
+        requests_config=None,
+        validate_code_cache: LRUCache | None = None,
+        snapshot_store: SnapshotStore | None = None,
+        validator_cache: LRUCache | None = None,
+        lookup_cache: LRUCache | None = None,
+        coalesce=True,
+        instrumentation: Instrumentation | None = None,
+        router: ReplicaRouter | None = None,
+        scheduler: RequestScheduler | None = None,
+    ):
+        self.validate_code_cache = validate_code_cache
+        self.lookup_cache = lookup_cache
+        self.single_flight = SingleFlight() if coalesce else None
+        self.instrumentation = instrumentation
+        self.router = router
+        self.scheduler = scheduler
+        self.snapshot_store = snapshot_store
+        self.validator_cache = validator_cache
+        super().__init__(url, authorization, extra_headers, requests_config)
+
+    def _do_request(self, method, path, data=None, params=None):
+        headers = self._build_request_headers()
+        url = self._build_request_url(path, params)
+        cache = self.validator_cache
+        cached = MISSING
+        if cache is not None:
+            key = (method.upper(), url, json.dumps(data, sort_keys=True) if data is not None else None)
+            cached = cache.get(key)
+            if cached is not MISSING:
+                etag, last_modified, _ = cached
+                if etag:
+                    headers["If-None-Match"] = etag
+                if last_modified:
+                    headers["If-Modified-Since"] = last_modified
+        instrumentation = self.instrumentation
+        r = self._send(method, path, url, data, headers)
+
+        if cached is not MISSING and instrumentation is not None:
+            instrumentation.cache_lookup("validator", r.status_code == 304)
+        if r.status_code == 304 and cached is not MISSING:
+            # decode the remembered body again, callers keep and may alter what they receive
+            return self._decode(cached[2])
+
+        if 200 <= r.status_code < 300:
+            etag, last_modified = r.headers.get("ETag"), r.headers.get("Last-Modified")
+            if cache is not None and (etag or last_modified):
+                cache.put(key, (etag, last_modified, r.content))
+            return self._decode(r.content)
+
+        self._raise_for_response(r)
+
+    def _decode(self, content: bytes):
+        with measure(self.instrumentation, "decode"):
+            return json.loads(content.decode(), object_hook=AttrDict) if content else None
+
+    def _slot(self, path):
+        """Wait for the scheduler, if any, to let a request to `path` start"""
+        if self.scheduler is None:
+            return nullcontext()
+        return self.scheduler.slot(endpoint_of(path), self.instrumentation)
+
+    def _send(self, method, path, url, data, headers, **kwargs) -> requests.Response:
+        # the arguments of the call win over the client's `requests_config`
+        config = {**self.requests_config, **kwargs}
+
+        def attempt(target):
+            # every HTTP request, retries and hedges included, takes its own scheduler slot
+            with self._slot(path), measure(self.instrumentation, "network", method=method.upper()) as span:
+                r = requests.request(method, target, json=data, headers=headers, **config)
+                span.set_attribute("status", r.status_code)
+                span.set_attribute("request_bytes", len(r.request.body or b""))
+                if not config.get("stream"):
+                    span.set_attribute("response_bytes", len(r.content))
+            return r
+
+        if self.router is None:
+            return attempt(url)
+        # `url` keeps the primary base url, so cache keys are the same for all replicas
+        relative = url[len(self.url.rstrip("/")):]
+        return self.router.send(
+            lambda base: attempt(base + relative),
+            idempotent=is_idempotent(method, path, data),
+        )
+
+    @staticmethod
+    def _raise_for_response(r: requests.Response):
+        if r.status_code == 404 or r.status_code == 410:
+            raise ResourceNotFound(r.content.decode())
+
+        data = r.content.decode()
+        try:
+            parsed_data = json.loads(data)
+            if parsed_data["resourceType"] == "OperationOutcome":
+                raise OperationOutcome(resource=parsed_data)
+            raise OperationOutcome(reason=data)
+        except (KeyError, JSONDecodeError):
+            raise OperationOutcome(reason=data)
+
+    def _stream_request(self, method, path, data=None, params=None) -> "StreamedBody":
+        """Send a request like `_do_request`, but return the body of a successful response
+        as byte chunks read from the connection as they arrive, see `StreamedBody`"""
+        url = self._build_request_url(path, params)
+        # the slot is held until the response starts, not while the body downloads
+        r = self._send(method, path, url, data, self._build_request_headers(), stream=True)
+        if not 200 <= r.status_code < 300:
+            with r:
+                self._raise_for_response(r)
+        return StreamedBody(r)
+
     def reference(self, resource_type=None, id=None, reference=None, **kwargs):
         if resource_type and id:
             reference = "{0}/{1}".format(resource_type, id)
@@ -26,7 +201,96 @@ class SyncFHIRTerminologyClient(SyncClient):
             )
         if resource_type == "ValueSet":
             return SyncValueSet(self, resource_type=resource_type, **kwargs)
+        if resource_type == "CodeSystem":
+            return SyncCodeSystem(self, resource_type=resource_type, **kwargs)
+        if resource_type == "ConceptMap":
+            return SyncConceptMap(self, resource_type=resource_type, **kwargs)
         return super().resource(resource_type, **kwargs)
-    
+
     def ValueSet(self, **kwargs):
-        return SyncValueSet(self, "ValueSet", **kwargs)
\ No newline at end of file
+        return SyncValueSet(self, "ValueSet", **kwargs)
+
+    def CodeSystem(self, **kwargs):
+        return SyncCodeSystem(self, "CodeSystem", **kwargs)
+
+    def ConceptMap(self, **kwargs):
+        return SyncConceptMap(self, "ConceptMap", **kwargs)
+
+    def valueset_registry(self, ids: Iterable[str] = ()) -> ValueSetRegistry:
+        """A `ValueSetRegistry` over the ValueSets with the given ids"""
+        return ValueSetRegistry(self.ValueSet(id=id) for id in ids)
+
+
+class AsyncFHIRTerminologyClient(AsyncClient):
+    """Asyncio counterpart of `SyncFHIRTerminologyClient`.
+
+    `max_concurrency` bounds how many awaitables `gather` keeps in flight.
+    Concurrent identical calls from several tasks share one request, unless `coalesce` is disabled."""
+
+    ALLOWED_TYPES = {"ValueSet", "CodeSystem", "ConceptMap"}
+    DEFAULT_MAX_CONCURRENCY = 16
+    searchset_class = AsyncFHIRSearchSet
+    resource_class = AsyncFHIRResource
+
+    def __init__(
+        self,
+        url,
+        authorization=None,
+        extra_headers=None,
+        aiohttp_config=None,
+        max_concurrency=DEFAULT_MAX_CONCURRENCY,
+        validate_code_cache: LRUCache | None = None,
+        lookup_cache: LRUCache | None = None,
+        coalesce=True,
+    ):
+        if max_concurrency < 1:
+            raise ValueError("max_concurrency must be at least 1")
+        self.max_concurrency = max_concurrency
+        self.validate_code_cache = validate_code_cache
+        self.lookup_cache = lookup_cache
+        self.single_flight = AsyncSingleFlight() if coalesce else None
+        super().__init__(url, authorization, extra_headers, aiohttp_config)
+
+    def reference(self, resource_type=None, id=None, reference=None, **kwargs):
+        if resource_type and id:
+            reference = "{0}/{1}".format(resource_type, id)
+
+        if not reference:
+            raise TypeError(
+                "Arguments `resource_type` and `id` or `reference` " "are required"
+            )
+        return AsyncFHIRReference(self, reference=reference, **kwargs)
+
+    def resource(self, resource_type=None, **kwargs):
+        if resource_type not in self.ALLOWED_TYPES:
+            raise TypeError(
+                "Resource type `{}` is not allowed. Allowed types: {}".format(
+                    resource_type, ", ".join(self.ALLOWED_TYPES)
+                )
+            )
+        if resource_type == "ValueSet":
+            return AsyncValueSet(self, resource_type=resource_type, **kwargs)
+        if resource_type == "CodeSystem":
+            return AsyncCodeSystem(self, resource_type=resource_type, **kwargs)
+        return super().resource(resource_type, **kwargs)
+
+    def ValueSet(self, **kwargs):
+        return AsyncValueSet(self, "ValueSet", **kwargs)
+
+    def CodeSystem(self, **kwargs):
+        return AsyncCodeSystem(self, "CodeSystem", **kwargs)
+
+    async def gather(
+        self, *aws: Awaitable, limit: int | None = None, return_exceptions=False
+    ) -> list:
+        """Like `asyncio.gather`, but with at most `limit` (default: `max_concurrency`)
+        awaitables running at the same time. Results keep the order of `aws`."""
+        semaphore = asyncio.Semaphore(limit or self.max_concurrency)
+
+        async def run(aw):
+            async with semaphore:
+                return await aw
+
+        return await asyncio.gather(
+            *(run(aw) for aw in aws), return_exceptions=return_exceptions
+        )
@@ -0,0 +1,214 @@
+import bisect
+import threading
+import time
+from collections import defaultdict
+from contextvars import ContextVar
+from typing import Any
+
+# Attributes of the enclosing span, inherited by the spans opened inside it
+_ATTRIBUTES: ContextVar[dict] = ContextVar("fhir_tx_span_attributes", default={})
+
+# Upper bounds (seconds) of the latency histogram buckets: 0.1 ms doubling up to about 100 s
+LATENCY_BUCKETS = tuple(0.0001 * 2**i for i in range(21))
+
+
+class Instrumentation:
+    """Receives the spans and cache lookups of a client. All hooks do nothing, override the
+    ones you need and pass an instance as the client's `instrumentation`.
+
+    Each terminology operation is a span named after it (`$expand`, `$validate-code`, ...)
+    holding the spans of its phases: `encode` (building the Parameters), `network`,
+    `decode` (JSON) and `parse` (building the result objects). Spans carry the attributes
+    `operation` and `valueset` (or `codesystem`), `network` spans `request_bytes`,
+    `response_bytes` and `status`."""
+
+    def start(self, span: "Span"):
+        pass
+
+    def end(self, span: "Span", error: BaseException | None):
+        pass
+
+    def cache_lookup(self, cache: str, hit: bool):
+        """A lookup in one of the client's caches: `validate_code`, `lookup`, `snapshot` or `validator`"""
+        pass
+
+
+class Span:
+    """A timed section of a terminology operation, use it as a context manager"""
+
+    __slots__ = ("instrumentation", "name", "attributes", "started_at", "duration", "handle", "_token")
+
+    def __init__(self, instrumentation: Instrumentation, name: str, attributes: dict):
+        self.instrumentation = instrumentation
+        self.name = name
+        self.attributes = {**_ATTRIBUTES.get(), **attributes}
+        self.started_at = None
+        self.duration = None
+        self.handle = None  # free for the instrumentation, e.g. a tracer's span
+
+    def set_attribute(self, key: str, value: Any):
+        self.attributes[key] = value
+
+    def __enter__(self) -> "Span":
+        self._token = _ATTRIBUTES.set(self.attributes)
+        self.instrumentation.start(self)
+        self.started_at = time.perf_counter()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.duration = time.perf_counter() - self.started_at
+        _ATTRIBUTES.reset(self._token)
+        self.instrumentation.end(self, exc)
+
+
+class _NullSpan:
+    __slots__ = ()
+
+    def set_attribute(self, key: str, value: Any):
+        pass
+
+    def __enter__(self) -> "_NullSpan":
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        pass
+
+
+NULL_SPAN = _NullSpan()
+
+
+def measure(instrumentation: Instrumentation | None, name: str, **attributes) -> Span | _NullSpan:
+    """Span `name` reported to `instrumentation`, or a shared no-op span when there is none"""
+    if instrumentation is None:
+        return NULL_SPAN
+    return Span(instrumentation, name, attributes)
+
+
+class Histogram:
+    """Latency histogram with fixed exponential buckets"""
+
+    __slots__ = ("counts", "count", "sum", "min", "max")
+
+    def __init__(self):
+        self.counts = [0] * (len(LATENCY_BUCKETS) + 1)
+        self.count = 0
+        self.sum = 0.0
+        self.min = None
+        self.max = None
+
+    def observe(self, value: float):
+        self.counts[bisect.bisect_left(LATENCY_BUCKETS, value)] += 1
+        self.count += 1
+        self.sum += value
+        self.min = value if self.min is None else min(self.min, value)
+        self.max = value if self.max is None else max(self.max, value)
+
+    @property
+    def mean(self) -> float:
+        return self.sum / self.count if self.count else 0.0
+
+    def quantile(self, q: float) -> float:
+        """Upper bound of the bucket holding the `q` quantile, capped by the largest observation"""
+        if not self.count:
+            return 0.0
+        rank = q * self.count
+        seen = 0
+        for bound, count in zip(LATENCY_BUCKETS, self.counts):
+            seen += count
+            if seen >= rank:
+                return min(bound, self.max)
+        return self.max
+
+    def to_dict(self) -> dict:
+        return {
+            "count": self.count,
+            "sum": self.sum,
+            "min": self.min,
+            "max": self.max,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+class MetricsCollector(Instrumentation):
+    """Aggregates spans into latency histograms per (span, operation, resource), payload
+    byte counts per operation and hit ratios per cache. Thread-safe."""
+
+    def __init__(self):
+        self.latency: defaultdict[tuple, Histogram] = defaultdict(Histogram)
+        self.request_bytes: defaultdict[str, int] = defaultdict(int)
+        self.response_bytes: defaultdict[str, int] = defaultdict(int)
+        self.cache_hits: defaultdict[str, int] = defaultdict(int)
+        self.cache_misses: defaultdict[str, int] = defaultdict(int)
+        self._lock = threading.Lock()
+
+    def end(self, span: Span, error: BaseException | None):
+        attributes = span.attributes
+        operation = attributes.get("operation")
+        resource = attributes.get("valueset") or attributes.get("codesystem")
+        with self._lock:
+            self.latency[(span.name, operation, resource)].observe(span.duration)
+            if span.name == "network":
+                self.request_bytes[operation] += attributes.get("request_bytes", 0)
+                self.response_bytes[operation] += attributes.get("response_bytes", 0)
+
+    def cache_lookup(self, cache: str, hit: bool):
+        with self._lock:
+            if hit:
+                self.cache_hits[cache] += 1
+            else:
+                self.cache_misses[cache] += 1
+
+    def hit_ratio(self, cache: str) -> float:
+        hits = self.cache_hits.get(cache, 0)
+        lookups = hits + self.cache_misses.get(cache, 0)
+        return hits / lookups if lookups else 0.0
+
+    def snapshot(self) -> dict:
+        """All metrics as plain, JSON-serializable data"""
+        with self._lock:
+            return {
+                "latency": [
+                    {"span": name, "operation": operation, "resource": resource, **histogram.to_dict()}
+                    for (name, operation, resource), histogram in self.latency.items()
+                ],
+                "request_bytes": dict(self.request_bytes),
+                "response_bytes": dict(self.response_bytes),
+                "cache_hit_ratio": {
+                    cache: self.hit_ratio(cache) for cache in set(self.cache_hits) | set(self.cache_misses)
+                },
+            }
+
+    def reset(self):
+        with self._lock:
+            self.latency.clear()
+            self.request_bytes.clear()
+            self.response_bytes.clear()
+            self.cache_hits.clear()
+            self.cache_misses.clear()
+
+
+class TracerInstrumentation(Instrumentation):
+    """Reports spans to an OpenTelemetry `Tracer`, nested as they happen.
+
+        from opentelemetry import trace
+        client = SyncFHIRTerminologyClient(url, instrumentation=TracerInstrumentation(trace.get_tracer("fhir-tx")))
+    """
+
+    def __init__(self, tracer, prefix: str = "fhir.tx."):
+        self.tracer = tracer
+        self.prefix = prefix
+
+    def start(self, span: Span):
+        context = self.tracer.start_as_current_span(self.prefix + span.name)
+        span.handle = (context, context.__enter__())
+
+    def end(self, span: Span, error: BaseException | None):
+        context, tracer_span = span.handle
+        for key, value in span.attributes.items():
+            if value is not None:
+                tracer_span.set_attribute(self.prefix + key, value)
+        if error is not None:
+            tracer_span.record_exception(error)
+        context.__exit__(None, None, None)
@@ -0,0 +1,124 @@
+from __future__ import annotations
+import csv
+import json
+import time
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+from typing import TYPE_CHECKING, Callable, Iterable, Iterator, TextIO
+from fhir_tx_client.cache import LRUCache, MISSING
+
+if TYPE_CHECKING:
+    from fhir_tx_client.data_types import Coding
+
+SNOMED_CT = "http://snomed.info/sct"
+DEFAULT_CHUNK_SIZE = 500
+DEFAULT_WORKERS = 4
+DEFAULT_MEMORY = 100_000
+
+
+@dataclass
+class PipelineStats:
+    """Progress of a `validate_stream` run"""
+
+    processed: int = 0
+    validated: int = 0
+    started_at: float = field(default_factory=time.monotonic)
+
+    @property
+    def elapsed(self) -> float:
+        return time.monotonic() - self.started_at
+
+    @property
+    def rate(self) -> float:
+        """Processed codes per second"""
+        return self.processed / self.elapsed if self.elapsed else 0.0
+
+
+def read_codes(stream: TextIO, format: str = "lines", column: str = "code") -> Iterator[str | dict]:
+    """Read codes from a text stream: one token per line (`lines`), the `column` of a CSV
+    file with a header (`csv`), or one JSON object per line with the code under `column`
+    (`ndjson`). Blank lines, and rows or objects without a code, are skipped."""
+    if format == "lines":
+        for line in stream:
+            if line.strip():
+                yield line.strip()
+    elif format == "csv":
+        for row in csv.DictReader(stream):
+            if row.get(column):
+                yield row[column]
+    elif format == "ndjson":
+        for line in stream:
+            if line.strip():
+                item = json.loads(line)
+                if item.get(column):
+                    # `parse_code` reads the code from the `code` key
+                    yield item if column == "code" else {**item, "code": item[column]}
+    else:
+        raise ValueError("Unknown format %s, expected lines, csv or ndjson" % format)
+
+
+def parse_code(item: str | dict | Coding, system: str = SNOMED_CT) -> Coding:
+    """Turn a token into a Coding. SNOMED CT tokens may carry a display: `102263004 |Eggs (edible)|`"""
+    from fhir_tx_client.data_types import Coding, SCTCoding
+
+    if isinstance(item, Coding):
+        return item
+    if isinstance(item, dict):
+        return Coding(system=item.get("system", system), code=item["code"], display=item.get("display"))
+    if system == SNOMED_CT:
+        return SCTCoding.from_sct_code(item)
+    return Coding(system=system, code=item.strip())
+
+
+def validate_stream(
+    valueset,
+    items: Iterable[str | dict | Coding],
+    system: str = SNOMED_CT,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+    workers: int = DEFAULT_WORKERS,
+    memory: int = DEFAULT_MEMORY,
+    progress: Callable[[PipelineStats], None] | None = None,
+) -> Iterator[tuple[Coding, bool | None]]:
+    """Validate a stream of codes against a `SyncValueSet` and yield `(coding, result)` in input order.
+
+    Input is consumed in windows of `chunk_size * workers` codes. Codes already seen (the last
+    `memory` unique ones) are answered without a request; the rest of a window is sent as
+    `workers` concurrent `contains_many` chunks. A result is None when validating the code failed.
+    `progress` is called with the running `PipelineStats` after each window."""
+    known = LRUCache(maxsize=memory, cache_negative=True)
+    stats = PipelineStats()
+    window_size = chunk_size * workers
+    items = iter(items)
+
+    with ThreadPoolExecutor(max_workers=workers) as executor:
+        while True:
+            window = [parse_code(item, system) for _, item in zip(range(window_size), items)]
+            if not window:
+                break
+            results = {}
+            unknown = {}
+            for coding in window:
+                key = (coding.system, coding.version, coding.code)
+                if key in results or key in unknown:
+                    continue
+                result = known.get(key)
+                if result is MISSING:
+                    unknown[key] = coding
+                else:
+                    results[key] = result
+            keys = list(unknown)
+            chunks = [keys[start : start + chunk_size] for start in range(0, len(keys), chunk_size)]
+            futures = [
+                executor.submit(valueset.contains_many, [unknown[key] for key in chunk]) for chunk in chunks
+            ]
+            for chunk, future in zip(chunks, futures):
+                for key, result in zip(chunk, future.result()):
+                    results[key] = result
+                    if result is not None:
+                        known.put(key, result, negative=not result)
+            stats.processed += len(window)
+            stats.validated += len(keys)
+            for coding in window:
+                yield coding, results[(coding.system, coding.version, coding.code)]
+            if progress is not None:
+                progress(stats)
@@ -0,0 +1,207 @@
+import contextvars
+import random
+import threading
+import time
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ThreadPoolExecutor, wait
+from typing import Callable
+import requests
+
+IDEMPOTENT_OPERATIONS = {"$expand", "$validate-code", "$lookup", "$subsumes", "$translate"}
+# Responses worth another attempt on another replica
+RETRY_STATUSES = {429, 502, 503, 504}
+RETRY_ERRORS = (requests.ConnectionError, requests.Timeout)
+
+
+def is_idempotent(method: str, path: str, data: dict | None = None) -> bool:
+    """Whether a request can safely be sent more than once: reads, terminology operations,
+    and batch Bundles made of those only"""
+    if method.upper() == "GET":
+        return True
+    if method.upper() != "POST":
+        return False
+    if path.split("?")[0].rstrip("/").rsplit("/", 1)[-1] in IDEMPOTENT_OPERATIONS:
+        return True
+    if data and data.get("resourceType") == "Bundle" and data.get("type") == "batch":
+        return all(is_idempotent(entry["request"]["method"], entry["request"]["url"]) for entry in data.get("entry", []))
+    return False
+
+
+def _close_response(future):
+    """Close the response of a request that lost a hedge"""
+    if not future.cancelled() and future.exception() is None:
+        future.result().close()
+
+
+class Replica:
+    """One endpoint of a replicated terminology service and its observed health"""
+
+    def __init__(self, url: str, window: int = 100, alpha: float = 0.2):
+        self.url = url.rstrip("/")
+        self.alpha = alpha
+        self.latency: float | None = None  # exponentially weighted moving average, in seconds
+        self.samples: deque[float] = deque(maxlen=window)
+        self.requests = 0
+        self.failures = 0
+        self.consecutive_failures = 0
+        self.unhealthy_until = 0.0
+
+    def record(self, seconds: float, ok: bool):
+        self.requests += 1
+        if ok:
+            self.samples.append(seconds)
+            self.latency = seconds if self.latency is None else self.alpha * seconds + (1 - self.alpha) * self.latency
+            self.consecutive_failures = 0
+        else:
+            self.failures += 1
+            self.consecutive_failures += 1
+
+    def quantile(self, q: float) -> float | None:
+        if not self.samples:
+            return None
+        ordered = sorted(self.samples)
+        return ordered[min(len(ordered) - 1, int(q * len(ordered)))]
+
+    @property
+    def healthy(self) -> bool:
+        return self.unhealthy_until <= time.monotonic()
+
+    def stats(self) -> dict:
+        return {
+            "url": self.url,
+            "healthy": self.healthy,
+            "requests": self.requests,
+            "failures": self.failures,
+            "latency": self.latency,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+        }
+
+
+class ReplicaRouter:
+    """Spreads the requests of a client over replicas of the same terminology service.
+
+    Each request goes to the healthy replica with the lowest observed latency; replicas
+    without measurements are tried first. Idempotent requests (see `is_idempotent`) that
+    fail with a connection error or a 429/502/503/504 are retried up to `retries` times on
+    another replica, after a jittered exponential backoff starting at `backoff` seconds.
+    With `hedge`, an idempotent request still running after the replica's `hedge_quantile`
+    latency is sent to a second replica as well, and the first good response wins.
+    A replica failing `max_failures` times in a row is skipped for `cooldown` seconds."""
+
+    def __init__(
+        self,
+        urls: list[str],
+        retries: int = 2,
+        backoff: float = 0.1,
+        max_backoff: float = 2.0,
+        hedge=False,
+        hedge_quantile: float = 0.95,
+        min_samples: int = 20,
+        max_failures: int = 3,
+        cooldown: float = 30.0,
+    ):
+        if not urls:
+            raise ValueError("At least one replica url is required")
+        self.replicas = [Replica(url) for url in urls]
+        self.retries = retries
+        self.backoff = backoff
+        self.max_backoff = max_backoff
+        self.hedge = hedge
+        self.hedge_quantile = hedge_quantile
+        self.min_samples = min_samples
+        self.max_failures = max_failures
+        self.cooldown = cooldown
+        self.hedged = 0
+        self._lock = threading.Lock()
+        self._executor = ThreadPoolExecutor(thread_name_prefix="fhir-tx-hedge") if hedge else None
+
+    def choose(self, exclude=()) -> Replica:
+        with self._lock:
+            candidates = [replica for replica in self.replicas if replica not in exclude] or self.replicas
+            healthy = [replica for replica in candidates if replica.healthy] or candidates
+            return min(healthy, key=lambda replica: replica.latency or 0.0)
+
+    def record(self, replica: Replica, seconds: float, ok: bool):
+        with self._lock:
+            replica.record(seconds, ok)
+            if replica.consecutive_failures >= self.max_failures:
+                replica.unhealthy_until = time.monotonic() + self.cooldown
+
+    def send(self, request: Callable[[str], requests.Response], idempotent: bool) -> requests.Response:
+        """Call `request` with the base url of a replica, retrying and hedging as configured"""
+        attempts = self.retries + 1 if idempotent else 1
+        tried = []
+        error = None
+        for attempt in range(attempts):
+            if attempt:
+                time.sleep(random.uniform(0, min(self.max_backoff, self.backoff * 2 ** (attempt - 1))))
+            replica = self.choose(exclude=tried)
+            tried.append(replica)
+            try:
+                if idempotent and self.hedge:
+                    response = self._send_hedged(request, replica, tried)
+                else:
+                    response = self._send(request, replica)
+            except RETRY_ERRORS as exc:
+                error = exc
+                continue
+            if response.status_code not in RETRY_STATUSES or attempt == attempts - 1:
+                return response
+            response.close()
+        raise error
+
+    def _send(self, request, replica: Replica) -> requests.Response:
+        started_at = time.perf_counter()
+        try:
+            response = request(replica.url)
+        except RETRY_ERRORS:
+            self.record(replica, time.perf_counter() - started_at, ok=False)
+            raise
+        self.record(replica, time.perf_counter() - started_at, ok=response.status_code not in RETRY_STATUSES)
+        return response
+
+    def _send_hedged(self, request, replica: Replica, tried: list) -> requests.Response:
+        delay = replica.quantile(self.hedge_quantile) if len(replica.samples) >= self.min_samples else None
+        if delay is None or len(self.replicas) < 2:
+            return self._send(request, replica)
+        # the requests keep the context of the caller: its priority and span attributes
+        pending = {self._executor.submit(contextvars.copy_context().run, self._send, request, replica)}
+        done, pending = wait(pending, timeout=delay)
+        if not done:
+            backup = self.choose(exclude=tried)
+            tried.append(backup)
+            self.hedged += 1
+            pending.add(self._executor.submit(contextvars.copy_context().run, self._send, request, backup))
+        winner = fallback = error = None
+        while True:
+            for future in done:
+                try:
+                    response = future.result()
+                except RETRY_ERRORS as exc:
+                    error = exc
+                    continue
+                if winner is None and response.status_code not in RETRY_STATUSES:
+                    winner = response
+                elif winner is None and fallback is None:
+                    fallback = response
+                else:
+                    response.close()
+            if winner is not None or not pending:
+                break
+            done, pending = wait(pending, return_when=FIRST_COMPLETED)
+        for future in pending:
+            # the slower request finishes in the background, then releases its connection
+            future.add_done_callback(_close_response)
+        if winner is not None:
+            if fallback is not None:
+                fallback.close()
+            return winner
+        if fallback is not None:
+            return fallback
+        raise error
+
+    def stats(self) -> list[dict]:
+        """Health and latency of each replica"""
+        with self._lock:
+            return [replica.stats() for replica in self.replicas]
@@ -0,0 +1,190 @@
+import threading
+import time
+from collections import Counter
+from contextlib import contextmanager
+from contextvars import ContextVar
+from typing import Iterator
+from fhir_tx_client.instrumentation import Histogram, Instrumentation, measure
+
+# Priority classes, the lower the more urgent
+INTERACTIVE = 0
+BULK = 1
+PRIORITY_NAMES = {INTERACTIVE: "interactive", BULK: "bulk"}
+
+# None until a caller or a bulk API chooses a priority
+_PRIORITY: ContextVar[int | None] = ContextVar("fhir_tx_priority", default=None)
+
+
+def current_priority() -> int:
+    level = _PRIORITY.get()
+    return INTERACTIVE if level is None else level
+
+
+@contextmanager
+def priority(level: int) -> Iterator[None]:
+    """Send the requests made inside the block, in this thread or task, at priority `level`"""
+    token = _PRIORITY.set(level)
+    try:
+        yield
+    finally:
+        _PRIORITY.reset(token)
+
+
+@contextmanager
+def default_priority(level: int) -> Iterator[None]:
+    """Like `priority`, unless the caller chose a priority for the block already"""
+    if _PRIORITY.get() is not None:
+        yield
+        return
+    with priority(level):
+        yield
+
+
+def endpoint_of(path: str) -> str:
+    """Rate-limit key of a request: its operation (`$expand`), else its resource type;
+    `batch` for batch Bundles posted to the base url"""
+    segments = path.split("?")[0].strip("/").split("/")
+    for segment in reversed(segments):
+        if segment.startswith("$"):
+            return segment
+    return segments[0] or "batch"
+
+
+class TokenBucket:
+    """`rate` requests per second on average, in bursts of up to `burst` requests"""
+
+    __slots__ = ("rate", "capacity", "tokens", "updated_at", "queued")
+
+    def __init__(self, rate: float, burst: float | None = None):
+        if rate <= 0:
+            raise ValueError("rate must be positive")
+        self.rate = rate
+        self.capacity = burst or max(1.0, rate)
+        self.tokens = self.capacity
+        self.updated_at = time.monotonic()
+        self.queued = Counter()  # requests waiting for a token, by priority
+
+    def delay(self) -> float:
+        """Seconds until a token is available, 0 if there is one"""
+        now = time.monotonic()
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated_at) * self.rate)
+        self.updated_at = now
+        return 0.0 if self.tokens >= 1 else (1 - self.tokens) / self.rate
+
+
+class RequestScheduler:
+    """Decides when the requests of a client start, by priority class.
+
+    Requests run at the priority of their context (see `priority`): `INTERACTIVE` unless
+    made by a bulk API of the client (`validate_many`, `lookup_many`, `translate_many`,
+    `iter_pages`), which run at `BULK`. Expansions of a whole ValueSet, i.e. $expand
+    without `count` as made by `expand`, `expand_stream`, `materialize` and its refreshes
+    or `expansion_store`, run at `BULK` unless the caller chose a priority. At most `max_in_flight` requests run at once,
+    `reserved` of them for interactive requests only. A request does not start while a
+    more urgent one waits for a slot, or for a token of the same endpoint.
+    `rates` limits the requests to an endpoint (see `endpoint_of`), mapping it to
+    requests per second or a (rate, burst) pair; `default_rate` applies to the others.
+    Queueing delays are kept per priority, see `stats`."""
+
+    def __init__(
+        self,
+        max_in_flight: int | None = None,
+        reserved: int = 1,
+        rates: dict[str, float | tuple[float, float]] | None = None,
+        default_rate: float | tuple[float, float] | None = None,
+    ):
+        if max_in_flight is not None and max_in_flight < 1:
+            raise ValueError("max_in_flight must be at least 1")
+        self.max_in_flight = max_in_flight
+        self.reserved = reserved
+        self.rates = rates or {}
+        self.default_rate = default_rate
+        self.in_flight = 0
+        self._condition = threading.Condition()
+        self._buckets: dict[str, TokenBucket | None] = {}
+        self._queued = Counter()  # requests waiting for a slot, by priority
+        self.wait_times: dict[int, Histogram] = {}
+        self.throttled = Counter()  # requests that waited for a token, by endpoint
+
+    def _bucket(self, endpoint: str) -> TokenBucket | None:
+        if endpoint not in self._buckets:
+            rate = self.rates.get(endpoint, self.default_rate)
+            if rate is None:
+                self._buckets[endpoint] = None
+            else:
+                self._buckets[endpoint] = TokenBucket(*rate) if isinstance(rate, tuple) else TokenBucket(rate)
+        return self._buckets[endpoint]
+
+    def _may_start(self, level: int) -> bool:
+        if self.max_in_flight is not None:
+            limit = self.max_in_flight if level <= INTERACTIVE else max(1, self.max_in_flight - self.reserved)
+            if self.in_flight >= limit:
+                return False
+        return not any(count for queued, count in self._queued.items() if queued < level)
+
+    def acquire(self, endpoint: str, level: int | None = None) -> float:
+        """Block until a request to `endpoint` may start, and count it as in flight.
+        Returns the seconds waited."""
+        level = current_priority() if level is None else level
+        started_at = time.monotonic()
+        with self._condition:
+            bucket = self._bucket(endpoint)
+            throttled = False
+            while True:
+                if not self._may_start(level):
+                    self._queued[level] += 1
+                    try:
+                        self._condition.wait()
+                    finally:
+                        self._queued[level] -= 1
+                    continue
+                if bucket is None:
+                    break
+                delay = bucket.delay()
+                if delay == 0 and not any(count for queued, count in bucket.queued.items() if queued < level):
+                    bucket.tokens -= 1
+                    break
+                throttled = True
+                bucket.queued[level] += 1
+                try:
+                    self._condition.wait(delay or None)
+                finally:
+                    bucket.queued[level] -= 1
+            self.in_flight += 1
+            # less urgent requests may have waited for this one
+            self._condition.notify_all()
+            waited = time.monotonic() - started_at
+            self.wait_times.setdefault(level, Histogram()).observe(waited)
+            if throttled:
+                self.throttled[endpoint] += 1
+        return waited
+
+    def release(self):
+        with self._condition:
+            self.in_flight -= 1
+            self._condition.notify_all()
+
+    @contextmanager
+    def slot(self, endpoint: str, instrumentation: Instrumentation | None = None) -> Iterator[None]:
+        """Hold a slot for one request to `endpoint`; the wait is a `queue` span"""
+        level = current_priority()
+        with measure(instrumentation, "queue", priority=PRIORITY_NAMES.get(level, level)):
+            self.acquire(endpoint, level)
+        try:
+            yield
+        finally:
+            self.release()
+
+    def stats(self) -> dict:
+        """Requests in flight and waiting, and queueing delays per priority"""
+        with self._condition:
+            queued = Counter(self._queued)
+            for bucket in self._buckets.values():
+                if bucket is not None:
+                    queued.update(bucket.queued)
+            return {
+                "in_flight": self.in_flight,
+                "queued": {PRIORITY_NAMES.get(level, level): count for level, count in queued.items() if count},
+                "wait": {PRIORITY_NAMES.get(level, level): histogram.to_dict() for level, histogram in self.wait_times.items()},
+                "throttled": dict(self.throttled),
+            }
@@ -0,0 +1,75 @@
+import asyncio
+import threading
+from typing import Any, Awaitable, Callable, Hashable
+
+
+class _Call:
+    __slots__ = ("done", "result", "error")
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight:
+    """Coalesces concurrent identical calls from several threads.
+
+    While a call for a key is in flight, other threads asking for the same key wait for it
+    and receive the same result (or exception) instead of making the call themselves."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._calls: dict[Hashable, _Call] = {}
+
+    def do(self, key: Hashable, fn: Callable[[], Any]) -> Any:
+        with self._lock:
+            call = self._calls.get(key)
+            leader = call is None
+            if leader:
+                call = self._calls[key] = _Call()
+        if not leader:
+            call.done.wait()
+            if call.error is not None:
+                raise call.error
+            return call.result
+        try:
+            call.result = fn()
+        except BaseException as error:
+            call.error = error
+            raise
+        finally:
+            with self._lock:
+                del self._calls[key]
+            call.done.set()
+        return call.result
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+class AsyncSingleFlight:
+    """Asyncio counterpart of `SingleFlight`: concurrent tasks awaiting the same key share one call.
+    Cancelling one of the waiting tasks does not cancel the shared call."""
+
+    def __init__(self):
+        self._calls: dict[Hashable, asyncio.Future] = {}
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+        future = self._calls.get(key)
+        if future is None:
+            future = self._calls[key] = asyncio.ensure_future(fn())
+            future.add_done_callback(lambda _: self._calls.pop(key, None))
+        return await asyncio.shield(future)
+
+    def __len__(self) -> int:
+        return len(self._calls)
+
+
+def coalesce(single_flight: SingleFlight | None, key: Hashable, fn: Callable[[], Any]) -> Any:
+    """Run `fn` through `single_flight`, or directly when coalescing is disabled"""
+    return fn() if single_flight is None else single_flight.do(key, fn)
+
+
+async def coalesce_async(single_flight: AsyncSingleFlight | None, key: Hashable, fn: Callable[[], Awaitable[Any]]) -> Any:
+    return await (fn() if single_flight is None else single_flight.do(key, fn))
@@ -0,0 +1,114 @@
+import json
+import sqlite3
+import threading
+import time
+import zlib
+from fhir_tx_client.util import normalize_params
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS snapshot (
+    key TEXT PRIMARY KEY,
+    server TEXT NOT NULL,
+    canonical TEXT NOT NULL,
+    identifier TEXT,
+    stored_at REAL NOT NULL,
+    body BLOB NOT NULL
+)
+"""
+
+# Seconds a snapshot is served without asking the server again
+DEFAULT_MAX_AGE = 24 * 60 * 60
+
+
+def snapshot_key(resource, params: dict) -> tuple[str, str]:
+    """Return the canonical reference (url|version, or the resource path when the resource
+    has no url) and the cache key of an $expand of `resource` with `params` on the server
+    of its client"""
+    url = resource.get("url")
+    if url:
+        version = resource.get("version")
+        canonical = "{0}|{1}".format(url, version) if version else url
+    else:
+        canonical = resource._get_path()
+    return canonical, "{0} {1} {2}".format(resource.client.url, canonical, normalize_params(params))
+
+
+class SnapshotStore:
+    """SQLite file with $expand responses, shared by all worker processes on a host.
+
+    The database runs in WAL mode so that any number of processes read concurrently
+    while one writes. Snapshots older than `max_age` seconds (a day by default, never
+    with None) are not returned, so the server is asked again. A response stored with
+    another `expansion.identifier` than the snapshot it replaces means the ValueSet
+    changed on the server: the snapshots of its other $expand parameters are dropped
+    with it, and a response with the same identifier renews them."""
+
+    def __init__(self, path: str, max_age: float | None = DEFAULT_MAX_AGE):
+        self.path = path
+        self.max_age = max_age
+        self._local = threading.local()
+        with self._connection() as connection:
+            connection.execute(SCHEMA)
+
+    def _connection(self) -> sqlite3.Connection:
+        """One connection per thread, sqlite3 connections cannot be shared between threads"""
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = sqlite3.connect(self.path, timeout=30)
+            connection.execute("PRAGMA journal_mode=WAL")
+            connection.execute("PRAGMA synchronous=NORMAL")
+            self._local.connection = connection
+        return connection
+
+    def get(self, key: str) -> dict | None:
+        """Return the stored $expand response for `key` if there is a fresh one"""
+        row = self._connection().execute(
+            "SELECT stored_at, body FROM snapshot WHERE key = ?", (key,)
+        ).fetchone()
+        if row is None:
+            return None
+        stored_at, body = row
+        if self.max_age is not None and time.time() - stored_at > self.max_age:
+            return None
+        return json.loads(zlib.decompress(body))
+
+    def put(self, key: str, canonical: str, resource: dict, server: str = ""):
+        """Store the $expand response `resource` of the ValueSet `canonical` on `server`"""
+        identifier = (resource.get("expansion") or {}).get("identifier")
+        body = zlib.compress(json.dumps(resource, separators=(",", ":")).encode())
+        now = time.time()
+        with self._connection() as connection:
+            # take the write lock before reading the identifier, so that no other process
+            # replaces the snapshots of the ValueSet between the check and the writes
+            connection.execute("BEGIN IMMEDIATE")
+            row = connection.execute("SELECT identifier FROM snapshot WHERE key = ?", (key,)).fetchone()
+            if row is not None and row[0] is not None and identifier is not None:
+                if row[0] != identifier:
+                    connection.execute(
+                        "DELETE FROM snapshot WHERE server = ? AND canonical = ?", (server, canonical)
+                    )
+                else:
+                    connection.execute(
+                        "UPDATE snapshot SET stored_at = ? WHERE server = ? AND canonical = ? AND identifier = ?",
+                        (now, server, canonical, identifier),
+                    )
+            connection.execute(
+                "INSERT OR REPLACE INTO snapshot (key, server, canonical, identifier, stored_at, body)"
+                " VALUES (?, ?, ?, ?, ?, ?)",
+                (key, server, canonical, identifier, now, body),
+            )
+
+    def identifier(self, key: str) -> str | None:
+        """`expansion.identifier` of the stored snapshot, fresh or not"""
+        row = self._connection().execute(
+            "SELECT identifier FROM snapshot WHERE key = ?", (key,)
+        ).fetchone()
+        return row[0] if row else None
+
+    def invalidate(self, canonical: str, server: str | None = None):
+        """Drop all snapshots of the ValueSet with this canonical reference, on `server` only if given"""
+        with self._connection() as connection:
+            if server is None:
+                connection.execute("DELETE FROM snapshot WHERE canonical = ?", (canonical,))
+            else:
+                connection.execute("DELETE FROM snapshot WHERE server = ? AND canonical = ?", (server, canonical))
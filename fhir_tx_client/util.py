@@ -1,10 +1,20 @@
-from fhir.resources.fhirtypes import FHIRAbstractModel, Primitive
+from __future__ import annotations
+import base64
+import json
+from datetime import date, datetime
+from typing import TYPE_CHECKING, Any, Callable
 from fhirpy.base.utils import AttrDict
-from fhir_tx_client.Parameters import Parameters, ParametersParameter
-from fhir_tx_client.data_types import PYTHON_PRIMITIVE_TO_FHIR_TYPE_MAP
+
+# The pydantic models are imported on first use, they dominate the import time
+if TYPE_CHECKING:
+    from fhir_tx_client.Parameters import Parameters
 
 def dict_to_params(data: dict) -> Parameters:
     """Convert a dictionary to a Parameters resource"""
+    from fhir.resources.fhirtypes import FHIRAbstractModel, Primitive
+    from fhir_tx_client.Parameters import Parameters, ParametersParameter
+    from fhir_tx_client.data_types import PYTHON_PRIMITIVE_TO_FHIR_TYPE_MAP
+
     params = Parameters(parameter=[])
     for key, value in data.items():
         if isinstance(value, tuple(PYTHON_PRIMITIVE_TO_FHIR_TYPE_MAP.keys())):
@@ -23,11 +33,101 @@ def dict_to_params(data: dict) -> Parameters:
     return params
 
 def params_to_dict(params: Parameters) -> dict:
-    """Convert a Parameters resource to a dictionary"""
-    params_dict = {}
-    for param in params.parameter:
-        name_entry, value_entry = param.dict(exclude_none=True).items()
-        if name_entry[1] in params_dict:
-            raise ValueError("Duplicate parameter name %s" % name_entry[1])
-        params_dict[name_entry[1]] = value_entry[1]
-    return AttrDict(**params_dict)
+    """Convert a Parameters resource to a dictionary, see `params_json_to_dict`"""
+    return params_json_to_dict(params.dict())
+
+def _value_key(fhir_type_name: str) -> str:
+    return "value" + fhir_type_name[0].upper() + fhir_type_name[1:]
+
+# Python type -> (`value[x]` key, conversion to its JSON representation)
+_VALUE_ENCODERS: dict[type, tuple[str, Callable[[Any], Any] | None]] = {
+    bool: ("valueBoolean", None),
+    str: ("valueString", None),
+    int: ("valueInteger", None),
+    float: ("valueDecimal", None),
+    bytes: ("valueBase64Binary", lambda value: base64.b64encode(value).decode()),
+    datetime: ("valueDateTime", datetime.isoformat),
+    date: ("valueDate", date.isoformat),
+}
+
+def _value_encoder(value_type: type) -> tuple[str, Callable[[Any], Any] | None]:
+    """Resolve the encoder of a type that is not in the dispatch table yet, and remember it"""
+    from fhir.resources.fhirtypes import FHIRAbstractModel, Primitive
+    from fhir_tx_client.data_types import PYTHON_PRIMITIVE_TO_FHIR_TYPE_MAP
+
+    if issubclass(value_type, FHIRAbstractModel):
+        encoder = (_value_key(value_type.get_resource_type()), value_type.dict)
+    else:
+        base = next((base for base in value_type.__mro__ if base in PYTHON_PRIMITIVE_TO_FHIR_TYPE_MAP), None)
+        if base is None:
+            raise TypeError(f"Expected a subclass of FHIRAbstractModel, got {value_type}. Please make use of the types defined in fhir.resources.fhirtypes.")
+        value_key, convert = _VALUE_ENCODERS[base]
+        if issubclass(value_type, Primitive):
+            value_key = _value_key(value_type.fhir_type_name())
+        encoder = (value_key, convert)
+    _VALUE_ENCODERS[value_type] = encoder
+    return encoder
+
+def _encode_parameters(data: dict) -> list[dict]:
+    parameters = []
+    for name, value in data.items():
+        if value is None:
+            continue
+        for item in value if isinstance(value, (list, tuple)) else (value,):
+            if isinstance(item, dict):
+                parameters.append({"name": name, "part": _encode_parameters(item)})
+                continue
+            encoder = _VALUE_ENCODERS.get(type(item)) or _value_encoder(type(item))
+            value_key, convert = encoder
+            parameters.append({"name": name, value_key: convert(item) if convert else item})
+    return parameters
+
+def dict_to_params_json(data: dict, strict=False) -> dict:
+    """Convert a dictionary straight to the JSON of a Parameters resource.
+
+    Lists and tuples become repeated parameters, dictionaries become nested `part`
+    parameters and None values are left out. With `strict` the result is validated
+    against the Parameters model."""
+    params = {"resourceType": "Parameters", "parameter": _encode_parameters(data)}
+    if strict:
+        from fhir_tx_client.Parameters import Parameters
+
+        Parameters.parse_obj(params)
+    return params
+
+def _decode_parameters(parameters: list[dict]) -> AttrDict:
+    params_dict = AttrDict()
+    for parameter in parameters:
+        if "part" in parameter:
+            value = _decode_parameters(parameter["part"])
+        elif "resource" in parameter:
+            value = parameter["resource"]
+        else:
+            value = next((v for k, v in parameter.items() if k.startswith("value")), None)
+        name = parameter["name"]
+        if name not in params_dict:
+            params_dict[name] = value
+        elif isinstance(params_dict[name], list):
+            params_dict[name].append(value)
+        else:
+            params_dict[name] = [params_dict[name], value]
+    return params_dict
+
+def params_json_to_dict(data: dict, strict=False) -> AttrDict:
+    """Convert the JSON of a Parameters resource straight to a dictionary.
+
+    Repeated parameters are collected in a list and `part` parameters become nested
+    dictionaries. With `strict` the input is validated against the Parameters model first."""
+    if strict:
+        from fhir_tx_client.Parameters import Parameters
+
+        Parameters.parse_obj(data)
+    return _decode_parameters(data.get("parameter") or [])
+
+def resource_identity(resource) -> tuple:
+    """Identify a terminology resource by type, id, canonical url and version"""
+    return (resource.resource_type, resource.get("id"), resource.get("url"), resource.get("version"))
+
+def normalize_params(params: dict) -> str:
+    """Serialize the JSON of a Parameters resource to a canonical string, usable as a cache key"""
+    return json.dumps(params, sort_keys=True, separators=(",", ":"), default=str)
@@ -0,0 +1,90 @@
+import pytest
+from fhir_tx_client import SyncFHIRTerminologyClient, AsyncFHIRTerminologyClient
+
+FHIR_VERSION_SYSTEM = "http://hl7.org/fhir/FHIR-version"
+
+
+def expansion(*codes, system=FHIR_VERSION_SYSTEM, **expansion_fields):
+    """Build a ValueSet $expand response holding `codes`"""
+    return {
+        "resourceType": "ValueSet",
+        "status": "active",
+        "expansion": {
+            "timestamp": "2023-01-01T00:00:00Z",
+            "contains": [{"system": system, "code": code} for code in codes],
+            **expansion_fields,
+        },
+    }
+
+
+def parameter_values(data: dict) -> dict:
+    """Collect the `value[x]` of each parameter in a Parameters request body by name"""
+    values = {}
+    for parameter in data.get("parameter", []):
+        name = parameter["name"]
+        values[name] = next(v for k, v in parameter.items() if k.startswith("value"))
+    return values
+
+
+def paged_expansion(codes, total=True):
+    """A $expand handler that honours the `offset` and `count` parameters"""
+
+    def handler(data, params):
+        values = parameter_values(data)
+        offset, count = values.get("offset", 0), values.get("count", len(codes))
+        fields = {"offset": offset}
+        if total:
+            fields["total"] = len(codes)
+        return expansion(*codes[offset : offset + count], **fields)
+
+    return handler
+
+
+def validate_code_result(result: bool):
+    return {
+        "resourceType": "Parameters",
+        "parameter": [{"name": "result", "valueBoolean": result}],
+    }
+
+
+class FakeTerminologyServer:
+    """Answers the requests of a client from registered handlers instead of the network.
+
+    A handler receives the request body and query parameters and returns the response body."""
+
+    def __init__(self):
+        self.handlers = {}
+        self.requests = []
+
+    def route(self, method, path, handler):
+        self.handlers[(method.upper(), path)] = handler
+
+    def handle(self, method, path, data=None, params=None):
+        self.requests.append((method.upper(), path, data))
+        return self.handlers[(method.upper(), path.split("?")[0])](data, params)
+
+    def count(self, path):
+        return sum(1 for _, request_path, _ in self.requests if request_path == path)
+
+
+@pytest.fixture
+def server():
+    return FakeTerminologyServer()
+
+
+@pytest.fixture
+def client(server, monkeypatch):
+    client = SyncFHIRTerminologyClient("http://tx.test/r4")
+    monkeypatch.setattr(client, "_do_request", server.handle)
+    return client
+
+
+@pytest.fixture
+def async_client(server, monkeypatch):
+    client = AsyncFHIRTerminologyClient("http://tx.test/r4", max_concurrency=2)
+
+    async def do_request(method, path, data=None, params=None):
+        return server.handle(method, path, data, params)
+
+    monkeypatch.setattr(client, "_do_request", do_request)
+    return client
@@ -0,0 +1,46 @@
+import asyncio
+import pytest
+from fhir_tx_client.data_types import Coding, CodeableConcept
+from tests.conftest import FHIR_VERSION_SYSTEM, expansion, validate_code_result
+
+
+@pytest.mark.asyncio
+async def test_async_valueset_expand_and_iterate(server, async_client):
+    """Test AsyncValueSet expansion and `async for` iteration"""
+    server.route("POST", "ValueSet/FHIR-version/$expand", lambda data, params: expansion("4.0.0", "4.0.1"))
+    vs = async_client.resource("ValueSet", id="FHIR-version")
+    vs_expanded = await vs.expand()
+    assert len(vs_expanded.expansion.contains) == 2
+    assert [coding.code async for coding in vs] == ["4.0.0", "4.0.1"]
+
+
+@pytest.mark.asyncio
+async def test_async_valueset_contains(server, async_client):
+    """Test AsyncValueSet membership check for Coding and CodeableConcept"""
+    server.route("POST", "ValueSet/FHIR-version/$validate-code", lambda data, params: validate_code_result(True))
+    vs = async_client.ValueSet(id="FHIR-version")
+    coding = Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM)
+    assert await vs.contains(coding)
+    assert await vs.contains(CodeableConcept(coding=[coding]))
+    with pytest.raises(NotImplementedError):
+        await vs.contains("4.0.1")
+
+
+@pytest.mark.asyncio
+async def test_async_client_gather_limits_concurrency(async_client):
+    """Test that gather keeps at most `max_concurrency` awaitables in flight"""
+    running = 0
+    peak = 0
+
+    async def task(i):
+        nonlocal running, peak
+        running += 1
+        peak = max(peak, running)
+        await asyncio.sleep(0.01)
+        running -= 1
+        return i
+
+    assert await async_client.gather(*(task(i) for i in range(10))) == list(range(10))
+    assert peak == 2
+    await async_client.gather(*(task(i) for i in range(10)), limit=5)
+    assert peak == 5
@@ -0,0 +1,25 @@
+from benchmarks.suite import compare, run
+from benchmarks.synthetic import synthetic_valueset
+from fhir_tx_client.ValueSet.lightweight import LightweightExpansion
+
+
+def test_synthetic_valueset_nesting():
+    valueset = synthetic_valueset(7, depth=3)
+    contains = valueset["expansion"]["contains"]
+    assert [entry["code"] for entry in contains] == ["0", "3", "6"]
+    assert contains[0]["contains"][0]["contains"][0]["code"] == "2"
+    assert "contains" not in contains[2]
+    expansion = LightweightExpansion(valueset)
+    assert len(expansion) == valueset["expansion"]["total"] == 7
+    assert [concept.parent for concept in expansion] == [-1, 0, 1, -1, 3, 4, -1]
+
+
+def test_suite_runs_offline_and_compares():
+    report = run(sizes=(10,), depths=(1, 3), repeat=1)
+    results = report["results"]
+    assert {"expand_raw[size=10,depth=3]", "expand_parse[size=10,depth=1]", "contains[size=10,depth=1]"} <= set(results)
+    assert results["iterate[size=10,depth=1]"]["concepts_per_second"] > 0
+    assert results["contains_remote[size=10,depth=3]"]["lookups_per_second"] > 0
+    assert report["environment"]["python"]
+    lines = compare(report, report)
+    assert lines and all(line.endswith("1.00x") for line in lines)
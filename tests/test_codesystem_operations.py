@@ -0,0 +1,93 @@
+import pytest
+from fhir_tx_client.cache import LRUCache
+from fhir_tx_client.data_types import SCTCoding
+from fhir_tx_client.ValueSet.store import ExpansionStore
+from tests.conftest import parameter_values
+
+SCT = "http://snomed.info/sct"
+DISPLAYS = {"102263004": "Eggs (edible)", "386661006": "Fever"}
+
+
+def lookup_result(code):
+    return {
+        "resourceType": "Parameters",
+        "parameter": [{"name": "name", "valueString": "SNOMED CT"}, {"name": "display", "valueString": DISPLAYS[code]}],
+    }
+
+
+def lookup_handler(data, params):
+    return lookup_result(parameter_values(data)["coding"]["code"])
+
+
+def batch_lookup_handler(data, params):
+    entries = []
+    for entry in data["entry"]:
+        assert entry["request"]["url"] == "CodeSystem/$lookup"
+        code = parameter_values(entry["resource"])["coding"]["code"]
+        if code in DISPLAYS:
+            entries.append({"response": {"status": "200 OK"}, "resource": lookup_result(code)})
+        else:
+            entries.append({"response": {"status": "404 Not Found"}})
+    return {"resourceType": "Bundle", "type": "batch-response", "entry": entries}
+
+
+def subsumes_handler(data, params):
+    return {"resourceType": "Parameters", "parameter": [{"name": "outcome", "valueCode": "not-subsumed"}]}
+
+
+def test_client_routes_codesystem(client):
+    from fhir_tx_client.CodeSystem import SyncCodeSystem
+
+    assert isinstance(client.resource("CodeSystem", url=SCT), SyncCodeSystem)
+    assert isinstance(client.CodeSystem(), SyncCodeSystem)
+
+
+def test_lookup_is_memoized(server, client, monkeypatch):
+    server.route("POST", "CodeSystem/$lookup", lookup_handler)
+    monkeypatch.setattr(client, "lookup_cache", LRUCache())
+    cs = client.CodeSystem()
+    for _ in range(3):
+        assert cs.lookup(coding=SCTCoding(code="102263004")).display == "Eggs (edible)"
+    assert server.count("CodeSystem/$lookup") == 1
+
+
+def test_lookup_many_batches_and_reports_failures(server, client, monkeypatch):
+    server.route("POST", "", batch_lookup_handler)
+    monkeypatch.setattr(client, "lookup_cache", LRUCache())
+    cs = client.CodeSystem()
+    codings = [SCTCoding(code=code) for code in ["102263004", "386661006", "102263004", "0"]]
+    results = cs.lookup_many(codings, batch_size=2)
+    assert [r.display if isinstance(r, dict) else None for r in results] == ["Eggs (edible)", "Fever", "Eggs (edible)", None]
+    assert len(server.requests) == 2
+    cs.lookup_many(codings[:3])
+    assert len(server.requests) == 2
+
+
+def test_subsumes_from_hierarchy_and_server(server, client, monkeypatch):
+    server.route("POST", "CodeSystem/$subsumes", subsumes_handler)
+    monkeypatch.setattr(client, "lookup_cache", LRUCache())
+    cs = client.CodeSystem(url=SCT)
+    cs.hierarchy = ExpansionStore.from_resource(
+        {"expansion": {"contains": [{"system": SCT, "code": "finding", "contains": [{"system": SCT, "code": "fever"}]}]}}
+    )
+    assert cs.subsumes("finding", "fever") == "subsumes"
+    assert cs.subsumes("fever", "finding") == "subsumed-by"
+    assert cs.subsumes("fever", "fever") == "equivalent"
+    assert server.count("CodeSystem/$subsumes") == 0
+    assert cs.subsumes("fever", "procedure") == "not-subsumed"
+    assert cs.subsumes("fever", "procedure") == "not-subsumed"
+    assert server.count("CodeSystem/$subsumes") == 1
+    # a code missing from the hierarchy is not known to be equivalent to itself
+    assert cs.subsumes("procedure", "procedure") == "not-subsumed"
+    assert server.count("CodeSystem/$subsumes") == 2
+    assert parameter_values(server.requests[0][2]) == {"codeA": "fever", "codeB": "procedure", "system": SCT}
+
+
+@pytest.mark.asyncio
+async def test_async_lookup_many(server, async_client):
+    server.route("POST", "", batch_lookup_handler)
+    server.route("POST", "CodeSystem/$lookup", lookup_handler)
+    cs = async_client.CodeSystem()
+    assert (await cs.lookup(coding=SCTCoding(code="386661006"))).display == "Fever"
+    results = await cs.lookup_many([SCTCoding(code=code) for code in DISPLAYS], batch_size=1)
+    assert [r.display for r in results] == list(DISPLAYS.values())
@@ -0,0 +1,77 @@
+from fhirpy.base.exceptions import OperationOutcome
+from fhir_tx_client.data_types import Coding, SCTCoding
+from tests.conftest import parameter_values
+
+SCT = "http://snomed.info/sct"
+ICD10 = "http://hl7.org/fhir/sid/icd-10"
+CONCEPT_MAP = {
+    "resourceType": "ConceptMap",
+    "id": "sct-icd10",
+    "group": [
+        {
+            "source": SCT,
+            "target": ICD10,
+            "element": [
+                {"code": "386661006", "target": [{"code": "R50.9", "display": "Fever", "equivalence": "equivalent"}]},
+                {"code": "22298006", "target": [{"code": "I21.9", "equivalence": "wider"}, {"code": "I22", "equivalence": "unmatched"}]},
+            ],
+        }
+    ],
+}
+
+
+def translate_result(code):
+    element = next((e for e in CONCEPT_MAP["group"][0]["element"] if e["code"] == code), None)
+    if element is None:
+        return {"resourceType": "Parameters", "parameter": [{"name": "result", "valueBoolean": False}]}
+    matches = [
+        {
+            "name": "match",
+            "part": [
+                {"name": "equivalence", "valueCode": target["equivalence"]},
+                {"name": "concept", "valueCoding": {"system": ICD10, "code": target["code"]}},
+            ],
+        }
+        for target in element["target"]
+    ]
+    return {"resourceType": "Parameters", "parameter": [{"name": "result", "valueBoolean": True}, *matches]}
+
+
+def batch_translate_handler(data, params):
+    entries = []
+    for entry in data["entry"]:
+        coding = parameter_values(entry["resource"])["coding"]
+        if coding["system"] != SCT:
+            entries.append({"response": {"status": "400 Bad Request"}})
+        else:
+            entries.append({"response": {"status": "200 OK"}, "resource": translate_result(coding["code"])})
+    return {"resourceType": "Bundle", "type": "batch-response", "entry": entries}
+
+
+def test_translate(server, client):
+    server.route("POST", "ConceptMap/sct-icd10/$translate", lambda data, params: translate_result("22298006"))
+    translation = client.ConceptMap(id="sct-icd10").translate(coding=SCTCoding(code="22298006"))
+    assert translation.result and not translation.unmapped
+    assert [(t.code, t.equivalence) for t in translation.targets] == [("I21.9", "wider"), ("I22", "unmatched")]
+
+
+def test_translate_many_deduplicates_and_batches(server, client):
+    server.route("POST", "", batch_translate_handler)
+    cm = client.ConceptMap(id="sct-icd10")
+    codings = [SCTCoding(code=code) for code in ["386661006", "386661006", "71388002"]] + [Coding(system="x", code="1")]
+    translations = cm.translate_many(codings, batch_size=2)
+    assert len(server.requests) == 2
+    assert [t.targets[0].code for t in translations[:2]] == ["R50.9", "R50.9"]
+    assert translations[2].unmapped and not translations[2].result
+    assert isinstance(translations[3], OperationOutcome)
+
+
+def test_materialized_map_translates_locally(server, client):
+    server.route("GET", "ConceptMap/sct-icd10", lambda data, params: CONCEPT_MAP)
+    cm = client.ConceptMap(id="sct-icd10")
+    assert cm.materialize() == 2
+    translations = cm.translate_many([SCTCoding(code="386661006"), SCTCoding(code="22298006"), SCTCoding(code="0")])
+    assert [t.result for t in translations] == [True, True, False]
+    assert translations[2].unmapped
+    assert cm.translate(coding=SCTCoding(code="22298006"), targetsystem="http://other").unmapped
+    assert len(server.requests) == 1
@@ -0,0 +1,51 @@
+import pytest
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.cache import LRUCache
+from tests.conftest import expansion
+from benchmarks.stub_server import StubTerminologyServer
+
+
+@pytest.fixture
+def stub():
+    resource = {"id": "FHIR-version", "url": "http://hl7.org/fhir/ValueSet/FHIR-version", **expansion("4.0.0", "4.0.1")}
+    with StubTerminologyServer({"FHIR-version": resource}) as stub:
+        yield stub
+
+
+def test_unchanged_resources_are_revalidated(stub):
+    client = SyncFHIRTerminologyClient(stub.url, validator_cache=LRUCache())
+    vs = client.ValueSet(id="FHIR-version")
+    vs.refresh()
+    first = vs.expand(raw=True)
+    bytes_sent = stub.bytes_sent
+    vs.refresh()
+    assert vs.url == "http://hl7.org/fhir/ValueSet/FHIR-version"
+    assert vs.expand(raw=True).total is None and len(vs.expand(raw=True)) == len(first)
+    assert stub.bytes_sent == bytes_sent
+    assert [headers.get("If-None-Match") is not None for _, _, headers in stub.requests] == [False, False, True, True, True]
+
+
+def test_revalidated_responses_are_not_shared(stub):
+    client = SyncFHIRTerminologyClient(stub.url, validator_cache=LRUCache())
+    vs = client.ValueSet(id="FHIR-version")
+    vs.expand(raw=True).concepts.clear()
+    first = vs.expand(raw=True)
+    first._resource["expansion"]["contains"].clear()
+    assert len(vs.expand(raw=True)) == 2
+    assert stub.count("POST", "/r4/ValueSet/FHIR-version/$expand") == 3
+
+
+def test_changed_resources_are_downloaded_again(stub):
+    client = SyncFHIRTerminologyClient(stub.url, validator_cache=LRUCache())
+    vs = client.ValueSet(id="FHIR-version")
+    assert len(vs.expand(raw=True)) == 2
+    stub.valuesets["FHIR-version"]["expansion"]["contains"].append({"system": "x", "code": "5.0.0"})
+    assert len(vs.expand(raw=True)) == 3
+
+
+def test_without_validator_cache_no_conditional_headers(stub):
+    client = SyncFHIRTerminologyClient(stub.url)
+    vs = client.ValueSet(id="FHIR-version")
+    vs.expand()
+    vs.expand()
+    assert all("If-None-Match" not in headers for _, _, headers in stub.requests)
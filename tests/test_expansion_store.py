@@ -0,0 +1,54 @@
+import sys
+import pytest
+from fhir_tx_client.ValueSet.lightweight import LightweightExpansion
+from fhir_tx_client.ValueSet.store import ExpansionStore
+
+SCT = "http://snomed.info/sct"
+
+
+def concept(code, *children):
+    return {"system": SCT, "code": code, "contains": list(children)}
+
+
+RESOURCE = {
+    "resourceType": "ValueSet",
+    "expansion": {
+        "contains": [
+            concept("finding", concept("fever", concept("high-fever")), concept("pain", concept("high-fever"))),
+            concept("procedure"),
+        ]
+    },
+}
+
+
+@pytest.mark.parametrize("build", [ExpansionStore.from_resource, lambda r: ExpansionStore.from_expansion(LightweightExpansion(r))])
+def test_hierarchy_queries(build):
+    store = build(RESOURCE)
+    assert len(store) == 6
+    assert store.ancestors("high-fever") == {"fever", "pain", "finding"}
+    assert store.descendants("finding") == {"fever", "pain", "high-fever"}
+    assert store.descendants("procedure") == set()
+    assert store.is_a("high-fever", "finding")
+    assert store.is_a("fever", "fever")
+    assert not store.is_a("fever", "pain")
+    assert store.depth("high-fever") == 2
+    assert "procedure" in store and "unknown" not in store
+    with pytest.raises(KeyError):
+        store.ancestors("fever", system="http://other")
+
+
+def test_deep_hierarchy_does_not_recurse():
+    depth = sys.getrecursionlimit() * 2
+    root = leaf = concept("0")
+    for level in range(1, depth):
+        child = concept(str(level))
+        leaf["contains"] = [child]
+        leaf = child
+    store = ExpansionStore.from_resource({"expansion": {"contains": [root]}})
+    assert store.depth(str(depth - 1)) == depth - 1
+    assert len(store.descendants("0")) == depth - 1
+
+
+def test_valueset_expansion_store(server, client):
+    server.route("POST", "ValueSet/findings/$expand", lambda data, params: RESOURCE)
+    assert client.ValueSet(id="findings").expansion_store().is_a("pain", "finding")
@@ -0,0 +1,20 @@
+import pytest
+from benchmarks.bench_import import HEAVY_MODULES, probe
+
+
+@pytest.mark.parametrize("module", ["fhir_tx_client", "fhir_tx_client.cli", "fhir_tx_client.client"])
+def test_entry_points_do_not_import_the_models(module):
+    _, modules = probe(module)
+    assert not {name for name in modules if name.startswith(HEAVY_MODULES)}
+    assert "fhir_tx_client.ValueSet.model" not in modules
+
+
+def test_lazy_attributes():
+    import fhir_tx_client
+    from fhir_tx_client.ValueSet import ValueSet
+    from fhir_tx_client.ValueSet.model import ValueSet as model
+
+    assert ValueSet is model
+    assert fhir_tx_client.SyncFHIRTerminologyClient.__module__ == "fhir_tx_client.client"
+    with pytest.raises(AttributeError):
+        fhir_tx_client.SyncFHIRClient
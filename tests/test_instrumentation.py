@@ -0,0 +1,87 @@
+from contextlib import contextmanager
+import pytest
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.cache import LRUCache
+from fhir_tx_client.instrumentation import NULL_SPAN, Histogram, MetricsCollector, TracerInstrumentation, measure
+from tests.conftest import FHIR_VERSION_SYSTEM, expansion
+from benchmarks.stub_server import StubTerminologyServer
+
+VALUESET_URL = "http://hl7.org/fhir/ValueSet/FHIR-version"
+
+
+@pytest.fixture
+def stub():
+    resource = {"id": "FHIR-version", "url": VALUESET_URL, **expansion("4.0.0", "4.0.1")}
+    with StubTerminologyServer({"FHIR-version": resource}) as stub:
+        yield stub
+
+
+def test_metrics_per_phase_bytes_and_cache_ratio(stub):
+    metrics = MetricsCollector()
+    client = SyncFHIRTerminologyClient(
+        stub.url, instrumentation=metrics, validate_code_cache=LRUCache(cache_negative=True)
+    )
+    vs = client.ValueSet(id="FHIR-version", url=VALUESET_URL)
+    vs.expand()
+    for _ in range(3):
+        vs.validate_code(code="4.0.1", system=FHIR_VERSION_SYSTEM)
+
+    for phase in ("$expand", "encode", "network", "decode", "parse"):
+        assert metrics.latency[(phase, "$expand", VALUESET_URL)].count == 1
+    assert metrics.latency[("$validate-code", "$validate-code", VALUESET_URL)].count == 3
+    assert metrics.latency[("network", "$validate-code", VALUESET_URL)].count == 1
+    assert metrics.request_bytes["$expand"] > 0
+    assert metrics.response_bytes["$expand"] > metrics.response_bytes["$validate-code"] > 0
+    assert metrics.hit_ratio("validate_code") == pytest.approx(2 / 3)
+    snapshot = metrics.snapshot()
+    assert snapshot["cache_hit_ratio"] == {"validate_code": pytest.approx(2 / 3)}
+    assert {entry["span"] for entry in snapshot["latency"]} == {"$expand", "$validate-code", "encode", "network", "decode", "parse"}
+
+
+def test_spans_are_reported_to_a_tracer(stub):
+    spans = []
+
+    class TracerSpan:
+        def __init__(self, name):
+            self.name = name
+            self.attributes = {}
+
+        def set_attribute(self, key, value):
+            self.attributes[key] = value
+
+    class Tracer:
+        @contextmanager
+        def start_as_current_span(self, name):
+            span = TracerSpan(name)
+            yield span
+            spans.append(span)
+
+    client = SyncFHIRTerminologyClient(stub.url, instrumentation=TracerInstrumentation(Tracer()))
+    client.ValueSet(id="FHIR-version").expand(raw=True)
+    assert [span.name for span in spans] == [
+        "fhir.tx.encode",
+        "fhir.tx.network",
+        "fhir.tx.decode",
+        "fhir.tx.parse",
+        "fhir.tx.$expand",
+    ]
+    network = spans[1].attributes
+    assert network["fhir.tx.operation"] == "$expand"
+    assert network["fhir.tx.valueset"] == "FHIR-version"
+    assert network["fhir.tx.status"] == 200
+
+
+def test_disabled_instrumentation_uses_a_shared_null_span():
+    assert measure(None, "network", method="POST") is NULL_SPAN
+    with measure(None, "network") as span:
+        span.set_attribute("status", 200)
+
+
+def test_histogram_quantiles():
+    histogram = Histogram()
+    for value in [0.001] * 90 + [0.5] * 10:
+        histogram.observe(value)
+    assert histogram.count == 100
+    assert histogram.quantile(0.5) < 0.002
+    assert histogram.quantile(0.99) == 0.5
+    assert histogram.mean == pytest.approx((0.09 + 5) / 100)
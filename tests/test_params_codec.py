@@ -0,0 +1,34 @@
+import pytest
+from pydantic import ValidationError
+from fhir.resources import fhirtypes
+from fhir_tx_client.Parameters import Parameters
+from fhir_tx_client.data_types import SCTCoding
+from fhir_tx_client.util import dict_to_params, params_to_dict, dict_to_params_json, params_json_to_dict
+
+
+def test_dict_to_params_json_matches_pydantic_conversion():
+    data = {"coding": SCTCoding.from_sct_code("102263004 |Eggs (edible)|"), "code": "4.0.1", "count": 10, "abstract": False}
+    assert dict_to_params_json(data, strict=True) == dict_to_params(data).dict()
+
+
+def test_repeated_and_nested_parameters_roundtrip():
+    data = {
+        "code": fhirtypes.Code("102263004"),
+        "property": ["display", "parent"],
+        "match": {"equivalence": "equivalent", "concept": SCTCoding(code="1")},
+    }
+    params = dict_to_params_json(data, strict=True)
+    assert params["parameter"][0] == {"name": "code", "valueCode": "102263004"}
+    assert [p["name"] for p in params["parameter"]] == ["code", "property", "property", "match"]
+    decoded = params_json_to_dict(params)
+    assert decoded.property == ["display", "parent"]
+    assert decoded.match.equivalence == "equivalent"
+    assert decoded.match.concept["code"] == "1"
+    assert params_to_dict(Parameters.parse_obj(params))["property"] == ["display", "parent"]
+
+
+def test_strict_mode_validates():
+    with pytest.raises(ValidationError):
+        params_json_to_dict({"resourceType": "Parameters", "parameter": [{"valueString": "no name"}]}, strict=True)
+    with pytest.raises(TypeError):
+        dict_to_params_json({"value": object()})
@@ -0,0 +1,56 @@
+import io
+import json
+import pytest
+from fhir_tx_client.cli import main
+from fhir_tx_client.pipeline import read_codes, validate_stream
+from tests.conftest import expansion
+from benchmarks.stub_server import StubTerminologyServer
+
+SCT = "http://snomed.info/sct"
+FOOD_URL = "http://example.org/ValueSet/food"
+
+
+@pytest.fixture
+def stub():
+    resource = {"id": "food", "url": FOOD_URL, **expansion("102263004", "226760005", system=SCT)}
+    with StubTerminologyServer({"food": resource}) as stub:
+        yield stub
+
+
+def test_read_codes_formats():
+    assert list(read_codes(io.StringIO("1\n\n2 |Two|\n"))) == ["1", "2 |Two|"]
+    assert list(read_codes(io.StringIO("id,code\na,1\nb,2\n"), "csv")) == ["1", "2"]
+    assert list(read_codes(io.StringIO('{"code": "1", "system": "x"}\n'), "ndjson")) == [{"code": "1", "system": "x"}]
+    assert list(read_codes(io.StringIO('{"sctid": "1"}\n{"other": "2"}\n'), "ndjson", "sctid")) == [
+        {"sctid": "1", "code": "1"}
+    ]
+
+
+def test_validate_stream_keeps_order_and_deduplicates(stub):
+    from fhir_tx_client import SyncFHIRTerminologyClient
+
+    vs = SyncFHIRTerminologyClient(stub.url).ValueSet(id="food")
+    tokens = ["102263004 |Eggs (edible)|", "1", "226760005", "102263004", "1"] * 3
+    reports = []
+    results = list(validate_stream(vs, tokens, chunk_size=2, workers=2, progress=lambda stats: reports.append(stats.processed)))
+    assert [code.code for code, _ in results] == [token.split("|")[0].strip() for token in tokens]
+    assert [result for _, result in results] == [True, False, True, True, False] * 3
+    assert reports == [4, 8, 12, 15]
+    # three unique codes in the first window, sent as two concurrent chunks
+    assert stub.count("POST", "/r4/") == 2
+
+
+def test_cli_validate(stub, tmp_path, capsys):
+    path = tmp_path / "codes.csv"
+    path.write_text("code\n102263004\n1\n")
+    main(["validate", "--server", stub.url, "--valueset", "food", "--format", "csv", "--quiet", str(path)])
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines == [{"system": SCT, "code": "102263004", "result": True}, {"system": SCT, "code": "1", "result": False}]
+
+
+def test_cli_validate_by_url(stub, tmp_path, capsys):
+    path = tmp_path / "codes.ndjson"
+    path.write_text('{"sctid": "102263004"}\n{"sctid": "1"}\n')
+    main(["validate", "--server", stub.url, "--url", FOOD_URL, "--format", "ndjson", "--column", "sctid", "--quiet", str(path)])
+    lines = [json.loads(line) for line in capsys.readouterr().out.splitlines()]
+    assert lines == [{"system": SCT, "code": "102263004", "result": True}, {"system": SCT, "code": "1", "result": False}]
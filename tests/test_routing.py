@@ -0,0 +1,145 @@
+import time
+import pytest
+import requests
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.routing import ReplicaRouter, is_idempotent
+from fhir_tx_client.scheduler import BULK, RequestScheduler, priority
+from tests.conftest import FHIR_VERSION_SYSTEM, expansion
+from benchmarks.stub_server import StubTerminologyServer
+
+VALIDATE_CODE = "/r4/ValueSet/FHIR-version/$validate-code"
+
+
+def stub_server(latency=0.0) -> StubTerminologyServer:
+    return StubTerminologyServer({"FHIR-version": {"id": "FHIR-version", **expansion("4.0.0", "4.0.1")}}, latency)
+
+
+@pytest.fixture
+def dead_url():
+    stub = stub_server().start()
+    stub.stop()
+    return stub.url
+
+
+def validate(client, times=1):
+    vs = client.ValueSet(id="FHIR-version")
+    return [vs.validate_code(code="4.0.1", system=FHIR_VERSION_SYSTEM)["result"] for _ in range(times)]
+
+
+def test_requests_go_to_the_fastest_replica():
+    with stub_server(latency=0.05) as slow, stub_server() as fast:
+        router = ReplicaRouter([slow.url, fast.url])
+        client = SyncFHIRTerminologyClient(slow.url, router=router)
+        assert validate(client, 10) == [True] * 10
+        assert slow.count("POST", VALIDATE_CODE) == 1
+        assert fast.count("POST", VALIDATE_CODE) == 9
+        stats = router.stats()
+        assert [replica["requests"] for replica in stats] == [1, 9]
+        assert stats[0]["latency"] > stats[1]["p95"]
+
+
+def test_idempotent_requests_are_retried_on_another_replica(dead_url):
+    with stub_server() as live:
+        router = ReplicaRouter([dead_url, live.url], backoff=0.01, max_failures=1)
+        client = SyncFHIRTerminologyClient(dead_url, router=router)
+        assert validate(client, 3) == [True] * 3
+        dead, healthy = router.stats()
+        assert (dead["failures"], dead["healthy"]) == (1, False)
+        assert healthy["requests"] == 3
+
+
+def test_other_requests_are_not_retried():
+    calls = []
+
+    def request(base):
+        calls.append(base)
+        raise requests.ConnectionError("connection refused")
+
+    router = ReplicaRouter(["http://a.test", "http://b.test"], backoff=0)
+    with pytest.raises(requests.ConnectionError):
+        router.send(request, idempotent=False)
+    assert len(calls) == 1
+    with pytest.raises(requests.ConnectionError):
+        router.send(request, idempotent=True)
+    assert len(calls) == 4
+
+
+def test_slow_requests_are_hedged():
+    with stub_server() as primary, stub_server(latency=0.05) as backup:
+        router = ReplicaRouter([primary.url, backup.url], hedge=True, min_samples=1)
+        client = SyncFHIRTerminologyClient(primary.url, router=router)
+        validate(client, 5)
+        primary.latency = 1.0
+        started_at = time.perf_counter()
+        assert validate(client) == [True]
+        assert time.perf_counter() - started_at < 0.5
+        assert router.hedged >= 1
+
+
+def test_hedges_take_their_own_scheduler_slot():
+    scheduler = RequestScheduler(max_in_flight=4)
+    with stub_server() as primary, stub_server(latency=0.05) as backup:
+        router = ReplicaRouter([primary.url, backup.url], hedge=True, min_samples=1)
+        client = SyncFHIRTerminologyClient(primary.url, router=router, scheduler=scheduler)
+        validate(client, 5)
+        hedged = router.hedged
+        primary.latency = 0.5
+        with priority(BULK):
+            assert validate(client) == [True]
+        assert router.hedged == hedged + 1
+        # both attempts of the hedged request wait for a slot, at the caller's priority
+        assert scheduler.stats()["wait"]["bulk"]["count"] == 2
+        wait = scheduler.stats()["wait"]
+        sent = primary.count("POST", VALIDATE_CODE) + backup.count("POST", VALIDATE_CODE)
+        assert wait["interactive"]["count"] + wait["bulk"]["count"] == sent
+
+
+class Response:
+    def __init__(self, status_code, delay=0.0):
+        time.sleep(delay)
+        self.status_code = status_code
+        self.closed = False
+
+    def close(self):
+        self.closed = True
+
+
+def test_responses_but_the_returned_one_are_closed():
+    router = ReplicaRouter(["http://a.test", "http://b.test"], hedge=True, min_samples=1)
+    router.record(router.replicas[0], 0.01, ok=True)
+    router.record(router.replicas[1], 0.02, ok=True)
+    responses = {}
+
+    def request(base):
+        responses[base] = Response(200, delay=0.3 if base == "http://a.test" else 0.0)
+        return responses[base]
+
+    assert router.send(request, idempotent=True) is responses["http://b.test"]
+    assert router.hedged == 1
+    deadline = time.monotonic() + 2
+    while "http://a.test" not in responses or not responses["http://a.test"].closed:
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+    assert not responses["http://b.test"].closed
+
+    # a response that is retried is closed before the next attempt
+    statuses = iter([503, 200])
+    attempts = []
+    router = ReplicaRouter(["http://a.test", "http://b.test"], backoff=0)
+    assert router.send(lambda base: attempts.append(Response(next(statuses))) or attempts[-1], idempotent=True)
+    assert [response.closed for response in attempts] == [True, False]
+
+
+def test_is_idempotent():
+    assert is_idempotent("GET", "ValueSet/x")
+    assert is_idempotent("POST", "ValueSet/x/$expand")
+    assert is_idempotent("post", "CodeSystem/$lookup?system=x")
+    assert not is_idempotent("POST", "ValueSet")
+    batch = {
+        "resourceType": "Bundle",
+        "type": "batch",
+        "entry": [{"request": {"method": "POST", "url": "ValueSet/x/$validate-code"}}],
+    }
+    assert is_idempotent("POST", "", batch)
+    batch["entry"].append({"request": {"method": "DELETE", "url": "ValueSet/x"}})
+    assert not is_idempotent("POST", "", batch)
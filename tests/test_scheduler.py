@@ -0,0 +1,115 @@
+import threading
+import time
+import pytest
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.data_types import Coding
+from fhir_tx_client.scheduler import BULK, INTERACTIVE, RequestScheduler, endpoint_of, priority
+from tests.conftest import FHIR_VERSION_SYSTEM, expansion
+from benchmarks.stub_server import StubTerminologyServer
+
+
+class RecordingScheduler(RequestScheduler):
+    def __init__(self, *args, **kwargs):
+        super().__init__(*args, **kwargs)
+        self.started = []
+
+    def acquire(self, endpoint, level=None):
+        waited = super().acquire(endpoint, level)
+        self.started.append((endpoint, level))
+        return waited
+
+
+def start(scheduler, level, endpoint="$expand"):
+    thread = threading.Thread(target=scheduler.acquire, args=(endpoint, level))
+    thread.start()
+    return thread
+
+
+def wait_until(condition, timeout=2.0):
+    deadline = time.monotonic() + timeout
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.001)
+
+
+def test_interactive_requests_go_first():
+    scheduler = RecordingScheduler(max_in_flight=1, reserved=0)
+    scheduler.acquire("$expand", INTERACTIVE)
+    bulk = start(scheduler, BULK)
+    wait_until(lambda: scheduler.stats()["queued"] == {"bulk": 1})
+    interactive = start(scheduler, INTERACTIVE)
+    wait_until(lambda: scheduler.stats()["queued"] == {"bulk": 1, "interactive": 1})
+    scheduler.release()
+    interactive.join(2)
+    assert scheduler.started[1] == ("$expand", INTERACTIVE)
+    scheduler.release()
+    bulk.join(2)
+    assert [level for _, level in scheduler.started] == [INTERACTIVE, INTERACTIVE, BULK]
+    stats = scheduler.stats()
+    assert stats["in_flight"] == 1 and stats["queued"] == {}
+    assert stats["wait"]["bulk"]["count"] == 1
+    assert stats["wait"]["bulk"]["max"] > stats["wait"]["interactive"]["max"]
+
+
+def test_slots_are_reserved_for_interactive_requests():
+    scheduler = RequestScheduler(max_in_flight=2, reserved=1)
+    scheduler.acquire("$validate-code", BULK)
+    bulk = start(scheduler, BULK)
+    wait_until(lambda: scheduler.stats()["queued"] == {"bulk": 1})
+    assert scheduler.acquire("$validate-code", INTERACTIVE) < 0.1
+    scheduler.release()
+    scheduler.release()
+    bulk.join(2)
+    assert scheduler.in_flight == 1
+
+
+def test_rate_limits_per_endpoint():
+    scheduler = RequestScheduler(rates={"$expand": (20, 1)})
+    started_at = time.monotonic()
+    for _ in range(4):
+        scheduler.acquire("$expand")
+        scheduler.acquire("$validate-code")
+    assert time.monotonic() - started_at >= 0.14
+    assert scheduler.throttled == {"$expand": 3}
+    with pytest.raises(ValueError):
+        RequestScheduler(default_rate=0).acquire("$lookup")
+
+
+def test_endpoint_of():
+    assert endpoint_of("ValueSet/x/$expand") == "$expand"
+    assert endpoint_of("CodeSystem/$lookup?system=x") == "$lookup"
+    assert endpoint_of("ValueSet/x") == "ValueSet"
+    assert endpoint_of("") == "batch"
+
+
+def test_bulk_apis_run_at_bulk_priority():
+    scheduler = RecordingScheduler(max_in_flight=4)
+    valueset = {"id": "FHIR-version", **expansion("4.0.0", "4.0.1")}
+    with StubTerminologyServer({"FHIR-version": valueset}) as stub:
+        client = SyncFHIRTerminologyClient(stub.url, scheduler=scheduler)
+        vs = client.ValueSet(id="FHIR-version")
+        vs.validate_code(code="4.0.1", system=FHIR_VERSION_SYSTEM)
+        vs.validate_many([Coding(system=FHIR_VERSION_SYSTEM, code="4.0.1")])
+        list(vs.iter_pages(page_size=1))
+        with priority(BULK):
+            vs.expand()
+    assert scheduler.started[:2] == [("$validate-code", INTERACTIVE), ("batch", BULK)]
+    assert set(scheduler.started[2:]) == {("$expand", BULK)}
+    assert scheduler.in_flight == 0
+
+
+def test_whole_expansions_default_to_bulk_priority():
+    scheduler = RecordingScheduler(max_in_flight=4)
+    valueset = {"id": "FHIR-version", **expansion("4.0.0", "4.0.1")}
+    with StubTerminologyServer({"FHIR-version": valueset}) as stub:
+        client = SyncFHIRTerminologyClient(stub.url, scheduler=scheduler, coalesce=False)
+        vs = client.ValueSet(id="FHIR-version")
+        vs.expand()
+        assert vs.materialize()
+        vs.update_materialized()
+        list(vs.expand_stream())
+        assert [level for _, level in scheduler.started] == [BULK] * 4
+        vs.expand(count=1)
+        with priority(INTERACTIVE):
+            vs.expand()
+        assert [level for _, level in scheduler.started[4:]] == [INTERACTIVE] * 2
@@ -0,0 +1,100 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+import pytest
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.singleflight import SingleFlight, AsyncSingleFlight
+from tests.conftest import FHIR_VERSION_SYSTEM, expansion, validate_code_result
+from benchmarks.stub_server import StubTerminologyServer
+
+EXPAND_PATH = "/r4/ValueSet/FHIR-version/$expand"
+VALIDATE_CODE = "ValueSet/FHIR-version/$validate-code"
+
+
+@pytest.fixture
+def stub():
+    resource = {"id": "FHIR-version", **expansion("4.0.0", "4.0.1")}
+    with StubTerminologyServer({"FHIR-version": resource}, latency=0.2) as stub:
+        yield stub
+
+
+def test_concurrent_identical_expands_share_one_request(stub):
+    client = SyncFHIRTerminologyClient(stub.url)
+    vs = client.ValueSet(id="FHIR-version")
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: vs.expand(), range(8)))
+    assert stub.count("POST", EXPAND_PATH) == 1
+    assert all(result is results[0] for result in results)
+    assert len(client.single_flight) == 0
+    # different parameters are not coalesced
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        list(executor.map(lambda count: vs.expand(count=count), (1, 2)))
+    assert stub.count("POST", EXPAND_PATH) == 3
+
+
+def test_coalescing_can_be_disabled(stub):
+    client = SyncFHIRTerminologyClient(stub.url, coalesce=False)
+    vs = client.ValueSet(id="FHIR-version")
+    with ThreadPoolExecutor(max_workers=4) as executor:
+        list(executor.map(lambda _: vs.expand(raw=True), range(4)))
+    assert stub.count("POST", EXPAND_PATH) == 4
+
+
+def test_errors_reach_every_waiter():
+    single_flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+    calls = []
+
+    def fail():
+        calls.append(1)
+        started.set()
+        release.wait()
+        raise ValueError("server unavailable")
+
+    def call():
+        with pytest.raises(ValueError):
+            single_flight.do("key", fail)
+
+    leader = threading.Thread(target=call)
+    leader.start()
+    started.wait()
+    followers = [threading.Thread(target=call) for _ in range(3)]
+    for follower in followers:
+        follower.start()
+    release.set()
+    for thread in (leader, *followers):
+        thread.join()
+    assert len(calls) == 1
+    assert len(single_flight) == 0
+
+
+@pytest.mark.asyncio
+async def test_concurrent_identical_async_validate_code(server, async_client):
+    server.route("POST", VALIDATE_CODE, lambda data, params: validate_code_result(True))
+    vs = async_client.ValueSet(id="FHIR-version")
+    results = await asyncio.gather(
+        *(vs.validate_code(code="4.0.1", system=FHIR_VERSION_SYSTEM) for _ in range(5)),
+        vs.validate_code(code="5.0.0", system=FHIR_VERSION_SYSTEM),
+    )
+    assert server.count(VALIDATE_CODE) == 2
+    assert all(result["result"] is True for result in results)
+    # every caller gets its own copy of the shared result
+    results[0]["result"] = False
+    assert results[1]["result"] is True
+
+
+@pytest.mark.asyncio
+async def test_cancelled_waiter_does_not_cancel_the_shared_call():
+    single_flight = AsyncSingleFlight()
+
+    async def slow():
+        await asyncio.sleep(0.05)
+        return "done"
+
+    first = asyncio.ensure_future(single_flight.do("key", slow))
+    second = asyncio.ensure_future(single_flight.do("key", slow))
+    await asyncio.sleep(0)
+    first.cancel()
+    assert await second == "done"
+    assert len(single_flight) == 0
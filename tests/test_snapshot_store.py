@@ -0,0 +1,101 @@
+import multiprocessing
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.snapshot import DEFAULT_MAX_AGE, SnapshotStore
+from tests.conftest import expansion
+
+EXPAND = "ValueSet/FHIR-version/$expand"
+
+
+def read_offline(path, queue):
+    """Expand from the snapshot store in a fresh process whose client has no network access"""
+    client = SyncFHIRTerminologyClient("http://tx.test/r4", snapshot_store=SnapshotStore(path))
+    client._do_request = None
+    queue.put([coding.code for coding in client.ValueSet(id="FHIR-version")])
+
+
+def test_expansion_is_read_from_snapshot(server, client, monkeypatch, tmp_path):
+    server.route("POST", EXPAND, lambda data, params: expansion("4.0.0", "4.0.1", identifier="urn:uuid:1"))
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    monkeypatch.setattr(client, "snapshot_store", store)
+    vs = client.ValueSet(id="FHIR-version")
+    assert len(vs.expand().expansion.contains) == 2
+    assert vs.expand(raw=True).identifier == "urn:uuid:1"
+    assert [coding.code for coding in vs] == ["4.0.0", "4.0.1"]
+    # one request for the full expansion, one for the first page
+    assert server.count(EXPAND) == 2
+
+    queue = multiprocessing.get_context("spawn").Queue()
+    worker = multiprocessing.get_context("spawn").Process(target=read_offline, args=(store.path, queue))
+    worker.start()
+    worker.join(timeout=60)
+    assert queue.get(timeout=5) == ["4.0.0", "4.0.1"]
+
+
+def test_snapshots_expire_by_default(server, client, monkeypatch, tmp_path):
+    server.route("POST", EXPAND, lambda data, params: expansion("4.0.0", identifier="urn:uuid:1"))
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    assert store.max_age == DEFAULT_MAX_AGE
+    monkeypatch.setattr(client, "snapshot_store", store)
+    client.ValueSet(id="FHIR-version").expand()
+    with store._connection() as connection:
+        connection.execute("UPDATE snapshot SET stored_at = stored_at - ?", (DEFAULT_MAX_AGE + 1,))
+    client.ValueSet(id="FHIR-version").expand()
+    assert server.count(EXPAND) == 2
+
+
+def test_stale_snapshots_are_ignored(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.db"), max_age=0)
+    store.put("key", "ValueSet/x", expansion("1", identifier="urn:uuid:1"))
+    assert store.get("key") is None
+    assert store.identifier("key") == "urn:uuid:1"
+    store.max_age = None
+    assert store.get("key")["expansion"]["contains"][0]["code"] == "1"
+    store.invalidate("ValueSet/x")
+    assert store.get("key") is None
+
+
+def test_refresh_bypasses_the_snapshot(server, client, monkeypatch, tmp_path):
+    identifier, codes = "urn:uuid:1", ["4.0.0"]
+    server.route("POST", EXPAND, lambda data, params: expansion(*codes, identifier=identifier))
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    monkeypatch.setattr(client, "snapshot_store", store)
+    vs = client.ValueSet(id="FHIR-version")
+    assert vs.materialize()
+    identifier, codes = "urn:uuid:2", ["4.0.1"]
+    delta = vs.update_materialized()
+    assert [concept.code for concept in delta.added] == ["4.0.1"]
+    assert server.count(EXPAND) == 2
+    # the next process starts from the refreshed expansion
+    assert client.ValueSet(id="FHIR-version").expand(raw=True).identifier == "urn:uuid:2"
+    assert server.count(EXPAND) == 2
+
+
+def test_snapshots_are_kept_per_server(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.db"))
+    first = SyncFHIRTerminologyClient("http://tx.test/r4", snapshot_store=store)
+    second = SyncFHIRTerminologyClient("http://tx.example/r4", snapshot_store=store)
+    first._do_request = lambda *args, **kwargs: expansion("4.0.0")
+    second._do_request = lambda *args, **kwargs: expansion("5.0.0")
+    assert [coding.code for coding in first.ValueSet(id="FHIR-version").expand(raw=True).codings()] == ["4.0.0"]
+    assert [coding.code for coding in second.ValueSet(id="FHIR-version").expand(raw=True).codings()] == ["5.0.0"]
+    store.invalidate("ValueSet/FHIR-version", "http://tx.example/r4")
+    second._do_request = None
+    assert first.ValueSet(id="FHIR-version").expand(raw=True).codings()
+
+
+def test_new_identifier_drops_the_other_snapshots_of_the_valueset(tmp_path):
+    store = SnapshotStore(str(tmp_path / "snapshots.db"), max_age=60)
+    store.put("all", "ValueSet/x", expansion("1", "2", identifier="urn:uuid:1"), "http://tx.test/r4")
+    store.put("page", "ValueSet/x", expansion("1", identifier="urn:uuid:1"), "http://tx.test/r4")
+    store.put("other", "ValueSet/x", expansion("1", identifier="urn:uuid:1"), "http://tx.example/r4")
+    with store._connection() as connection:
+        connection.execute("UPDATE snapshot SET stored_at = 0")
+    assert store.get("page") is None
+    # the same expansion renews the snapshots of the ValueSet on that server
+    store.put("all", "ValueSet/x", expansion("1", "2", identifier="urn:uuid:1"), "http://tx.test/r4")
+    assert store.get("page") is not None
+    assert store.get("other") is None
+    store.put("all", "ValueSet/x", expansion("1", "3", identifier="urn:uuid:2"), "http://tx.test/r4")
+    assert store.identifier("page") is None
+    assert store.identifier("all") == "urn:uuid:2"
+    assert store.identifier("other") == "urn:uuid:1"
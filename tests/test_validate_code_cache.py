@@ -0,0 +1,46 @@
+import time
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.cache import LRUCache, MISSING
+from fhir_tx_client.data_types import Coding
+from tests.conftest import FHIR_VERSION_SYSTEM, parameter_values, validate_code_result
+
+VALIDATE_CODE = "ValueSet/FHIR-version/$validate-code"
+
+
+def test_lru_cache_eviction_and_ttl():
+    cache = LRUCache(maxsize=2, ttl=0.05)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    assert cache.get("a") == 1
+    cache.put("c", 3)
+    assert cache.get("b") is MISSING
+    assert cache.stats.evictions == 1
+    time.sleep(0.06)
+    assert cache.get("a") is MISSING
+    assert cache.stats.expirations == 1
+    assert (cache.stats.hits, cache.stats.misses) == (1, 2)
+    cache.put("d", False, negative=True)
+    assert cache.get("d") is MISSING
+
+
+def test_validate_code_results_are_memoized(server, client, monkeypatch):
+    server.route(
+        "POST",
+        VALIDATE_CODE,
+        lambda data, params: validate_code_result("4.0.1" in str(parameter_values(data))),
+    )
+    cache = LRUCache(maxsize=10, cache_negative=True)
+    monkeypatch.setattr(client, "validate_code_cache", cache)
+    vs = client.ValueSet(id="FHIR-version")
+    for _ in range(3):
+        assert vs.validate_code(code="4.0.1", system=FHIR_VERSION_SYSTEM)["result"] is True
+        assert Coding(code="5.0.0", system=FHIR_VERSION_SYSTEM) not in vs
+    assert server.count(VALIDATE_CODE) == 2
+    assert cache.stats.hits == 4
+    # another ValueSet identity does not share the entries
+    client.ValueSet(id="FHIR-version", version="4.0.1").validate_code(code="4.0.1", system=FHIR_VERSION_SYSTEM)
+    assert server.count(VALIDATE_CODE) == 3
+
+
+def test_client_without_cache():
+    assert SyncFHIRTerminologyClient("http://tx.test/r4").validate_code_cache is None
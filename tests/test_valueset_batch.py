@@ -0,0 +1,68 @@
+from fhir_tx_client.cache import LRUCache
+from fhir_tx_client.data_types import Coding, CodeableConcept
+from fhirpy.base.exceptions import OperationOutcome
+from tests.conftest import FHIR_VERSION_SYSTEM, validate_code_result
+
+KNOWN = {"4.0.0", "4.0.1"}
+
+
+def batch_handler(data, params):
+    """Answer a batch of $validate-code requests, failing entries for unknown systems"""
+    entries = []
+    for entry in data["entry"]:
+        assert entry["request"] == {"method": "POST", "url": "ValueSet/FHIR-version/$validate-code"}
+        parameter = entry["resource"]["parameter"][0]
+        coding = parameter.get("valueCoding") or parameter["valueCodeableConcept"]["coding"][0]
+        if coding["system"] != FHIR_VERSION_SYSTEM:
+            entries.append({"response": {"status": "400 Bad Request"}})
+        else:
+            result = validate_code_result(coding["code"] in KNOWN)
+            entries.append({"response": {"status": "200 OK"}, "resource": result})
+    return {"resourceType": "Bundle", "type": "batch-response", "entry": entries}
+
+
+def test_validate_many_batches_and_deduplicates(server, client):
+    server.route("POST", "", batch_handler)
+    vs = client.ValueSet(id="FHIR-version")
+    codes = ["4.0.1", "5.0.0", "4.0.1", "4.0.0", "3.0.0"]
+    codings = [Coding(code=code, system=FHIR_VERSION_SYSTEM) for code in codes]
+    codings.append(Coding(code="4.0.1", system="http://other"))
+    results = vs.validate_many(codings, batch_size=2)
+    assert [entry[2]["resourceType"] for entry in server.requests] == ["Bundle"] * 3
+    assert sum(len(entry[2]["entry"]) for entry in server.requests) == 5
+    assert [result["result"] for result in results[:5]] == [True, False, True, True, False]
+    assert isinstance(results[5], OperationOutcome)
+    assert vs.contains_many(codings[4:]) == [False, None]
+
+
+def test_contains_many_uses_cache(server, client, monkeypatch):
+    server.route("POST", "", batch_handler)
+    monkeypatch.setattr(client, "validate_code_cache", LRUCache(cache_negative=True))
+    vs = client.ValueSet(id="FHIR-version")
+    coding = Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM)
+    assert vs.contains_many([coding, CodeableConcept(coding=[coding])]) == [True, True]
+    assert vs.contains_many([coding]) == [True]
+    assert len(server.requests) == 1
+
+
+def test_missing_batch_entries_fail_per_item(server, client):
+    server.route("POST", "", lambda data, params: {"resourceType": "Bundle", "type": "batch-response"})
+    vs = client.ValueSet(id="FHIR-version")
+    results = vs.validate_many([Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM)])
+    assert isinstance(results[0], OperationOutcome)
+    server.route("POST", "", lambda data, params: {"resourceType": "OperationOutcome", "issue": []})
+    assert vs.contains_many([Coding(code="4.0.0", system=FHIR_VERSION_SYSTEM)]) == [None]
+
+
+def test_url_only_valueset_is_named_in_each_entry(server, client):
+    def handler(data, params):
+        entry = data["entry"][0]
+        assert entry["request"]["url"] == "ValueSet/$validate-code"
+        parameters = {parameter["name"]: parameter for parameter in entry["resource"]["parameter"]}
+        assert parameters["url"]["valueString"] == "http://hl7.org/fhir/ValueSet/FHIR-version"
+        assert parameters["valueSetVersion"]["valueString"] == "4.0.1"
+        return {"resourceType": "Bundle", "entry": [{"response": {"status": "200"}, "resource": validate_code_result(True)}]}
+
+    server.route("POST", "", handler)
+    vs = client.ValueSet(url="http://hl7.org/fhir/ValueSet/FHIR-version", version="4.0.1")
+    assert vs.contains_many([Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM)]) == [True]
@@ -0,0 +1,94 @@
+import threading
+import time
+import pytest
+from fhirpy.base.exceptions import OperationOutcome
+from fhir_tx_client.cache import LRUCache
+from fhir_tx_client.data_types import Coding, CodeableConcept
+from fhir_tx_client.instrumentation import MetricsCollector
+from tests.conftest import expansion, parameter_values, validate_code_result
+
+VALIDATE_CODE = "ValueSet/conditions/$validate-code"
+SNOMED = "http://snomed.info/sct"
+ICD10 = "http://hl7.org/fhir/sid/icd-10"
+LOCAL = "http://example.org/conditions"
+
+FEVER = CodeableConcept(
+    coding=[
+        Coding(system=SNOMED, code="386661006"),
+        Coding(system=ICD10, code="R50.9"),
+        Coding(system=LOCAL, code="fever"),
+    ]
+)
+
+
+@pytest.fixture
+def members():
+    return {(SNOMED, "386661006"): True, (ICD10, "R50.9"): False}
+
+
+@pytest.fixture
+def validating(server, members):
+    def handler(data, params):
+        coding = parameter_values(data)["coding"]
+        if coding["system"] == LOCAL:
+            raise OperationOutcome(reason="unknown system")
+        return validate_code_result(members[coding["system"], coding["code"]])
+
+    server.route("POST", VALIDATE_CODE, handler)
+    return server
+
+
+def test_each_coding_is_validated(validating, client, monkeypatch):
+    client.validate_code_cache = LRUCache(cache_negative=True)
+    metrics = MetricsCollector()
+    monkeypatch.setattr(client, "instrumentation", metrics)
+    vs = client.ValueSet(id="conditions")
+    results = vs.validate_codings(FEVER)
+    assert [result["result"] for result in results[:2]] == [True, False]
+    assert isinstance(results[2], OperationOutcome)
+    assert validating.count(VALIDATE_CODE) == 3
+    # cached results are not requested again
+    results = vs.validate_codings(FEVER)
+    assert [result["result"] for result in results[:2]] == [True, False]
+    assert validating.count(VALIDATE_CODE) == 4
+    # one lookup per coding: the local system failed and is not cached
+    assert (metrics.cache_hits["validate_code"], metrics.cache_misses["validate_code"]) == (2, 4)
+
+
+def test_contains_any_stops_at_the_first_match(server, client, members):
+    released = threading.Event()
+
+    def handler(data, params):
+        coding = parameter_values(data)["coding"]
+        if coding["system"] != SNOMED:
+            released.wait(5)
+        return validate_code_result(members.get((coding["system"], coding["code"]), False))
+
+    server.route("POST", VALIDATE_CODE, handler)
+    vs = client.ValueSet(id="conditions")
+    started_at = time.perf_counter()
+    assert vs.contains_any(FEVER)
+    assert time.perf_counter() - started_at < 1
+    released.set()
+    assert not vs.contains_any(CodeableConcept(coding=[Coding(system=ICD10, code="R50.9")]))
+    assert not vs.contains_any(CodeableConcept())
+
+
+def test_failures_are_raised_only_without_a_match(validating, client):
+    vs = client.ValueSet(id="conditions")
+    assert vs.contains_any(FEVER)
+    with pytest.raises(OperationOutcome):
+        vs.contains_any(CodeableConcept(coding=FEVER.coding[1:]))
+    with pytest.raises(NotImplementedError):
+        vs.contains_any("R50.9")
+
+
+def test_materialized_valueset_answers_locally(validating, client):
+    validating.route(
+        "POST", "ValueSet/conditions/$expand", lambda data, params: expansion("386661006", "22298006", system=SNOMED)
+    )
+    vs = client.ValueSet(id="conditions")
+    assert vs.materialize()
+    assert vs.contains_any(FEVER)
+    assert [result["result"] for result in vs.validate_codings(FEVER)] == [True, False, False]
+    assert validating.count(VALIDATE_CODE) == 0
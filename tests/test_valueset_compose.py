@@ -0,0 +1,101 @@
+import pytest
+from fhir_tx_client.ValueSet.compose import ComposeEvaluator, NotExpandableLocally
+from tests.conftest import expansion
+
+SCT = "http://snomed.info/sct"
+BASE = "http://example.org/fhir/ValueSet/"
+
+
+def valueset(name, *includes, exclude=(), **fields):
+    return {
+        "resourceType": "ValueSet",
+        "id": name,
+        "url": BASE + name,
+        "status": "active",
+        "compose": {"include": list(includes), "exclude": list(exclude)},
+        **fields,
+    }
+
+
+def concepts(*codes, system=SCT):
+    return {"system": system, "concept": [{"code": code} for code in codes]}
+
+
+def references(*names):
+    return {"valueSet": [BASE + name for name in names]}
+
+
+@pytest.fixture
+def registry(server):
+    """ValueSets served by the fake server, found by searching their url"""
+    valuesets = {}
+
+    def search(data, params):
+        found = [vs for vs in valuesets.values() if vs["url"] in params["url"]]
+        return {"resourceType": "Bundle", "type": "searchset", "entry": [{"resource": vs} for vs in found[:1]]}
+
+    server.route("GET", "ValueSet", search)
+    return valuesets
+
+
+def codes(result):
+    return sorted(concept.code for concept in result)
+
+
+def test_expand_locally_without_server_expansion(server, client, registry):
+    registry["fruit"] = valueset("fruit", concepts("apple", "pear", "kiwi"))
+    registry["berries"] = valueset("berries", concepts("strawberry", "raspberry"))
+    vs = client.ValueSet(
+        **valueset(
+            "food",
+            concepts("bread"),
+            references("fruit", "berries"),
+            references("fruit"),
+            exclude=[concepts("pear"), concepts("bread", system="http://other.org")],
+        )
+    )
+    result = vs.expand_locally(raw=True)
+    assert codes(result) == ["apple", "bread", "kiwi"]
+    assert result.total == 3
+    assert not any(path.endswith("$expand") for _, path, _ in server.requests)
+    # concepts of an include that also lists ValueSets are intersected with them
+    vs = client.ValueSet(**valueset("some-fruit", {**concepts("apple", "bread"), **references("fruit")}))
+    assert [c.code for c in vs.expand_locally().expansion.contains] == ["apple"]
+
+
+def test_referenced_valuesets_are_memoized(server, client, registry):
+    registry["shared"] = valueset("shared", concepts("a", "b"))
+    registry["left"] = valueset("left", references("shared"))
+    registry["right"] = valueset("right", references("shared"), exclude=[concepts("b")])
+    evaluator = ComposeEvaluator(client.ValueSet()._resolve_valueset)
+    vs = client.ValueSet(**valueset("top", references("left"), references("right")))
+    assert codes(vs.expand_locally(raw=True, evaluator=evaluator)) == ["a", "b"]
+    assert codes(vs.expand_locally(raw=True, evaluator=evaluator)) == ["a", "b"]
+    assert server.count("ValueSet") == 3
+
+
+def test_cycles_are_detected(client, registry):
+    registry["a"] = valueset("a", references("b"))
+    registry["b"] = valueset("b", concepts("x"), references("a"))
+    with pytest.raises(ValueError, match="Cyclic"):
+        client.ValueSet(**registry["a"]).expand_locally()
+
+
+def test_filters_and_entire_code_systems_fall_back_to_the_server(server, client, registry):
+    registry["intensional"] = valueset(
+        "intensional", {"system": SCT, "filter": [{"property": "concept", "op": "is-a", "value": "102263004"}]}
+    )
+    server.route("POST", "ValueSet/intensional/$expand", lambda data, params: expansion("egg", "yolk", system=SCT))
+    vs = client.ValueSet(**valueset("mixed", concepts("milk"), references("intensional")))
+    assert codes(vs.expand_locally(raw=True)) == ["egg", "milk", "yolk"]
+    assert server.count("ValueSet/intensional/$expand") == 1
+
+    with pytest.raises(NotExpandableLocally):
+        ComposeEvaluator(lambda canonical: None).expand(valueset("all", {"system": SCT}))
+
+
+def test_definition_is_loaded_when_missing(server, client, registry):
+    registry["fruit"] = valueset("fruit", concepts("apple"))
+    server.route("GET", "ValueSet/fruit", lambda data, params: registry["fruit"])
+    assert codes(client.ValueSet(id="fruit").expand_locally(raw=True)) == ["apple"]
+    assert codes(client.ValueSet(url=BASE + "fruit").expand_locally(raw=True)) == ["apple"]
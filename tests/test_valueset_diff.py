@@ -0,0 +1,45 @@
+from fhir_tx_client.data_types import Coding, CodeableConcept
+from fhir_tx_client.ValueSet.diff import diff_expansions
+from fhir_tx_client.ValueSet.index import MembershipIndex
+from fhir_tx_client.ValueSet.lightweight import LightweightExpansion
+from benchmarks.synthetic import SYSTEM, synthetic_valueset
+
+
+def release(size, identifier):
+    valueset = synthetic_valueset(size, depth=3)
+    valueset["expansion"]["identifier"] = identifier
+    return valueset
+
+
+def test_diff_expansions():
+    old = release(100, "urn:uuid:1")
+    new = release(110, "urn:uuid:2")
+    contains = new["expansion"]["contains"]
+    contains[0]["display"] = "Renamed"
+    contains[1]["inactive"] = True
+    contains[2]["version"] = "2"  # another version is another concept
+    delta = diff_expansions(LightweightExpansion(old), LightweightExpansion(new))
+    assert {concept.code for concept in delta.added} == {str(code) for code in range(100, 110)} | {contains[2]["code"]}
+    assert [concept.code for concept in delta.removed] == [contains[2]["code"]]
+    assert [(old.display, new.display) for old, new in delta.changed][0] == ("Concept 0", "Renamed")
+    assert len(delta) == 14 and delta.identifier == "urn:uuid:2"
+    events = list(delta.events())
+    assert [event["type"] for event in events].count("changed") == 2
+    assert events[-1]["after"]["inactive"] is True
+    assert not diff_expansions(LightweightExpansion(new), LightweightExpansion(new))
+
+
+def test_membership_index_applies_a_delta_like_a_rebuild():
+    old, new = release(50, "urn:uuid:1"), release(60, "urn:uuid:2")
+    del new["expansion"]["contains"][0]
+    new["expansion"]["contains"][1]["abstract"] = True
+    index = MembershipIndex(LightweightExpansion(old))
+    index.apply(index.diff(LightweightExpansion(new)))
+    rebuilt = MembershipIndex(LightweightExpansion(new))
+    assert len(index) == len(rebuilt)
+    for code in range(70):
+        coding = Coding(system=SYSTEM, code=str(code))
+        assert (coding in index) == (coding in rebuilt)
+        assert (CodeableConcept(coding=[coding]) in index) == (CodeableConcept(coding=[coding]) in rebuilt)
+    assert index.identifier == "urn:uuid:2"
+    assert not index.diff(LightweightExpansion(new))
@@ -0,0 +1,40 @@
+from fhir_tx_client.ValueSet import ValueSet
+from fhir_tx_client.ValueSet.lightweight import LightweightExpansion
+from tests.conftest import expansion
+
+SCT = "http://snomed.info/sct"
+
+
+def nested_expansion():
+    resource = expansion(total=3, identifier="urn:uuid:1")
+    resource["expansion"]["contains"] = [
+        {
+            "system": SCT,
+            "code": "404684003",
+            "display": "Clinical finding",
+            "abstract": True,
+            "contains": [{"system": SCT, "code": "386661006", "display": "Fever", "inactive": False}],
+        },
+        {"system": SCT, "code": "71388002", "display": "Procedure"},
+    ]
+    return resource
+
+
+def test_raw_expand_returns_flattened_concepts(server, client):
+    server.route("POST", "ValueSet/findings/$expand", lambda data, params: nested_expansion())
+    result = client.ValueSet(id="findings").expand(raw=True)
+    assert isinstance(result, LightweightExpansion)
+    assert (result.identifier, result.total, len(result), result.top_level_count) == ("urn:uuid:1", 3, 3, 2)
+    assert [(c.code, c.parent, c.abstract) for c in result] == [
+        ("404684003", -1, True),
+        ("386661006", 0, False),
+        ("71388002", -1, False),
+    ]
+    assert result.concepts[1].to_coding().display == "Fever"
+
+
+def test_typed_valueset_is_built_on_demand():
+    result = LightweightExpansion(nested_expansion())
+    assert result._valueset is None
+    assert isinstance(result.valueset, ValueSet)
+    assert result.valueset.expansion.contains[0].contains[0].code == "386661006"
@@ -0,0 +1,67 @@
+from fhirpy.base.exceptions import OperationOutcome
+from fhir_tx_client.data_types import Coding, CodeableConcept
+from tests.conftest import FHIR_VERSION_SYSTEM, expansion, validate_code_result
+
+EXPAND = "ValueSet/FHIR-version/$expand"
+VALIDATE_CODE = "ValueSet/FHIR-version/$validate-code"
+
+
+def test_materialized_membership_is_answered_locally(server, client):
+    server.route("POST", EXPAND, lambda data, params: expansion("4.0.0", "4.0.1", identifier="urn:uuid:1"))
+    vs = client.ValueSet(id="FHIR-version")
+    assert vs.materialize()
+    assert "membership_index" not in vs.serialize()
+    assert Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM) in vs
+    # the expansion lists no versions, a versioned Coding matches like on the server
+    assert Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM, version="4.0.1") in vs
+    assert Coding(code="5.0.0", system=FHIR_VERSION_SYSTEM, version="5.0.0") not in vs
+    assert Coding(code="5.0.0", system=FHIR_VERSION_SYSTEM) not in vs
+    assert CodeableConcept(coding=[Coding(code="x", system="y"), Coding(code="4.0.0", system=FHIR_VERSION_SYSTEM)]) in vs
+    assert server.count(EXPAND) == 1
+    assert server.count(VALIDATE_CODE) == 0
+
+
+def test_versioned_entries_match_their_version_only(server, client):
+    def versioned(data, params):
+        result = expansion("4.0.1")
+        result["expansion"]["contains"][0]["version"] = "4.0.1"
+        return result
+
+    server.route("POST", EXPAND, versioned)
+    vs = client.ValueSet(id="FHIR-version")
+    assert vs.materialize()
+    assert Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM, version="4.0.1") in vs
+    assert Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM, version="3.0.2") not in vs
+    assert Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM) in vs
+
+
+def test_stale_index_is_patched_only_when_expansion_changed(server, client):
+    identifier, codes = "urn:uuid:1", ["4.0.0"]
+    server.route("POST", EXPAND, lambda data, params: expansion(*codes, identifier=identifier))
+    vs = client.ValueSet(id="FHIR-version")
+    deltas = []
+    vs.materialize(max_age=0, on_change=deltas.append)
+    index = vs.membership_index
+    assert Coding(code="4.0.0", system=FHIR_VERSION_SYSTEM) in vs
+    assert not vs.update_materialized()
+    identifier, codes = "urn:uuid:2", ["4.0.1"]
+    assert vs.refresh_materialized()
+    assert vs.membership_index is index and index.identifier == "urn:uuid:2"
+    assert Coding(code="4.0.1", system=FHIR_VERSION_SYSTEM) in index
+    assert Coding(code="4.0.0", system=FHIR_VERSION_SYSTEM) not in index
+    assert [(len(delta.added), len(delta.removed)) for delta in deltas] == [(1, 1)]
+
+
+def test_not_enumerable_valueset_falls_back_to_server(server, client):
+    server.route("POST", EXPAND, lambda data, params: expansion("4.0.0", total=1000))
+    server.route("POST", VALIDATE_CODE, lambda data, params: validate_code_result(True))
+    vs = client.ValueSet(id="FHIR-version")
+    assert not vs.materialize()
+    assert Coding(code="5.0.0", system=FHIR_VERSION_SYSTEM) in vs
+    assert server.count(VALIDATE_CODE) == 1
+
+    def too_costly(data, params):
+        raise OperationOutcome(reason="too costly")
+
+    server.route("POST", EXPAND, too_costly)
+    assert not vs.materialize()
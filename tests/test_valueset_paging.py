@@ -0,0 +1,44 @@
+import pytest
+from tests.conftest import expansion, paged_expansion
+
+EXPAND = "ValueSet/big/$expand"
+CODES = [str(i) for i in range(25)]
+
+
+@pytest.mark.parametrize("prefetch", [False, True])
+def test_iter_pages_uses_offset_and_count(server, client, prefetch):
+    """Test that pages are fetched lazily and iteration stops at expansion.total"""
+    server.route("POST", EXPAND, paged_expansion(CODES))
+    vs = client.ValueSet(id="big")
+    pages = vs.iter_pages(page_size=10, prefetch=prefetch)
+    assert [coding.code for coding in next(pages)] == CODES[:10]
+    if not prefetch:
+        assert server.count(EXPAND) == 1
+    assert [len(page) for page in pages] == [10, 5]
+    assert server.count(EXPAND) == 3
+
+
+def test_iter_pages_without_total_stops_on_short_page(server, client):
+    server.route("POST", EXPAND, paged_expansion(CODES, total=False))
+    vs = client.ValueSet(id="big")
+    vs.page_size = 5
+    assert [coding.code for coding in vs] == CODES
+    # the last full page can only be recognised as such by an empty next page
+    assert server.count(EXPAND) == 6
+
+
+def test_iter_pages_server_ignoring_count(server, client):
+    """Test that a server returning the whole expansion at once is fetched only once"""
+    server.route("POST", EXPAND, lambda data, params: expansion(*CODES))
+    vs = client.ValueSet(id="big")
+    assert len(list(vs.iter_pages(page_size=10))) == 1
+
+
+@pytest.mark.asyncio
+@pytest.mark.parametrize("prefetch", [False, True])
+async def test_async_iter_pages(server, async_client, prefetch):
+    server.route("POST", EXPAND, paged_expansion(CODES))
+    vs = async_client.ValueSet(id="big")
+    pages = [page async for page in vs.iter_pages(page_size=10, prefetch=prefetch)]
+    assert [coding.code for page in pages for coding in page] == CODES
+    assert server.count(EXPAND) == 3
@@ -0,0 +1,58 @@
+import pytest
+from fhirpy.base.exceptions import OperationOutcome
+from fhir_tx_client.data_types import Coding, CodeableConcept
+from tests.conftest import expansion, validate_code_result
+
+SYSTEM = "http://example.org/fruit"
+
+
+def fruit(code):
+    return Coding(system=SYSTEM, code=code)
+
+
+def ids(valuesets):
+    return [valueset["id"] for valueset in valuesets]
+
+
+@pytest.fixture
+def registry(server, client):
+    server.route("POST", "ValueSet/apples/$expand", lambda data, params: expansion("gala", "fuji", system=SYSTEM))
+    server.route("POST", "ValueSet/red/$expand", lambda data, params: expansion("gala", "cherry", system=SYSTEM))
+    server.route("POST", "ValueSet/all/$expand", lambda data, params: expansion("gala", system=SYSTEM, total=1000))
+    server.route(
+        "POST", "ValueSet/all/$validate-code", lambda data, params: validate_code_result(True)
+    )
+    return client.valueset_registry(["apples", "red", "all"])
+
+
+def test_memberships_are_answered_from_one_index(server, registry):
+    assert len(registry) == 3
+    assert ids(registry.memberships(fruit("gala"))) == ["apples", "red", "all"]
+    assert server.count("ValueSet/all/$validate-code") == 0
+    assert ids(registry.memberships(fruit("fuji"))) == ["apples", "all"]
+    assert ids(registry.memberships(CodeableConcept(coding=[fruit("fuji"), fruit("cherry")]))) == ["apples", "red", "all"]
+    assert ids(registry.memberships(Coding(system="http://other", code="gala"))) == ["all"]
+    # only the ValueSet that cannot be enumerated is checked with the server
+    assert server.count("ValueSet/all/$validate-code") == 3
+    with pytest.raises(NotImplementedError):
+        registry.memberships("gala")
+
+
+def test_valuesets_are_added_and_removed_individually(server, client, registry):
+    apples = client.ValueSet(id="apples")
+    assert apples in registry
+    assert registry.remove(apples)
+    assert not registry.remove(apples)
+    assert ids(registry.memberships(fruit("fuji"))) == ["all"]
+    assert ids(registry.memberships(fruit("cherry"))) == ["red", "all"]
+
+    def too_costly(data, params):
+        raise OperationOutcome(reason="too costly")
+
+    server.route("POST", "ValueSet/pears/$expand", too_costly)
+    server.route("POST", "ValueSet/pears/$validate-code", lambda data, params: validate_code_result(False))
+    assert not registry.add(client.ValueSet(id="pears"))
+    assert registry.add(apples)
+    assert ids(registry) == ["pears", "red", "all", "apples"]
+    assert ids(registry.memberships(fruit("fuji"))) == ["all", "apples"]
+    assert server.count("ValueSet/apples/$expand") == 2
@@ -0,0 +1,128 @@
+import time
+import pytest
+from fhir_tx_client.ValueSet.search import SearchIndex
+from benchmarks.synthetic import synthetic_valueset
+from tests.conftest import parameter_values
+
+SNOMED = "http://snomed.info/sct"
+EXPAND = "ValueSet/findings/$expand"
+
+
+def concept(code, display, *designations, **fields):
+    entry = {"system": SNOMED, "code": code, "display": display, **fields}
+    if designations:
+        entry["designation"] = [{"language": "fr", "value": value} for value in designations]
+    return entry
+
+
+def findings(*contains, identifier="urn:uuid:1"):
+    return {
+        "resourceType": "ValueSet",
+        "status": "active",
+        "expansion": {"identifier": identifier, "timestamp": "2023-01-01T00:00:00Z", "contains": list(contains)},
+    }
+
+
+FINDINGS = findings(
+    concept("404684003", "Clinical finding", abstract=True, contains=[
+        concept("386661006", "Fever", "Fièvre"),
+        concept("22298006", "Myocardial infarction", "Infarctus du myocarde"),
+        concept("57054005", "Acute myocardial infarction"),
+        concept("25064002", "Headache", "Céphalée"),
+        concept("271807003", "Eruption of skin", "Éruption cutanée"),
+        concept("43724002", "Chill", "Frissons", "Fièvre frissonnante"),
+    ]),
+)
+
+
+def codes(concepts):
+    return [concept.code for concept in concepts]
+
+
+def test_ranking():
+    index = SearchIndex(FINDINGS)
+    assert len(index) == 6
+    assert codes(index.search("fever")) == ["386661006"]
+    assert codes(index.search("FIEV")) == ["43724002", "386661006"]
+    assert codes(index.search("myo inf")) == ["22298006", "57054005"]
+    assert codes(index.search("INFARCTION")) == ["22298006", "57054005"]
+    assert codes(index.search("cephalee")) == ["25064002"]
+    assert codes(index.search("skin erupt")) == ["271807003"]
+    assert codes(index.search("57054005")) == ["57054005"]
+    assert index.search("finding") == []
+    assert index.search("fever rash") == []
+    assert index.search("") == []
+
+
+def test_paging():
+    index = SearchIndex(synthetic_valueset(1000))
+    first, second = index.search("concept", limit=10), index.search("concept", limit=10, offset=10)
+    assert len(first) == len(second) == 10
+    assert not set(codes(first)) & set(codes(second))
+    assert codes(first + second) == codes(index.search("concept", limit=20))
+
+
+def test_incremental_update():
+    index = SearchIndex(FINDINGS)
+    words = len(index._words)
+    changed = findings(
+        concept("386661006", "Fever", "Fièvre"),
+        concept("22298006", "Heart attack"),
+        concept("230690007", "Stroke"),
+        identifier="urn:uuid:2",
+    )
+    assert index.update(changed) == (1, 4, 1)
+    assert index.identifier == "urn:uuid:2"
+    assert codes(index.search("heart")) == ["22298006"]
+    assert index.search("myocardial") == []
+    assert index.search("headache") == []
+    assert codes(index.search("str")) == ["230690007"]
+    assert index.update(changed) == (0, 0, 0)
+    assert index.update(FINDINGS) == (4, 1, 1)
+    assert len(index._words) == words
+    assert len(index._concepts) == 6  # slots of removed concepts are reused
+
+
+def test_materialized_search_is_answered_locally(server, client):
+    identifier = "urn:uuid:1"
+    server.route("POST", EXPAND, lambda data, params: {**FINDINGS, "expansion": {**FINDINGS["expansion"], "identifier": identifier}})
+    vs = client.ValueSet(id="findings")
+    assert vs.materialize(max_age=0, search=True)
+    assert "search_index" not in vs.serialize()
+    index = vs.search_index
+    assert codes(vs.search("head")) == ["25064002"]
+    assert vs.search_index is index
+    assert server.count(EXPAND) == 2
+    identifier = "urn:uuid:2"
+    time.sleep(0.001)
+    assert codes(vs.search("chi")) == ["43724002"]
+    assert vs.search_index is index and index.identifier == "urn:uuid:2"
+
+
+def test_search_falls_back_to_filtered_expansion(server, client):
+    def handler(data, params):
+        values = parameter_values(data)
+        assert (values["filter"], values["count"], values["offset"]) == ("fev", 5, 10)
+        return findings(concept("386661006", "Fever"))
+
+    server.route("POST", EXPAND, handler)
+    vs = client.ValueSet(id="findings")
+    assert codes(vs.search("fev", limit=5, offset=10)) == ["386661006"]
+    with pytest.raises(ValueError):
+        vs.materialize(stream=True, search=True)
+
+
+def test_search_arguments_override_the_materialize_parameters(server, client):
+    requests = []
+
+    def handler(data, params):
+        requests.append(parameter_values(data))
+        response = findings(concept("386661006", "Fever"))
+        response["expansion"]["total"] = 1000
+        return response
+
+    server.route("POST", EXPAND, handler)
+    vs = client.ValueSet(id="findings")
+    assert not vs.materialize(search=True, count=1000, displayLanguage="fr")
+    assert codes(vs.search("fev", limit=5)) == ["386661006"]
+    assert requests[-1]["count"] == 5 and requests[-1]["displayLanguage"] == "fr"
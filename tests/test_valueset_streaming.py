@@ -0,0 +1,96 @@
+import json
+import pytest
+from fhirpy.base.exceptions import ResourceNotFound
+from fhir_tx_client import SyncFHIRTerminologyClient
+from fhir_tx_client.data_types import Coding
+from fhir_tx_client.ValueSet.lightweight import LightweightExpansion
+from fhir_tx_client.ValueSet.streaming import StreamingExpansion
+from benchmarks.synthetic import SYSTEM, synthetic_valueset
+from benchmarks.stub_server import StubTerminologyServer
+
+
+def chunked(data: bytes, size: int):
+    for start in range(0, len(data), size):
+        yield data[start : start + size]
+
+
+def nested_valueset():
+    valueset = synthetic_valueset(50, depth=4)
+    valueset["expansion"]["contains"][0]["display"] = "Œuf (comestible) – 卵"
+    # members after `contains` are only known at the end of the stream
+    valueset["expansion"]["parameter"] = [{"name": "count", "valueInteger": 1234567}]
+    return valueset
+
+
+@pytest.mark.parametrize("chunk_size", [1, 7, 64, 1 << 20])
+def test_stream_decodes_like_the_whole_response(chunk_size):
+    valueset = nested_valueset()
+    expected = LightweightExpansion(valueset)
+    expansion = StreamingExpansion(chunked(json.dumps(valueset, ensure_ascii=False, indent=1).encode(), chunk_size))
+    concepts = list(expansion)
+    assert [(c.system, c.code, c.display, c.parent) for c in concepts] == [
+        (c.system, c.code, c.display, c.parent) for c in expected
+    ]
+    assert len(expansion) == expansion.total == 50
+    assert expansion.identifier == expected.identifier
+    assert expansion.resource["expansion"]["parameter"][0]["valueInteger"] == 1234567
+    assert expansion.resource["url"] == valueset["url"]
+
+
+def test_concepts_are_yielded_before_the_stream_ends():
+    data = json.dumps(synthetic_valueset(1000)).encode()
+    consumed = []
+
+    def chunks():
+        for chunk in chunked(data, 256):
+            consumed.append(len(chunk))
+            yield chunk
+
+    first = next(iter(StreamingExpansion(chunks())))
+    assert first.code == "0"
+    assert sum(consumed) < len(data) / 10
+
+
+def test_closing_releases_an_unread_stream():
+    class Chunks:
+        closed = False
+
+        def __iter__(self):
+            return chunked(json.dumps(synthetic_valueset(10)).encode(), 16)
+
+        def close(self):
+            self.closed = True
+
+    chunks = Chunks()
+    with StreamingExpansion(chunks) as expansion:
+        pass
+    assert chunks.closed
+    with StreamingExpansion(Chunks()) as expansion:
+        assert next(iter(expansion)).code == "0"
+    assert expansion._chunks.closed
+
+
+def test_truncated_streams_fail():
+    data = json.dumps(synthetic_valueset(10)).encode()
+    with pytest.raises(ValueError):
+        list(StreamingExpansion(chunked(data[:-40], 16)))
+
+
+def test_expand_stream_and_streamed_materialize():
+    valueset = synthetic_valueset(5000, depth=3)
+    with StubTerminologyServer({valueset["id"]: valueset}) as stub:
+        client = SyncFHIRTerminologyClient(stub.url)
+        vs = client.ValueSet(id=valueset["id"])
+        assert sum(1 for _ in vs.expand_stream()) == 5000
+        with vs.expand_stream() as expansion:
+            next(iter(expansion))
+        assert expansion._chunks.response.raw.closed
+        assert vs.materialize(stream=True)
+        assert Coding(system=SYSTEM, code="4999") in vs
+        assert Coding(system=SYSTEM, code="5000") not in vs
+        assert stub.count("POST", "/r4/ValueSet/{0}/$expand".format(valueset["id"])) == 3
+        with pytest.raises(ResourceNotFound):
+            client.ValueSet(id="unknown").expand_stream()
+        # a client configured not to stream still streams this one
+        client = SyncFHIRTerminologyClient(stub.url, requests_config={"stream": False, "timeout": 10})
+        assert sum(1 for _ in client.ValueSet(id=valueset["id"]).expand_stream()) == 5000